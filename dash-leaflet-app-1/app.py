@@ -1,12 +1,23 @@
-from dash import Dash, dcc, html, Input, Output, State
+from dash import Dash, dcc, html, Input, Output, State, no_update
 import dash_leaflet as dl
-import psycopg2
+import db
+import export
+import ingest
+import instrumentation
 from datetime import datetime
 import pandas as pd
+import numpy as np
 import math
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import urlencode
+import kinematics
+import metadata
+import simplify
 
-# Database connection string
-conn_string = "host='localhost' dbname='vesselDB' user='postgres' password='root'"
+# Track simplification before drawing polylines (see simplify.DEFAULT_CONFIG)
+SIMPLIFY_CONFIG = dict(simplify.DEFAULT_CONFIG)
 
 # Predefined list of 100 fixed hex colors
 fixed_colors = [
@@ -18,31 +29,153 @@ fixed_colors = [
     "#99FF33", "#3399FF", "#FFCC33", "#CC33FF", "#33FFCC", "#FF33CC", "#CCFF33", "#33CCFF"
 ]
 
-# Function to get min and max epoch times from the database
+# Seconds between refreshes of the slider bounds, so the slider grows as new data arrives
+EPOCH_BOUNDS_REFRESH_INTERVAL = 30
+
+# Last bounds read from the database, shared by all tabs: (min epoch, max epoch, monotonic time read)
+epoch_bounds_cache = None
+epoch_bounds_refreshing = False  # True while one thread reads new bounds for everybody
+epoch_bounds_lock = threading.Lock()
+
+# Function to get min and max epoch times from the database.
+# MIN/MAX on the sourcedatetime index (see setup_db.py) is two index-only probes, and the
+# result is cached for EPOCH_BOUNDS_REFRESH_INTERVAL. The lock only guards the cache: one
+# thread queries while the others keep the previous bounds, so a slow or unreachable
+# database never queues every session behind it. Returns None if the database is unreachable.
 def get_min_max_epoch():
-    conn = psycopg2.connect(conn_string)
-    cursor = conn.cursor()
+    global epoch_bounds_cache, epoch_bounds_refreshing
+    with epoch_bounds_lock:
+        cached = epoch_bounds_cache
+        if cached is not None and (epoch_bounds_refreshing or time.monotonic() - cached[2] < EPOCH_BOUNDS_REFRESH_INTERVAL):
+            return cached[:2]
+        epoch_bounds_refreshing = True
+
     query = "SELECT MIN(sourcedatetime), MAX(sourcedatetime) FROM vessel_tracks WHERE sourcedatetime >= 1000000000"
-    cursor.execute(query)
-    min_max = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    return min_max
-
-# Function to get vessel data based on epoch range and vessel name
-def get_vessel_data(start_epoch, end_epoch, vessel_name):
-    conn = psycopg2.connect(conn_string)
-    cursor = conn.cursor()
-    query = """
-    SELECT sourcedatetime, latitude, longitude FROM vessel_tracks
-    WHERE sourcedatetime BETWEEN %s AND %s AND vesselname = %s
-    ORDER BY sourcedatetime
-    """
-    cursor.execute(query, (start_epoch, end_epoch, vessel_name))
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return data
+    try:
+        row = db.fetch_one(query, name='app_min_max_epoch')
+    except Exception as e:
+        print(f"Database error: {e}")
+        return cached[:2] if cached else None
+    finally:
+        with epoch_bounds_lock:
+            epoch_bounds_refreshing = False
+    if not row or row[0] is None:
+        return None
+    with epoch_bounds_lock:
+        epoch_bounds_cache = (row[0], row[1], time.monotonic())
+    return row[0], row[1]
+
+# Function to format the slider marks for the given bounds
+def epoch_marks(min_epoch, max_epoch):
+    return {
+        min_epoch: pd.to_datetime(min_epoch, unit='s').strftime('%Y-%m-%d %H:%M:%S'),
+        max_epoch: pd.to_datetime(max_epoch, unit='s').strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+# Server-side downsampling of long time ranges for the map
+DOWNSAMPLE_CONFIG = {
+    'enabled': True,
+    'point_budget': 20000,  # Rough upper bound on points fetched for all selected vessels together
+    'turn_degrees': 15,  # Also keep the sharpest turn of a time bucket when it exceeds this
+    'min_bucket_seconds': 60,  # Finer buckets than this save little over the raw query
+}
+
+# Downsampled variant of the vessel query. Keeps, per vessel, the first point of every
+# bucket_seconds bucket, the sharpest course change of the bucket if it is above the
+# threshold, and the vessel's last point, so turns and the final position stay exact.
+# Each kept point comes with the raw fix before it, for the heading of the last position.
+# The bucket is floored explicitly so numeric or floating-point epochs bucket too.
+DOWNSAMPLED_VESSELS_QUERY = """
+WITH points AS (
+    SELECT vesselname, sourcedatetime, latitude, longitude{course},
+           floor(sourcedatetime / %s)::bigint AS bucket,
+           LAG(latitude) OVER w AS prev_lat, LAG(longitude) OVER w AS prev_lon,
+           LEAD(latitude) OVER w AS next_lat, LEAD(longitude) OVER w AS next_lon
+    FROM vessel_tracks
+    WHERE sourcedatetime BETWEEN %s AND %s AND vesselname = ANY(%s)
+    WINDOW w AS (PARTITION BY vesselname ORDER BY sourcedatetime)
+), courses AS (
+    SELECT *,
+           atan2d(sind(longitude - prev_lon) * cosd(latitude),
+                  cosd(prev_lat) * sind(latitude) - sind(prev_lat) * cosd(latitude) * cosd(longitude - prev_lon)) AS course_in,
+           atan2d(sind(next_lon - longitude) * cosd(next_lat),
+                  cosd(latitude) * sind(next_lat) - sind(latitude) * cosd(next_lat) * cosd(next_lon - longitude)) AS course_out
+    FROM points
+), turns AS (
+    SELECT *, LEAST(ABS(course_out - course_in), 360 - ABS(course_out - course_in)) AS turn
+    FROM courses
+), ranked AS (
+    SELECT *,
+           ROW_NUMBER() OVER (PARTITION BY vesselname, bucket ORDER BY sourcedatetime) AS time_rank,
+           ROW_NUMBER() OVER (PARTITION BY vesselname, bucket ORDER BY turn DESC NULLS LAST) AS turn_rank
+    FROM turns
+)
+SELECT vesselname, sourcedatetime, latitude, longitude{course}, prev_lat, prev_lon FROM ranked
+WHERE time_rank = 1 OR next_lat IS NULL OR (turn_rank = 1 AND turn > %s)
+ORDER BY vesselname, sourcedatetime
+"""
+
+# Function to choose the downsampling bucket for a time range; 0 means full resolution.
+# Each bucket yields up to two points (its first point and its sharpest turn).
+def downsample_bucket_seconds(start_epoch, end_epoch, vessel_count, config=DOWNSAMPLE_CONFIG):
+    if not config.get('enabled', True) or vessel_count == 0:
+        return 0
+    buckets_per_vessel = max(config['point_budget'] // (2 * vessel_count), 1)
+    bucket_seconds = math.ceil((end_epoch - start_epoch) / buckets_per_vessel)
+    return bucket_seconds if bucket_seconds >= config.get('min_bucket_seconds', 0) else 0
+
+# Function to get vessel data for several vessels in one query, optionally downsampled
+# into bucket_seconds time buckets on the server.
+# Returns {vessel name: {column: array}}, each array a slice of one columnar result.
+# Includes the course_deg enrich.py stored when the column exists (NaN until enriched),
+# and when downsampled the raw previous fix of every point (prev_latitude, prev_longitude).
+# Cached so redraws at a new zoom reuse the result.
+@lru_cache(maxsize=4)
+def get_vessels_data(start_epoch, end_epoch, vessel_names, bucket_seconds=0):
+    enriched = db.has_enrichment()
+    course = ", course_deg" if enriched else ""
+    suffix = '_enriched' if enriched else ''
+    if bucket_seconds:
+        params = (bucket_seconds, start_epoch, end_epoch, list(vessel_names), DOWNSAMPLE_CONFIG['turn_degrees'])
+        _, rows = db.fetch_all(DOWNSAMPLED_VESSELS_QUERY.format(course=course), params,
+                               name='app_vessels_data_downsampled' + suffix)
+    else:
+        query = """
+        SELECT vesselname, sourcedatetime, latitude, longitude{course} FROM vessel_tracks
+        WHERE sourcedatetime BETWEEN %s AND %s AND vesselname = ANY(%s)
+        ORDER BY vesselname, sourcedatetime
+        """
+        _, rows = db.fetch_all(query.format(course=course), (start_epoch, end_epoch, list(vessel_names)),
+                               name='app_vessels_data' + suffix)
+    if not rows:
+        return {}
+
+    values = list(zip(*rows))
+    names = np.array(values[0], dtype=object)
+    columns = {
+        'sourcedatetime': np.array(values[1], dtype=np.int64),
+        'latitude': np.array(values[2], dtype=float),
+        'longitude': np.array(values[3], dtype=float),
+    }
+    if enriched:
+        columns['course_deg'] = np.array(values[4], dtype=float)
+    if bucket_seconds:
+        columns['prev_latitude'] = np.array(values[-2], dtype=float)
+        columns['prev_longitude'] = np.array(values[-1], dtype=float)
+
+    # Split the columns at the vessel boundaries of the sorted result
+    offsets = kinematics.group_offsets(names)
+    ends = np.append(offsets[1:], len(names))
+    return {
+        names[start]: {column: values[start:end] for column, values in columns.items()}
+        for start, end in zip(offsets, ends)
+    }
+
+# Function to normalize the dropdown value into a tuple of vessel names
+def selected_vessel_names(selected_vessels):
+    if not isinstance(selected_vessels, list):  # Ensure it's a list
+        selected_vessels = [selected_vessels]
+    return tuple(selected_vessels)
 
 # Function to calculate bearing between two points
 def calculate_bearing(lat1, lon1, lat2, lon2):
@@ -53,11 +186,18 @@ def calculate_bearing(lat1, lon1, lat2, lon2):
     bearing = (math.degrees(math.atan2(x, y)) + 360) % 360
     return round(bearing, 2)
 
-# Get min and max epoch times
-min_epoch, max_epoch = get_min_max_epoch()
+# Vessel names with their first/last report times, so slider moves don't scan vessel_tracks
+metadata_cache = metadata.MetadataCache()
+
+# Fold new reports into the metadata cache from one background feed per process
+metadata_feed = ingest.IngestFeed(metadata_cache.observe_new_rows)
 
 # Initialize the Dash app
 app = Dash(__name__)
+instrumentation.instrument(app)
+db.register_metrics_route(app.server)
+instrumentation.register_metrics_route(app.server)
+export.register_export_route(app.server)
 
 # App layout
 app.layout = html.Div([
@@ -74,16 +214,19 @@ app.layout = html.Div([
             html.Div(
                 [
                     html.Label("Select Time Range (Epoch):", style={"font-weight": "bold", "font-family": "Arial, sans-serif"}),
+                    # Bounds are filled in by update_epoch_bounds once the page loads
                     dcc.RangeSlider(
                         id='epoch-slider',
-                        min=min_epoch,
-                        max=max_epoch,
+                        min=0,
+                        max=1,
                         step=1,
-                        value=[min_epoch, max_epoch],
-                        marks={
-                            min_epoch: pd.to_datetime(min_epoch, unit='s').strftime('%Y-%m-%d %H:%M:%S'),
-                            max_epoch: pd.to_datetime(max_epoch, unit='s').strftime('%Y-%m-%d %H:%M:%S')
-                        },
+                        value=None,
+                        marks={},
+                    ),
+                    dcc.Interval(
+                        id='epoch-bounds-interval',
+                        interval=EPOCH_BOUNDS_REFRESH_INTERVAL * 1000,
+                        n_intervals=0
                     ),
                     html.Div(id='datetime-display', style={"margin-top": "10px", "font-weight": "bold", "font-family": "Arial, sans-serif"}),
                 ],
@@ -125,10 +268,18 @@ app.layout = html.Div([
             ])
         ]
     ),
+    html.Div(id='track-stats', style={"text-align": "center", "color": "#555", "font-size": "12px", "font-family": "Arial, sans-serif"}),
     html.Div(
         [
-            html.Button("Download CSV", id="download-btn", n_clicks=0, style={"margin-top": "20px", "background-color": "#214097", "color": "#fff", "border": "none", "padding": "10px 20px", "border-radius": "5px", "cursor": "pointer", "font-family": "Arial, sans-serif"}),
-            dcc.Download(id="download-dataframe-csv")
+            # Streamed by the export route, so the link just points at it
+            html.A("Download", id="download-link", style={"display": "inline-block", "margin-top": "20px", "background-color": "#214097", "color": "#fff", "text-decoration": "none", "padding": "10px 20px", "border-radius": "5px", "cursor": "pointer", "font-family": "Arial, sans-serif"}),
+            dcc.RadioItems(
+                id='export-format',
+                options=[{'label': fmt.upper(), 'value': fmt} for fmt in export.available_formats()],
+                value='csv',
+                inline=True,
+                style={"margin-top": "10px", "font-family": "Arial, sans-serif"}
+            ),
         ],
         style={"text-align": "center", "margin-bottom": "20px"}
     ),
@@ -140,24 +291,45 @@ app.layout = html.Div([
     )
 ])
 
+# Callback to load the slider bounds after the page loads and extend them as new data arrives.
+# A selection that ended at the previous maximum follows the new maximum; others are kept.
+@app.callback(
+    Output('epoch-slider', 'min'),
+    Output('epoch-slider', 'max'),
+    Output('epoch-slider', 'marks'),
+    Output('epoch-slider', 'value'),
+    Input('epoch-bounds-interval', 'n_intervals'),
+    State('epoch-slider', 'value'),
+    State('epoch-slider', 'max')
+)
+def update_epoch_bounds(n_intervals, epoch_range, current_max):
+    metadata_feed.start()
+    bounds = get_min_max_epoch()
+    if bounds is None:
+        return no_update, no_update, no_update, no_update
+    min_epoch, max_epoch = bounds
+
+    if not epoch_range:
+        value = [min_epoch, max_epoch]
+    else:
+        start_epoch, end_epoch = epoch_range
+        if end_epoch >= current_max:
+            end_epoch = max_epoch
+        value = [max(start_epoch, min_epoch), min(end_epoch, max_epoch)]
+    return min_epoch, max_epoch, epoch_marks(min_epoch, max_epoch), value
+
 # Callback to update vessel dropdown based on epoch range
 @app.callback(
     Output('vessel-dropdown', 'options'),
     Input('epoch-slider', 'value')
 )
 def update_vessel_dropdown(epoch_range):
+    if not epoch_range:
+        return []
+    metadata_feed.start()
     start_epoch, end_epoch = epoch_range
-    conn = psycopg2.connect(conn_string)
-    cursor = conn.cursor()
-    query = """
-    SELECT DISTINCT vesselname FROM vessel_tracks
-    WHERE sourcedatetime BETWEEN %s AND %s
-    """
-    cursor.execute(query, (start_epoch, end_epoch))
-    vessels = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return [{'label': vessel[0], 'value': vessel[0]} for vessel in vessels]
+    vessels = metadata_cache.vessels_between(start_epoch, end_epoch)
+    return [{'label': vessel, 'value': vessel} for vessel in vessels]
 
 # Callback to update datetime display dynamically based on RangeSlider value
 @app.callback(
@@ -165,30 +337,82 @@ def update_vessel_dropdown(epoch_range):
     Input('epoch-slider', 'value')
 )
 def update_datetime_display(epoch_range):
+    if not epoch_range:
+        return "Loading time range..."
     start_epoch, end_epoch = epoch_range
     start_datetime = pd.to_datetime(start_epoch, unit='s').strftime('%Y-%m-%d %H:%M:%S')
     end_datetime = pd.to_datetime(end_epoch, unit='s').strftime('%Y-%m-%d %H:%M:%S')
     return f"Selected Datetime Range: {start_datetime} to {end_datetime}"
 
+# Function to simplify the tracks of all loaded vessels in one pass for the given zoom.
+# Returns {vessel name: [[lat, lon], ...]} and the simplification stats.
+def simplify_vessel_tracks(vessels_data, zoom):
+    names = list(vessels_data)
+    sizes = [len(vessels_data[name]['latitude']) for name in names]
+    keys = np.repeat(np.arange(len(names)), sizes)
+    columns = {
+        column: np.concatenate([vessels_data[name][column] for name in names])
+        for column in ('sourcedatetime', 'latitude', 'longitude')
+    }
+    keep, stats = simplify.simplify_tracks(
+        keys, columns['sourcedatetime'], columns['latitude'], columns['longitude'], zoom, SIMPLIFY_CONFIG)
+
+    coordinates = np.column_stack((columns['latitude'], columns['longitude']))
+    ends = np.cumsum(sizes)
+    tracks = {
+        name: coordinates[start:end][keep[start:end]].tolist()
+        for name, start, end in zip(names, ends - sizes, ends)
+    }
+    return tracks, stats
+
+# Function to get the heading of a vessel's last position: the course enrich.py stored, else
+# the bearing from the raw fix before it. Downsampled data carries that fix per point, so the
+# heading doesn't depend on which points the zoom level kept. 0 if there is no earlier fix.
+def last_bearing(vessel_data):
+    course = vessel_data.get('course_deg')
+    if course is not None and not np.isnan(course[-1]):
+        return round(float(course[-1]), 2)  # Stored by enrich.py
+    lats, lons = vessel_data['latitude'], vessel_data['longitude']
+    if 'prev_latitude' in vessel_data:
+        prev_lat, prev_lon = vessel_data['prev_latitude'][-1], vessel_data['prev_longitude'][-1]
+    elif len(lats) > 1:
+        prev_lat, prev_lon = lats[-2], lons[-2]
+    else:
+        return 0
+    if np.isnan(prev_lat):
+        return 0
+    return calculate_bearing(prev_lat, prev_lon, lats[-1], lons[-1])
+
 # Callback to update map based on selected vessels and epoch range
 @app.callback(
     Output('vessel-layer', 'children'),
+    Output('track-stats', 'children'),
     Input('vessel-dropdown', 'value'),
-    Input('epoch-slider', 'value')
+    Input('epoch-slider', 'value'),
+    Input('map', 'zoom')
 )
-def update_map(selected_vessels, epoch_range):
+def update_map(selected_vessels, epoch_range, zoom):
+    if not epoch_range:
+        return [], ""
     start_epoch, end_epoch = epoch_range
     if selected_vessels:
-        if not isinstance(selected_vessels, list):  # Ensure it's a list
-            selected_vessels = [selected_vessels]
+        selected_vessels = selected_vessel_names(selected_vessels)
+        vessel_names = tuple(sorted(set(selected_vessels)))
+        bucket_seconds = downsample_bucket_seconds(start_epoch, end_epoch, len(vessel_names))
+        vessels_data = get_vessels_data(start_epoch, end_epoch, vessel_names, bucket_seconds)
+        if not vessels_data:
+            return [], ""
+        tracks, stats = simplify_vessel_tracks(vessels_data, zoom)
         map_elements = []
         for idx, vessel_name in enumerate(selected_vessels):
-            vessel_data = get_vessel_data(start_epoch, end_epoch, vessel_name)
-            if not vessel_data:
+            vessel_data = vessels_data.get(vessel_name)
+            if vessel_data is None:
                 continue
+            lats = vessel_data['latitude']
+            lons = vessel_data['longitude']
 
-            # Extract coordinates for the polyline
-            coordinates = [[row[1], row[2]] for row in vessel_data]
+            # Simplified coordinates for the polyline
+            coordinates = tracks[vessel_name]
 
             # Add polyline for the vessel's track
             map_elements.append(
@@ -201,20 +425,12 @@ def update_map(selected_vessels, epoch_range):
             )
 
             # Add a circle marker for the last known position
-            last_position = vessel_data[-1]
-            last_time = pd.to_datetime(last_position[0], unit='s').strftime('%Y-%m-%d %H:%M:%S')
-            if len(vessel_data) > 1:
-                second_last_position = vessel_data[-2]
-                bearing = calculate_bearing(
-                    second_last_position[1], second_last_position[2],
-                    last_position[1], last_position[2]
-                )
-            else:
-                bearing = 0  # Default bearing if only one position exists
+            last_time = pd.to_datetime(vessel_data['sourcedatetime'][-1], unit='s').strftime('%Y-%m-%d %H:%M:%S')
+            bearing = last_bearing(vessel_data)
 
             map_elements.append(
                 dl.CircleMarker(
-                    center=[last_position[1], last_position[2]],
+                    center=[float(lats[-1]), float(lons[-1])],
                     radius=8,
                     color=fixed_colors[idx % len(fixed_colors)],  # Use fixed colors
                     fill=True,
@@ -242,36 +458,27 @@ def update_map(selected_vessels, epoch_range):
                     ]
                 )
             )
-        return map_elements
-    return []
+        stats_text = simplify.format_stats(stats)
+        if bucket_seconds:
+            stats_text += f", downsampled to one point per {bucket_seconds} s plus turns"
+        return map_elements, stats_text
+    return [], ""
 
-# Callback to handle CSV download
+# Callback to point the download link at the streaming export for the current selection
 @app.callback(
-    Output('download-dataframe-csv', 'data'),
-    Input('download-btn', 'n_clicks'),
-    State('vessel-dropdown', 'value'),
-    State('epoch-slider', 'value'),
-    prevent_initial_call=True
+    Output('download-link', 'href'),
+    Input('vessel-dropdown', 'value'),
+    Input('epoch-slider', 'value'),
+    Input('export-format', 'value')
 )
-def download_csv(n_clicks, selected_vessels, epoch_range):
+def update_download_link(selected_vessels, epoch_range, export_format):
+    # No href until there is something to export, so clicking the link does nothing
+    if not selected_vessels or not epoch_range:
+        return None
     start_epoch, end_epoch = epoch_range
-    csv_data = []
-    if selected_vessels:
-        if not isinstance(selected_vessels, list):  # Ensure it's a list
-            selected_vessels = [selected_vessels]
-        for vessel_name in selected_vessels:
-            vessel_data = get_vessel_data(start_epoch, end_epoch, vessel_name)
-            for row in vessel_data:
-                csv_data.append({
-                    "Vessel Name": vessel_name,
-                    "Datetime": pd.to_datetime(row[0], unit='s').strftime('%Y-%m-%d %H:%M:%S'),
-                    "Latitude": row[1],
-                    "Longitude": row[2]
-                })
-        # Generate CSV
-        df = pd.DataFrame(csv_data)
-        return dcc.send_data_frame(df.to_csv, "vessel_data.csv", index=False)
-    return None
+    params = [('start', start_epoch), ('end', end_epoch), ('format', export_format)]
+    params += [('vessel', vessel_name) for vessel_name in selected_vessel_names(selected_vessels)]
+    return f"/export?{urlencode(params)}"
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,22 @@
+// Styling functions for the GeoJSON vessel and prediction layers in geofen.py
+window.dashExtensions = Object.assign({}, window.dashExtensions, {
+    default: Object.assign({}, (window.dashExtensions || {}).default, {
+        vesselPoint: function(feature, latlng) {
+            return L.circleMarker(latlng, {
+                radius: 6,
+                color: feature.properties.color,
+                fillColor: feature.properties.color,
+                fillOpacity: 0.8
+            });
+        },
+        trackStyle: function(feature) {
+            return {color: feature.properties.color, weight: 3, opacity: 0.7};
+        },
+        predictionStyle: function(feature) {
+            return {color: 'red', weight: 2, dashArray: '10,5', opacity: 0.7};
+        },
+        predictionPoint: function(feature, latlng) {
+            return L.circleMarker(latlng, {radius: 3, color: 'red', fillOpacity: 0.7});
+        }
+    })
+});
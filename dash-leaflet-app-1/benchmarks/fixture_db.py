@@ -0,0 +1,137 @@
+import json
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import db
+
+# Stand-in for the db module that answers the apps' named queries from an in-memory
+# vessel_tracks DataFrame (and geofence_zones dict), so the pipeline can be benchmarked without Postgres.
+# Only the queries the benchmarks exercise are known; any other name raises KeyError.
+class FixtureDB:
+    def __init__(self, tracks):
+        self.tracks = tracks.reset_index(drop=True)
+        self.zones = {}  # zone_id -> (name, kind, coordinates), as in geofence_zones
+        self._installed = None
+        self._handlers = {
+            'geofen_vessel_rows': self._vessel_rows,
+            'geofen_vessels_in_geofence': self._vessels_in_geofence,
+            'app_vessels_data': self._vessels_data,
+            'export_vessel_tracks': self._vessels_data,
+            'app_min_max_epoch': self._min_max_epoch,
+            'db_has_enrichment': self._has_enrichment,
+            'metadata_presence': self._presence,
+            'metadata_vessels_present': self._vessels_present,
+            'metadata_new_rows': self._new_rows,
+            'zones_load': self._zones_load,
+            'zones_save': self._zones_save,
+            'zones_delete': self._zones_delete,
+        }
+
+    # Function to load a fixture saved with save() (CSV or Parquet, by extension)
+    @classmethod
+    def from_file(cls, path):
+        tracks = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+        return cls(tracks)
+
+    def save(self, path):
+        if path.endswith('.parquet'):
+            self.tracks.to_parquet(path, index=False)
+        else:
+            self.tracks.to_csv(path, index=False)
+
+    # Route db.fetch_all and db.stream_rows to the fixture until uninstall()
+    def install(self):
+        self._installed = (db.fetch_all, db.stream_rows)
+        db.fetch_all = self.fetch_all
+        db.stream_rows = self.stream_rows
+
+    def uninstall(self):
+        if self._installed:
+            db.fetch_all, db.stream_rows = self._installed
+            self._installed = None
+
+    def fetch_all(self, query, params=None, name=None):
+        if name not in self._handlers:
+            raise KeyError(f"No fixture for query {name!r}")
+        df = self._handlers[name](params)
+        return list(df.columns), list(df.itertuples(index=False, name=None))
+
+    def stream_rows(self, query, params=None, name='stream', chunk_size=db.STREAM_CHUNK_ROWS):
+        columns, rows = self.fetch_all(query, params, name)
+        for start in range(0, len(rows), chunk_size):
+            yield columns, rows[start:start + chunk_size]
+
+    def _vessel_rows(self, params):
+        since, = params
+        df = self.tracks[self.tracks['sourcedatetime'] >= since]
+        return df.sort_values('sourcedatetime', ascending=False)[
+            ['source', 'vesselname', 'sourcedatetime', 'latitude', 'longitude']]
+
+    # The PostGIS pushdown query: rows inside the polygon with the vessel's previous report
+    # (any source, strictly earlier second) and whether a later report exists
+    def _vessels_in_geofence(self, params):
+        since, _, polygon_wkt, all_sources, sources = params
+        window = self.tracks[self.tracks['sourcedatetime'] >= since].sort_values('sourcedatetime', kind='stable')
+        previous = window[['vesselname', 'sourcedatetime', 'latitude', 'longitude']].rename(
+            columns={'sourcedatetime': 'prev_time', 'latitude': 'prev_lat', 'longitude': 'prev_lon'})
+        df = pd.merge_asof(window, previous, left_on='sourcedatetime', right_on='prev_time',
+                           by='vesselname', allow_exact_matches=False)
+        last_seen = self.tracks.groupby('vesselname')['sourcedatetime'].max()
+        df['has_next'] = df['sourcedatetime'] < df['vesselname'].map(last_seen)
+
+        inside = shapely.contains_xy(shapely.from_wkt(polygon_wkt), df['longitude'].to_numpy(), df['latitude'].to_numpy())
+        if not all_sources:
+            inside &= df['source'].isin(sources).to_numpy()
+        return df[inside][['source', 'vesselname', 'sourcedatetime', 'latitude', 'longitude',
+                           'prev_lat', 'prev_lon', 'prev_time', 'has_next']]
+
+    def _vessels_data(self, params):
+        start_epoch, end_epoch, vessel_names = params
+        tracks = self.tracks
+        mask = tracks['sourcedatetime'].between(start_epoch, end_epoch) & tracks['vesselname'].isin(vessel_names)
+        return tracks[mask].sort_values(['vesselname', 'sourcedatetime'])[
+            ['vesselname', 'sourcedatetime', 'latitude', 'longitude']]
+
+    def _min_max_epoch(self, params):
+        times = self.tracks['sourcedatetime'].to_numpy()
+        return pd.DataFrame({'min': [np.min(times)], 'max': [np.max(times)]})
+
+    # The fixture holds raw reports only, so the apps compute speed and course themselves
+    def _has_enrichment(self, params):
+        return pd.DataFrame({'enriched': [False]})
+
+    # Each (source, vessel, bucket)'s first and last report, as the metadata cache loads them
+    def _presence(self, params):
+        bucket_seconds, = params
+        tracks = self.tracks.assign(bucket=self.tracks['sourcedatetime'] // bucket_seconds)
+        spans = tracks.groupby(['source', 'vesselname', 'bucket'], dropna=False)['sourcedatetime'].agg(['min', 'max'])
+        return spans.reset_index().astype({'source': object}).replace({np.nan: None})
+
+    def _vessels_present(self, params):
+        candidates, start_epoch, end_epoch = params
+        tracks = self.tracks
+        present = set(tracks.loc[tracks['sourcedatetime'].between(start_epoch, end_epoch), 'vesselname'])
+        return pd.DataFrame({'v': [name for name in candidates if name in present]})
+
+    def _new_rows(self, params):
+        since, = params
+        return self.tracks[self.tracks['sourcedatetime'] >= since][['source', 'vesselname', 'sourcedatetime']]
+
+    def _zones_load(self, params):
+        rows = sorted(((zone_id, *zone) for zone_id, zone in self.zones.items()), key=lambda row: row[1])
+        return pd.DataFrame(rows, columns=['zone_id', 'name', 'kind', 'coordinates'])
+
+    # Insert, or update the zone of the same name, like ON CONFLICT (name) DO UPDATE
+    def _zones_save(self, params):
+        name, kind, coordinates = params
+        zone_id = next((zone_id for zone_id, zone in self.zones.items() if zone[0] == name),
+                       max(self.zones, default=0) + 1)
+        self.zones[zone_id] = (name, kind, json.loads(coordinates))
+        return pd.DataFrame({'zone_id': [zone_id]})
+
+    def _zones_delete(self, params):
+        zone_ids, = params
+        deleted = [zone_id for zone_id in zone_ids if self.zones.pop(zone_id, None) is not None]
+        return pd.DataFrame({'zone_id': deleted})
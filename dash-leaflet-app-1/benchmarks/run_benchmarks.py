@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+# Times each stage of the vessel-tracking pipeline on synthetic vessel_tracks data and
+# writes throughput and peak memory per stage and scale to a JSON file. Runs without a
+# database: the apps' queries are answered by benchmarks/fixture_db.py.
+#
+#   python benchmarks/run_benchmarks.py --scales small,medium --output results.json
+#   python benchmarks/run_benchmarks.py --fixture tracks.parquet   # Use saved data instead
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [APP_DIR, os.path.dirname(os.path.abspath(__file__))]
+
+import numpy as np
+import pandas as pd
+
+import app
+import db
+import export
+import geofen
+import geofence_filter
+from fixture_db import FixtureDB
+from synthetic import central_geofence_json, generate_tracks
+
+# vessels x points per vessel x sources
+SCALES = {
+    'small': (50, 360, 2),
+    'medium': (500, 360, 2),
+    'large': (2000, 720, 2),
+}
+
+APP_SELECTED_VESSELS = 100  # Vessels picked in app.py's dropdown for update_map and the export
+MAP_ZOOM = 11
+
+
+# Function to time a stage: best and median wall time over repeats, then one more run
+# under tracemalloc for the peak Python/NumPy allocation
+def measure(run, rows, repeats):
+    seconds = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(seconds)
+    return {
+        'rows': rows,
+        'seconds_best': best,
+        'seconds_median': statistics.median(seconds),
+        'rows_per_second': rows / best if best > 0 else None,
+        'peak_bytes': peak,
+    }
+
+
+# Stages as name -> (run, rows). Each run does the same work as one callback invocation.
+def build_stages(tracks, hours):
+    raw = tracks.copy()
+    raw['timestamp'] = pd.to_datetime(raw['sourcedatetime'], unit='s')
+    window = geofen.calculate_speed_and_course(raw.copy())
+    geofence_json = central_geofence_json()
+    token = geofen.vessel_store.put(window)
+
+    end_epoch = int(tracks['sourcedatetime'].max())
+    start_epoch = int(tracks['sourcedatetime'].min())
+    selected = sorted(tracks['vesselname'].unique())[:APP_SELECTED_VESSELS]
+    selected_rows = int(tracks['vesselname'].isin(selected).sum())
+
+    def fetch_window():
+        geofen.fetch_all_vessel_data(hours)
+
+    def speed_and_course():
+        geofen.calculate_speed_and_course(raw.copy())
+
+    def geofence_filtering():
+        geofence_filter.get_geofence.cache_clear()
+        geofence_filter.filter_mask(window, geofence_json)
+
+    def store_round_trip():
+        geofen.vessel_store.resolve(geofen.vessel_store.put(window.copy(deep=False)))
+
+    def json_round_trip():
+        # What dcc.Store carried before the token store: the whole window as JSON
+        pd.read_json(io.StringIO(window.to_json(date_format='iso', orient='split')), orient='split')
+
+    def map_render():
+        geofen.compute_filtered_view.cache_clear()
+        geofen.update_map_with_tracks_and_markers(geofence_json, [], MAP_ZOOM, token, None)
+
+    def app_update_map():
+        app.get_vessels_data.cache_clear()
+        app.update_map(selected, [start_epoch, end_epoch], MAP_ZOOM)
+
+    # The body of the /export response, without Flask's request context
+    def export_chunks():
+        return db.stream_rows(export.EXPORT_QUERY, (start_epoch, end_epoch, selected), name='export_vessel_tracks')
+
+    def export_csv():
+        for _ in export.stream_csv(export_chunks()):
+            pass
+
+    def export_parquet():
+        for _ in export.stream_parquet(export_chunks()):
+            pass
+
+    stages = {
+        'geofen_fetch_window': (fetch_window, len(tracks)),
+        'calculate_speed_and_course': (speed_and_course, len(tracks)),
+        'geofence_filter': (geofence_filtering, len(tracks)),
+        'store_round_trip': (store_round_trip, len(tracks)),
+        'json_store_round_trip': (json_round_trip, len(tracks)),
+        'update_map_with_tracks_and_markers': (map_render, len(tracks)),
+        'app_update_map': (app_update_map, selected_rows),
+        'app_export_csv': (export_csv, selected_rows),
+    }
+    if 'parquet' in export.available_formats():
+        stages['app_export_parquet'] = (export_parquet, selected_rows)
+    return stages
+
+
+def run_scale(tracks, stage_names, repeats):
+    fixture = FixtureDB(tracks)
+    fixture.install()
+    try:
+        hours = (time.time() - tracks['sourcedatetime'].min()) / 3600 + 1
+        results = {}
+        for name, (run, rows) in build_stages(tracks, hours).items():
+            if stage_names and name not in stage_names:
+                continue
+            results[name] = measure(run, rows, repeats)
+            print(f"  {name:<36} {results[name]['seconds_best'] * 1000:10.1f} ms"
+                  f" {results[name]['peak_bytes'] / 2 ** 20:10.1f} MiB")
+        return results
+    finally:
+        fixture.uninstall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vessel-tracking pipeline on synthetic data")
+    parser.add_argument('--scales', default='small,medium', help=f"Comma-separated, from {', '.join(SCALES)}")
+    parser.add_argument('--stages', default='', help="Comma-separated stage names (default: all)")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--fixture', help="CSV or Parquet file of vessel_tracks rows to use instead of synthetic data")
+    parser.add_argument('--save-fixture', help="Write the synthetic data of the last scale to this file")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    # Time callbacks outside Dash as full redraws; the fixture has no downsampling query
+    geofen.dash.callback_context = SimpleNamespace(triggered=[{'prop_id': 'geofence-data.children'}])
+    app.DOWNSAMPLE_CONFIG['enabled'] = False
+
+    stage_names = set(filter(None, args.stages.split(',')))
+    report = {
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'repeats': args.repeats,
+        'scales': {},
+    }
+
+    if args.fixture:
+        datasets = {os.path.basename(args.fixture): FixtureDB.from_file(args.fixture).tracks}
+    else:
+        datasets = {}
+        for scale in filter(None, args.scales.split(',')):
+            vessels, points, sources = SCALES[scale]
+            datasets[scale] = generate_tracks(vessels, points, sources)
+
+    for scale, tracks in datasets.items():
+        print(f"{scale}: {len(tracks)} rows, {tracks['vesselname'].nunique()} vessels")
+        report['scales'][scale] = {
+            'rows': len(tracks),
+            'vessels': int(tracks['vesselname'].nunique()),
+            'stages': run_scale(tracks, stage_names, args.repeats),
+        }
+
+    if args.save_fixture and datasets:
+        FixtureDB(tracks).save(args.save_fixture)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+# Area the synthetic vessels sail in (around Singapore, like the map defaults)
+AREA = {'lat_min': 1.0, 'lat_max': 1.6, 'lon_min': 103.4, 'lon_max': 104.4}
+SOURCES = ['AIS', 'RADAR', 'SAT', 'VTS']
+REPORT_INTERVAL = 10  # Seconds between reports of one vessel
+KNOTS_TO_DEG_PER_S = 1.852 / 111.32 / 3600
+
+
+# Function to generate vessel_tracks rows (source, vesselname, sourcedatetime, latitude, longitude).
+# Each vessel keeps a random speed and turns gradually; every source reports the same vessel
+# with a small position error and time offset. The newest report is at end_epoch.
+def generate_tracks(vessels, points, sources=1, end_epoch=None, seed=0):
+    rng = np.random.default_rng(seed)
+    end_epoch = int(time.time()) if end_epoch is None else end_epoch
+    start_epoch = end_epoch - (points - 1) * REPORT_INTERVAL
+
+    # Heading random walk and constant speed per vessel, integrated into positions
+    heading = rng.uniform(0, 360, (vessels, 1)) + np.cumsum(rng.normal(0, 3, (vessels, points)), axis=1)
+    speed = rng.uniform(5, 20, (vessels, 1)) * KNOTS_TO_DEG_PER_S * REPORT_INTERVAL
+    lat = rng.uniform(AREA['lat_min'], AREA['lat_max'], (vessels, 1)) + np.cumsum(speed * np.cos(np.radians(heading)), axis=1)
+    lon = rng.uniform(AREA['lon_min'], AREA['lon_max'], (vessels, 1)) + np.cumsum(speed * np.sin(np.radians(heading)), axis=1)
+    times = start_epoch + np.arange(points) * REPORT_INTERVAL
+
+    names = np.array([f"VESSEL {i:05d}" for i in range(vessels)], dtype=object)
+    frames = []
+    for source_index in range(sources):
+        noise = 0 if source_index == 0 else 0.0005
+        offset = 0 if source_index == 0 else -source_index
+        frames.append(pd.DataFrame({
+            'source': SOURCES[source_index % len(SOURCES)],
+            'vesselname': np.repeat(names, points),
+            'sourcedatetime': np.tile(times + offset, vessels).astype(np.int64),
+            'latitude': (lat + rng.normal(0, noise, lat.shape)).ravel(),
+            'longitude': (lon + rng.normal(0, noise, lon.shape)).ravel(),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+# Geofence (as the JSON string the geofen.py callbacks receive) covering the middle of AREA
+def central_geofence_json():
+    lat_mid = (AREA['lat_min'] + AREA['lat_max']) / 2
+    lon_mid = (AREA['lon_min'] + AREA['lon_max']) / 2
+    lat_half = (AREA['lat_max'] - AREA['lat_min']) / 4
+    lon_half = (AREA['lon_max'] - AREA['lon_min']) / 4
+    coordinates = [
+        [lat_mid - lat_half, lon_mid - lon_half],
+        [lat_mid + lat_half, lon_mid - lon_half / 2],
+        [lat_mid + lat_half, lon_mid + lon_half],
+        [lat_mid - lat_half / 2, lon_mid + lon_half],
+        [lat_mid - lat_half, lon_mid - lon_half],
+    ]
+    return json.dumps(coordinates)
@@ -0,0 +1,216 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from kinematics import KNOTS_TO_KMH
+
+METERS_PER_DEGREE = 111320.0
+METERS_PER_NAUTICAL_MILE = 1852.0
+
+# Default alerting settings
+CPA_THRESHOLD_NM = 0.5  # Alert when the closest point of approach is nearer than this
+TCPA_HORIZON_MINUTES = 20  # ... within this many minutes
+MAX_REPORT_AGE_MINUTES = 10  # Vessels not heard from for longer are left out
+CELL_DEGREES = 0.05  # Spatial hash cell size (~5.5 km)
+MAX_SPEED_KNOTS = 60  # Faster reports are treated as glitches and the vessel as stationary
+MAX_CELLS_PER_VESSEL = 1024  # Vessels whose box spans more cells are compared with every vessel
+
+
+# Function to find candidate pairs between moved vessels and all vessels with a spatial hash.
+# cell_slots/cell_ids hold one row per (slot, cell) a slot's box touches; every pair of slots
+# that share a cell and include at least one moved slot is returned once as (i, j) with i < j.
+# Wide slots, whose boxes were too large to hash, pair with every slot when they moved and
+# with every moved slot otherwise.
+def _candidate_pairs(cell_slots, cell_ids, moved, wide):
+    a, b = [], []
+    if len(cell_ids):
+        order = np.argsort(cell_ids, kind='stable')
+        slots, ids = cell_slots[order], cell_ids[order]
+        starts = np.concatenate(([0], np.flatnonzero(ids[1:] != ids[:-1]) + 1))
+        ends = np.append(starts[1:], len(ids))
+        group = np.repeat(np.arange(len(starts)), ends - starts)
+
+        # Each moved member of a cell pairs with every other member of that cell
+        rows = np.flatnonzero(moved[slots])
+        counts = (ends - starts)[group[rows]]
+        left = np.repeat(rows, counts)
+        first = np.repeat(starts[group[rows]], counts)
+        right = first + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        a.append(slots[left])
+        b.append(slots[right])
+
+    moved_wide = np.flatnonzero(wide & moved)
+    still_wide = np.flatnonzero(wide & ~moved)
+    moved_slots = np.flatnonzero(moved)
+    a += [np.repeat(moved_wide, len(wide)), np.repeat(still_wide, len(moved_slots))]
+    b += [np.tile(np.arange(len(wide)), len(moved_wide)), np.tile(moved_slots, len(still_wide))]
+
+    a, b = np.concatenate(a).astype(np.int64), np.concatenate(b).astype(np.int64)
+    keep = a != b
+    # One int64 key per pair is much faster to deduplicate than rows
+    keys = np.unique(np.minimum(a[keep], b[keep]) << 32 | np.maximum(a[keep], b[keep]))
+    return np.column_stack((keys >> 32, keys & 0xFFFFFFFF))
+
+
+# Closest point of approach of vessel pairs over [now, now + horizon], with every vessel
+# dead-reckoned from its own report time. Works in a local flat projection per pair.
+# Returns (cpa meters, tcpa seconds from now, current distance meters).
+def cpa_tcpa(i, j, seconds, lat, lon, v_east, v_north, now, horizon_seconds):
+    scale = np.cos(np.radians((lat[i] + lat[j]) / 2)) * METERS_PER_DEGREE
+    # Positions at `now`, in meters relative to vessel i
+    x_i = lon[i] * scale + v_east[i] * (now - seconds[i])
+    y_i = lat[i] * METERS_PER_DEGREE + v_north[i] * (now - seconds[i])
+    x_j = lon[j] * scale + v_east[j] * (now - seconds[j])
+    y_j = lat[j] * METERS_PER_DEGREE + v_north[j] * (now - seconds[j])
+    dx, dy = x_j - x_i, y_j - y_i
+    dvx, dvy = v_east[j] - v_east[i], v_north[j] - v_north[i]
+
+    speed_sq = dvx * dvx + dvy * dvy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tcpa = np.where(speed_sq > 1e-9, -(dx * dvx + dy * dvy) / speed_sq, 0.0)
+    tcpa = np.clip(tcpa, 0, horizon_seconds)
+    cpa = np.hypot(dx + dvx * tcpa, dy + dvy * tcpa)
+    return cpa, tcpa, np.hypot(dx, dy)
+
+
+# Close-quarters monitor over the latest position of every vessel.
+# Each vessel's box is the path it could sail until its report goes stale plus the horizon,
+# widened by half the threshold; two vessels can only come within the threshold if their
+# boxes overlap, so only vessels sharing a hash cell are compared. update() re-hashes just the
+# vessels whose report changed and keeps the candidate pairs of the others.
+class CollisionMonitor:
+    def __init__(self, threshold_nm=CPA_THRESHOLD_NM, horizon_minutes=TCPA_HORIZON_MINUTES,
+                 max_age_minutes=MAX_REPORT_AGE_MINUTES, cell_degrees=CELL_DEGREES):
+        self.threshold_m = threshold_nm * METERS_PER_NAUTICAL_MILE
+        self.horizon_seconds = horizon_minutes * 60
+        self.max_age_seconds = max_age_minutes * 60
+        self.cell_degrees = cell_degrees
+        self._lock = threading.Lock()
+        self._slots = {}  # vessel name -> slot
+        self._names = np.empty(0, dtype=object)
+        self._state = {name: np.empty(0) for name in ('seconds', 'lat', 'lon', 'v_east', 'v_north')}
+        self._cell_slots = np.zeros(0, dtype=np.int64)
+        self._cell_ids = np.zeros(0, dtype=np.int64)
+        self._pairs = np.zeros((0, 2), dtype=np.int64)
+        self._wide = np.zeros(0, dtype=bool)  # Slots compared with every vessel, see _cells
+        self.stats = {'vessels': 0, 'moved': 0, 'wide': 0, 'candidate_pairs': 0, 'seconds': 0.0}
+
+    # Swept boxes of some slots as rows of (slot, cell id), plus a mask of the slots whose box
+    # covers more than MAX_CELLS_PER_VESSEL cells; those get no cells and are paired with
+    # every vessel instead. Slots without a finite position get neither.
+    def _cells(self, slots):
+        state = self._state
+        reach = self.max_age_seconds + self.horizon_seconds
+        lat = np.clip(state['lat'][slots], -90, 90)
+        lon = state['lon'][slots]
+        cos_lat = np.maximum(np.cos(np.radians(lat)), 1e-6)
+        margin = self.threshold_m / 2 / METERS_PER_DEGREE
+        end_lat = np.clip(lat + state['v_north'][slots] * reach / METERS_PER_DEGREE, -90, 90)
+        end_lon = lon + state['v_east'][slots] * reach / (METERS_PER_DEGREE * cos_lat)
+        with np.errstate(invalid='ignore'):
+            lat0 = np.floor((np.minimum(lat, end_lat) - margin) / self.cell_degrees)
+            lat1 = np.floor((np.maximum(lat, end_lat) + margin) / self.cell_degrees)
+            lon0 = np.floor((np.minimum(lon, end_lon) - margin / cos_lat) / self.cell_degrees)
+            lon1 = np.floor((np.maximum(lon, end_lon) + margin / cos_lat) / self.cell_degrees)
+
+        # Cell counts in float first, so huge boxes can't overflow the int64 cell arithmetic
+        n_lat, n_lon = lat1 - lat0 + 1, lon1 - lon0 + 1
+        finite = np.isfinite(n_lat * n_lon)
+        wide = finite & (n_lat * n_lon > MAX_CELLS_PER_VESSEL)
+        hashed = finite & ~wide
+        lat0, lon0 = lat0[hashed].astype(np.int64), lon0[hashed].astype(np.int64)
+        n_lat, n_lon = n_lat[hashed].astype(np.int64), n_lon[hashed].astype(np.int64)
+
+        # Expand every box into its cells
+        counts = n_lat * n_lon
+        owner = np.repeat(np.arange(len(counts)), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_lat = lat0[owner] + k // n_lon[owner]
+        cell_lon = lon0[owner] + k % n_lon[owner]
+        return np.asarray(slots)[hashed][owner], cell_lat * 10_000_000 + cell_lon, wide
+
+    # Fold in the latest position of every vessel (vesselname, sourcedatetime, latitude,
+    # longitude, speed in knots, course in degrees). Vessels missing from it are dropped.
+    def update(self, latest):
+        started = time.perf_counter()
+        with self._lock:
+            names = latest['vesselname'].to_numpy()
+            # Copies, so the frame can change without the stored state changing with it
+            seconds = latest['sourcedatetime'].to_numpy(dtype=float, copy=True)
+            lat = latest['latitude'].to_numpy(dtype=float, copy=True)
+            lon = latest['longitude'].to_numpy(dtype=float, copy=True)
+            speed_knots = np.nan_to_num(latest['speed'].to_numpy(dtype=float))
+            speed = speed_knots * KNOTS_TO_KMH / 3.6
+            course = np.radians(latest['course'].to_numpy(dtype=float))
+            moving = np.isfinite(course) & (speed_knots >= 0) & (speed_knots <= MAX_SPEED_KNOTS)
+            v_east = np.where(moving, speed * np.sin(np.nan_to_num(course)), 0.0)
+            v_north = np.where(moving, speed * np.cos(np.nan_to_num(course)), 0.0)
+
+            # Slots follow the row order; match them to the previous update by vessel name
+            old_slots = self._slots
+            slots = {name: index for index, name in enumerate(names)}
+            previous = np.array([old_slots.get(name, -1) for name in names], dtype=np.int64)
+            known = previous >= 0
+            moved = ~known
+            if known.any():
+                old = self._state
+                p = previous[known]
+                moved[known] = ((old['seconds'][p] != seconds[known]) | (old['lat'][p] != lat[known])
+                                | (old['lon'][p] != lon[known]))
+
+            self._slots = slots
+            self._names = names
+            self._state = {'seconds': seconds, 'lat': lat, 'lon': lon, 'v_east': v_east, 'v_north': v_north}
+
+            # Carry over the cells and pairs of unmoved vessels, renumbered to the new slots
+            remap = np.full(len(old_slots), -1, dtype=np.int64)
+            unmoved = np.flatnonzero(known & ~moved)
+            remap[previous[unmoved]] = unmoved
+            cell_slots = remap[self._cell_slots] if len(self._cell_slots) else self._cell_slots
+            keep_cells = cell_slots >= 0
+            pairs = remap[self._pairs] if len(self._pairs) else self._pairs
+            keep_pairs = (pairs >= 0).all(axis=1) if len(pairs) else np.zeros(0, dtype=bool)
+
+            wide = np.zeros(len(names), dtype=bool)
+            wide[unmoved] = self._wide[previous[unmoved]]
+            moved_slots = np.flatnonzero(moved)
+            new_slots, new_ids, wide[moved_slots] = self._cells(moved_slots)
+            self._wide = wide
+            self._cell_slots = np.concatenate((cell_slots[keep_cells], new_slots))
+            self._cell_ids = np.concatenate((self._cell_ids[keep_cells], new_ids))
+            new_pairs = _candidate_pairs(self._cell_slots, self._cell_ids, moved, wide)
+            self._pairs = np.concatenate((pairs[keep_pairs].reshape(-1, 2), new_pairs))
+
+            self.stats = {
+                'vessels': len(names),
+                'moved': int(moved.sum()),
+                'wide': int(wide.sum()),
+                'candidate_pairs': len(self._pairs),
+                'seconds': time.perf_counter() - started,
+            }
+
+    # Pairs whose closest approach within the horizon is under the threshold, soonest first
+    def alerts(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            pairs, state, names = self._pairs, self._state, self._names
+        columns = ['vessel_a', 'vessel_b', 'cpa_nm', 'tcpa_minutes', 'distance_nm']
+        if len(pairs) == 0:
+            return pd.DataFrame(columns=columns)
+
+        i, j = pairs[:, 0], pairs[:, 1]
+        fresh = (now - state['seconds'][i] <= self.max_age_seconds) & (now - state['seconds'][j] <= self.max_age_seconds)
+        i, j = i[fresh], j[fresh]
+        cpa, tcpa, distance = cpa_tcpa(i, j, state['seconds'], state['lat'], state['lon'],
+                                       state['v_east'], state['v_north'], now, self.horizon_seconds)
+        close = cpa < self.threshold_m
+        alerts = pd.DataFrame({
+            'vessel_a': names[i[close]],
+            'vessel_b': names[j[close]],
+            'cpa_nm': cpa[close] / METERS_PER_NAUTICAL_MILE,
+            'tcpa_minutes': tcpa[close] / 60,
+            'distance_nm': distance[close] / METERS_PER_NAUTICAL_MILE,
+        }, columns=columns)
+        return alerts.sort_values(['tcpa_minutes', 'cpa_nm']).reset_index(drop=True)
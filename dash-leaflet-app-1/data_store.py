@@ -0,0 +1,66 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+# Number of recent versions kept so callbacks holding a slightly old token still resolve
+# (a current and a previous one for each of a few time ranges)
+MAX_VERSIONS = 8
+
+
+# Server-side store of DataFrames keyed by a small version token.
+# Only the token travels through dcc.Store; callbacks look the data up by reference.
+# Other state of the same data version (keyword extras to put) is kept next to it.
+class DataStore:
+    def __init__(self, max_versions=MAX_VERSIONS):
+        self._max_versions = max_versions
+        self._versions = OrderedDict()
+        self._extras = {}  # token -> {name: value} stored with the version
+        self._prefix = uuid.uuid4().hex[:8]  # Tokens from a previous process never match
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    # Store a new version and return its token; a DataFrame object already held keeps its token
+    # (and the extras it was first stored with)
+    def put(self, df, **extras):
+        with self._lock:
+            for token, held in self._versions.items():
+                if held is df:
+                    self._versions.move_to_end(token)
+                    return token
+            self._sequence += 1
+            token = f"{self._prefix}-{self._sequence}"
+            self._versions[token] = df
+            self._extras[token] = extras
+            while len(self._versions) > self._max_versions:
+                evicted, _ = self._versions.popitem(last=False)
+                self._extras.pop(evicted, None)
+            return token
+
+    # Look up a version by token, or None if it is unknown or has been evicted
+    def get(self, token):
+        with self._lock:
+            return self._versions.get(token)
+
+    # Latest (token, DataFrame) pair, or (None, None) before the first put
+    def latest(self):
+        with self._lock:
+            if not self._versions:
+                return None, None
+            token = next(reversed(self._versions))
+            return token, self._versions[token]
+
+    # Look up a version by token, falling back to the latest one
+    def resolve(self, token):
+        df = self.get(token)
+        if df is None:
+            _, df = self.latest()
+        return df
+
+    # Extras stored with a version, falling back to the latest one's like resolve
+    def resolve_extras(self, token):
+        with self._lock:
+            if token not in self._versions:
+                if not self._versions:
+                    return {}
+                token = next(reversed(self._versions))
+            return self._extras.get(token, {})
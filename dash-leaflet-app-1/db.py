@@ -0,0 +1,305 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+# Database connection parameters shared by geofen.py and app.py
+DB_CONFIG = {
+    'dbname': 'vesselDB',
+    'user': 'postgres',
+    'password': 'root',
+    'host': 'localhost',
+    'connect_timeout': 5
+}
+
+# Pool sizing
+POOL_MAX_CONNECTIONS = 10
+POOL_TIMEOUT = 5  # Seconds to wait for a free connection before giving up
+CONNECT_TIMEOUT = 5  # Seconds to wait for the server when opening a connection, if DB_CONFIG has none
+HEALTH_CHECK_INTERVAL = 30  # Seconds a connection may sit idle before it is pinged
+
+# Rows fetched per round trip by stream_rows
+STREAM_CHUNK_ROWS = 10000
+
+
+# Bounded, thread-safe pool that opens connections lazily and blocks until one is free
+class ConnectionPool:
+    def __init__(self, maxconn, timeout=POOL_TIMEOUT, **config):
+        # An unreachable server must not block callback threads indefinitely
+        self._config = {'connect_timeout': CONNECT_TIMEOUT, **config}
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._timeout = timeout
+        self._idle = []  # (connection, last used) pairs, most recently used last
+        self._prepared = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self._timeout):
+            raise pool.PoolError(f"No database connection available after {self._timeout}s")
+        conn = None
+        try:
+            conn = self._checkout()
+            metrics.record_wait(time.perf_counter() - started)
+            yield conn
+        except Exception:
+            if conn is not None and conn.closed:
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._checkin(conn)
+            self._slots.release()
+
+    # Take an idle connection, replacing it if it fails the health check
+    def _checkout(self):
+        with self._lock:
+            idle = self._idle.pop() if self._idle else None
+        if idle is not None:
+            conn, last_used = idle
+            if self._is_healthy(conn, last_used):
+                return conn
+            metrics.record_health_failure()
+            self._discard(conn)
+        conn = psycopg2.connect(**self._config)
+        # Read-only queries; autocommit keeps pooled connections from idling in a transaction
+        conn.autocommit = True
+        metrics.record_connect()
+        return conn
+
+    def _checkin(self, conn):
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    def _discard(self, conn):
+        with self._lock:
+            self._prepared.pop(id(conn), None)
+        if not conn.closed:
+            conn.close()
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except psycopg2.Error:
+            return False
+
+    # Names of the statements already prepared on this connection
+    def prepared_statements(self, conn):
+        with self._lock:
+            return self._prepared.setdefault(id(conn), set())
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+# Counters for time spent waiting on the pool and running queries
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.wait_count = 0
+            self.wait_seconds = 0.0
+            self.wait_max = 0.0
+            self.connects = 0
+            self.health_failures = 0
+            self.queries = {}
+
+    def record_wait(self, seconds):
+        _add_thread_seconds(seconds)
+        with self._lock:
+            self.wait_count += 1
+            self.wait_seconds += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_health_failure(self):
+        with self._lock:
+            self.health_failures += 1
+
+    def record_query(self, name, seconds, rows):
+        _add_thread_seconds(seconds)
+        with self._lock:
+            stats = self.queries.setdefault(name, {'count': 0, 'seconds': 0.0, 'max': 0.0, 'rows': 0})
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['rows'] += rows
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pool_wait': {'count': self.wait_count, 'seconds': self.wait_seconds, 'max': self.wait_max},
+                'connects': self.connects,
+                'health_failures': self.health_failures,
+                'queries': {name: dict(stats) for name, stats in self.queries.items()},
+            }
+
+
+# Database time of the current thread, so callers can attribute it to a request
+_thread_stats = threading.local()
+
+
+def _add_thread_seconds(seconds):
+    _thread_stats.seconds = getattr(_thread_stats, 'seconds', 0.0) + seconds
+
+
+# Function to get the seconds the current thread has spent waiting for and running queries
+def thread_db_seconds():
+    return getattr(_thread_stats, 'seconds', 0.0)
+
+
+metrics = PoolMetrics()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Function to get the process-wide pool, creating it on first use
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(POOL_MAX_CONNECTIONS, **DB_CONFIG)
+    return _pool
+
+
+# Context manager handing out a pooled connection
+@contextmanager
+def get_connection():
+    with get_pool().connection() as conn:
+        yield conn
+
+
+# Function to rewrite %s placeholders into the $n form PREPARE expects
+def _to_prepare_sql(query):
+    counter = iter(range(1, query.count('%s') + 1))
+    return re.sub(r'%s', lambda _: f"${next(counter)}", query)
+
+
+# Function to run a query as a named prepared statement on the given cursor
+def _execute_prepared(conn, cursor, name, query, params):
+    prepared = get_pool().prepared_statements(conn)
+    if name not in prepared:
+        cursor.execute(f"PREPARE {name} AS {_to_prepare_sql(query)}")
+        prepared.add(name)
+    if params:
+        placeholders = ', '.join(['%s'] * len(params))
+        cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+    else:
+        cursor.execute(f"EXECUTE {name}")
+
+
+# Function to run a query and return (columns, rows); a name makes it a prepared statement
+def fetch_all(query, params=None, name=None):
+    with get_connection() as conn:
+        started = time.perf_counter()
+        with conn.cursor() as cursor:
+            if name:
+                _execute_prepared(conn, cursor, name, query, params)
+            else:
+                cursor.execute(query, params)
+            columns = [desc[0] for desc in cursor.description]
+            rows = cursor.fetchall()
+        metrics.record_query(name or 'adhoc', time.perf_counter() - started, len(rows))
+    return columns, rows
+
+
+# Function to run a query and return its first row
+def fetch_one(query, params=None, name=None):
+    _, rows = fetch_all(query, params, name)
+    return rows[0] if rows else None
+
+
+# Function to stream a query's result in chunks through a server-side (named) cursor.
+# Yields (columns, rows) with at most chunk_size rows, so memory stays bounded however
+# large the result is. The pooled connection is held until the generator is exhausted or closed.
+def stream_rows(query, params=None, name='stream', chunk_size=STREAM_CHUNK_ROWS):
+    with get_connection() as conn:
+        started = time.perf_counter()
+        total = 0
+        # Named cursors only live inside a transaction
+        conn.autocommit = False
+        try:
+            with conn.cursor(name=name) as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    total += len(rows)
+                    yield [desc[0] for desc in cursor.description], rows
+        finally:
+            if not conn.closed:
+                conn.rollback()
+                conn.autocommit = True
+            metrics.record_query(name, time.perf_counter() - started, total)
+
+
+# Function to expose pool-wait and query-time metrics
+def get_metrics():
+    return metrics.snapshot()
+
+
+# Function to serve the metrics as JSON from a Flask server
+def register_metrics_route(server, path='/db-metrics'):
+    server.add_url_rule(path, 'db_metrics', lambda: get_metrics())
+
+
+# Function to check whether PostGIS and the vessel_tracks.geom column are set up (see setup_db.py)
+def has_postgis():
+    global _postgis_available
+    if _postgis_available is None:
+        try:
+            # to_regclass resolves vessel_tracks through the search_path, like the app's queries
+            row = fetch_one("""
+                SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'postgis')
+                   AND EXISTS (SELECT 1 FROM pg_attribute
+                               WHERE attrelid = to_regclass('vessel_tracks') AND attname = 'geom' AND NOT attisdropped)
+            """)
+            _postgis_available = bool(row and row[0])
+        except psycopg2.Error as e:
+            print(f"Database error: {e}")
+            return False
+    return _postgis_available
+
+
+# Function to check whether the speed_kn/course_deg/prev_gap_s columns enrich.py fills exist
+def has_enrichment():
+    global _enrichment_available
+    if _enrichment_available is None:
+        try:
+            row = fetch_one("""
+                SELECT COUNT(*) = 3 FROM pg_attribute
+                WHERE attrelid = to_regclass('vessel_tracks') AND NOT attisdropped
+                  AND attname IN ('speed_kn', 'course_deg', 'prev_gap_s')
+            """, name='db_has_enrichment')
+            _enrichment_available = bool(row and row[0])
+        except psycopg2.Error as e:
+            print(f"Database error: {e}")
+            return False
+    return _enrichment_available
+
+
+_postgis_available = None
+_enrichment_available = None
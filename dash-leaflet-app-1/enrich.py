@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+# Ingest-side enrichment of vessel_tracks. Fills speed_kn, course_deg and prev_gap_s once per
+# row from the vessel's previous report (any source) with kinematics.pairwise_kinematics, so
+# geofen.py and app.py read them instead of recomputing. Needs the columns from setup_db.py.
+#
+#   python enrich.py              # Backfill every row not enriched yet, then exit
+#   python enrich.py --follow     # ... then keep enriching rows as they are inserted
+#   python enrich.py --recompute  # Clear the columns first and enrich everything again
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+
+import db
+import ingest
+import kinematics
+
+ENRICH_BATCH_VESSELS = 100  # Vessels enriched per round trip
+UPDATE_PAGE_ROWS = 1000
+
+# Order of a vessel's reports, with a fixed order for several reports in the same second
+ORDER_COLUMNS = ['vesselname', 'sourcedatetime', 'source', 'latitude', 'longitude']
+
+PENDING_QUERY = """
+    SELECT vesselname, MIN(sourcedatetime)
+    FROM vessel_tracks
+    WHERE prev_gap_s IS NULL
+    GROUP BY vesselname
+    ORDER BY vesselname
+    LIMIT %s
+"""
+
+# Each vessel's rows from its earliest pending one on, plus the report just before it
+ROWS_QUERY = """
+    SELECT v.vesselname, r.source, r.sourcedatetime, r.latitude, r.longitude,
+           r.speed_kn, r.course_deg, r.prev_gap_s, r.prev_gap_s IS NULL AS pending, r.context
+    FROM unnest(%s::text[], %s::bigint[]) AS v(vesselname, since)
+    CROSS JOIN LATERAL (
+        (SELECT source, sourcedatetime, latitude, longitude, speed_kn, course_deg, prev_gap_s, TRUE AS context
+         FROM vessel_tracks p
+         WHERE p.vesselname = v.vesselname AND p.sourcedatetime < v.since
+         ORDER BY sourcedatetime DESC, source DESC, latitude DESC, longitude DESC
+         LIMIT 1)
+        UNION ALL
+        (SELECT source, sourcedatetime, latitude, longitude, speed_kn, course_deg, prev_gap_s, FALSE
+         FROM vessel_tracks t
+         WHERE t.vesselname = v.vesselname AND t.sourcedatetime >= v.since)
+    ) r
+"""
+
+UPDATE_QUERY = """
+    UPDATE vessel_tracks t
+    SET speed_kn = v.speed_kn, course_deg = v.course_deg, prev_gap_s = v.prev_gap_s
+    FROM (VALUES %s) AS v(source, vesselname, sourcedatetime, latitude, longitude, speed_kn, course_deg, prev_gap_s)
+    WHERE t.vesselname = v.vesselname AND t.sourcedatetime = v.sourcedatetime
+      AND t.source IS NOT DISTINCT FROM v.source
+      AND t.latitude = v.latitude AND t.longitude = v.longitude
+"""
+UPDATE_TEMPLATE = "(%s::text, %s::text, %s::bigint, %s::float8, %s::float8, %s::float8, %s::float8, %s::float8)"
+
+
+# Function to compute the columns for rows of ROWS_QUERY. Returns the rows whose stored
+# values are missing or differ (a late report also changes the one after it).
+def compute_enrichment(df):
+    df = df.sort_values(ORDER_COLUMNS).reset_index(drop=True)
+    names = df['vesselname'].to_numpy()
+    has_prev = np.r_[False, names[1:] == names[:-1]]
+    prev = np.flatnonzero(has_prev) - 1
+
+    n = len(df)
+    prev_lat, prev_lon, prev_seconds = np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan)
+    prev_lat[has_prev] = df['latitude'].to_numpy(dtype=float)[prev]
+    prev_lon[has_prev] = df['longitude'].to_numpy(dtype=float)[prev]
+    prev_seconds[has_prev] = df['sourcedatetime'].to_numpy(dtype=float)[prev]
+    _, time_diff, speed, course = kinematics.pairwise_kinematics(
+        prev_lat, prev_lon, prev_seconds, df['latitude'], df['longitude'], df['sourcedatetime'])
+
+    # NULL and NaN both read back as NaN, hence the separate pending flag
+    changed = df['pending'].to_numpy(dtype=bool, copy=True)
+    for column, values in (('speed_kn', speed), ('course_deg', course), ('prev_gap_s', time_diff)):
+        stored = df[column].to_numpy(dtype=float)
+        changed |= ~((stored == values) | (np.isnan(stored) & np.isnan(values)))
+    changed &= ~df['context'].to_numpy(dtype=bool)
+
+    out = df.loc[changed, ['source', 'vesselname', 'sourcedatetime', 'latitude', 'longitude']]
+    out = out.assign(speed_kn=speed[changed], course_deg=course[changed], prev_gap_s=time_diff[changed])
+    return out
+
+
+# Function to enrich the next batch of vessels with pending rows; returns (vessels, rows written)
+def enrich_pending(batch_vessels=ENRICH_BATCH_VESSELS):
+    _, pending = db.fetch_all(PENDING_QUERY, (batch_vessels,), name='enrich_pending')
+    if not pending:
+        return 0, 0
+    vessel_names, since = zip(*pending)
+    columns, rows = db.fetch_all(ROWS_QUERY, (list(vessel_names), list(since)), name='enrich_rows')
+    updates = compute_enrichment(pd.DataFrame(rows, columns=columns))
+
+    values = [
+        (source, name, int(seconds), float(lat), float(lon), float(speed), float(course), float(gap))
+        for source, name, seconds, lat, lon, speed, course, gap in updates.itertuples(index=False, name=None)
+    ]
+    with db.get_connection() as conn, conn.cursor() as cursor:
+        execute_values(cursor, UPDATE_QUERY, values, template=UPDATE_TEMPLATE, page_size=UPDATE_PAGE_ROWS)
+    return len(pending), len(values)
+
+
+# Function to enrich every pending row; returns how many rows were written
+def backfill(verbose=False):
+    total = 0
+    while True:
+        vessels, written = enrich_pending()
+        if vessels == 0:
+            return total
+        if written == 0:
+            # Pending rows that cannot be matched back (e.g. NULL coordinates); stop instead of spinning
+            print(f"Enrichment stalled on {vessels} vessels with rows that cannot be updated")
+            return total
+        total += written
+        if verbose:
+            print(f"  {vessels} vessels, {written} rows ({total} total)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill vessel_tracks.speed_kn, course_deg and prev_gap_s")
+    parser.add_argument('--follow', action='store_true', help="Keep enriching rows as they are inserted")
+    parser.add_argument('--recompute', action='store_true', help="Clear the columns and enrich every row again")
+    args = parser.parse_args()
+
+    print("Connecting to database\n	->%s@%s/%s" % (db.DB_CONFIG['user'], db.DB_CONFIG['host'], db.DB_CONFIG['dbname']))
+    try:
+        if not db.has_enrichment():
+            print("The enrichment columns are missing; run setup_db.py first.")
+            sys.exit(1)
+        if args.recompute:
+            with db.get_connection() as conn, conn.cursor() as cursor:
+                cursor.execute("UPDATE vessel_tracks SET speed_kn = NULL, course_deg = NULL, prev_gap_s = NULL")
+
+        print("Backfilling:")
+        print(f"Enriched {backfill(verbose=True)} rows.")
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        sys.exit(1)
+
+    if args.follow:
+        # Same LISTEN/NOTIFY (or polling) feed the dashboards use; each refresh drains the backlog
+        feed = ingest.IngestFeed(lambda: backfill() > 0)
+        feed.start()
+        print("Following new rows (Ctrl+C to stop).")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            feed.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import io
+import threading
+
+import pandas as pd
+from flask import Response, request, stream_with_context
+
+try:
+    import pyarrow as pa  # Optional: Parquet export
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+import db
+
+# Same columns and formatting the original in-memory CSV export produced
+EXPORT_QUERY = """
+SELECT vesselname, sourcedatetime, latitude, longitude FROM vessel_tracks
+WHERE sourcedatetime BETWEEN %s AND %s AND vesselname = ANY(%s)
+ORDER BY vesselname, sourcedatetime
+"""
+
+# Exports running at once; each holds a pooled connection until its download finishes,
+# so slow clients can't tie up the pool the callbacks need
+EXPORT_MAX_CONCURRENT = 2
+EXPORT_RETRY_AFTER = 5  # Seconds a client is asked to wait when all export slots are busy
+_export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+FORMATS = {
+    'csv': ('text/csv', 'vessel_data.csv'),
+    'parquet': ('application/vnd.apache.parquet', 'vessel_data.parquet'),
+}
+
+
+# Export formats this install can produce
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt != 'parquet' or pa is not None]
+
+
+# Function to turn one chunk of rows into the export DataFrame, formatting timestamps in one pass
+def chunk_frame(rows):
+    names, times, lats, lons = zip(*rows)
+    return pd.DataFrame({
+        "Vessel Name": names,
+        "Datetime": pd.to_datetime(pd.Series(times, dtype='int64'), unit='s').dt.strftime('%Y-%m-%d %H:%M:%S'),
+        "Latitude": pd.Series(lats, dtype=float),
+        "Longitude": pd.Series(lons, dtype=float),
+    })
+
+
+# Generator of CSV text, one piece per database chunk; the header comes with the first piece
+def stream_csv(chunks):
+    header = True
+    for _, rows in chunks:
+        yield chunk_frame(rows).to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield pd.DataFrame(columns=["Vessel Name", "Datetime", "Latitude", "Longitude"]).to_csv(index=False)
+
+
+# Write-only file object that hands out what was written since the last drain
+class _ChunkSink(io.RawIOBase):
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+# Generator of Parquet bytes, one row group per database chunk
+def stream_parquet(chunks):
+    schema = pa.schema([
+        ("Vessel Name", pa.string()),
+        ("Datetime", pa.string()),
+        ("Latitude", pa.float64()),
+        ("Longitude", pa.float64()),
+    ])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for _, rows in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk_frame(rows), schema=schema, preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# Function to build the streaming response for one export
+def export_response(start_epoch, end_epoch, vessel_names, fmt='csv'):
+    mimetype, filename = FORMATS[fmt]
+    chunks = db.stream_rows(EXPORT_QUERY, (start_epoch, end_epoch, list(vessel_names)), name='export_vessel_tracks')
+    body = stream_parquet(chunks) if fmt == 'parquet' else stream_csv(chunks)
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+# Function to serve exports from a Flask server:
+# <path>?start=<epoch>&end=<epoch>&vessel=<name>&vessel=<name>&format=csv|parquet
+def register_export_route(server, path='/export'):
+    def export():
+        try:
+            start_epoch = int(request.args['start'])
+            end_epoch = int(request.args['end'])
+        except (KeyError, ValueError):
+            return Response("start and end must be epoch seconds", status=400)
+        vessel_names = request.args.getlist('vessel')
+        fmt = request.args.get('format', 'csv')
+        if not vessel_names or fmt not in available_formats():
+            return Response("select at least one vessel and a supported format", status=400)
+        if not _export_slots.acquire(blocking=False):
+            return Response("too many exports running, try again shortly", status=503,
+                            headers={'Retry-After': str(EXPORT_RETRY_AFTER)})
+        try:
+            response = export_response(start_epoch, end_epoch, vessel_names, fmt)
+        except Exception:
+            _export_slots.release()
+            raise
+        # The slot is freed once the body has been sent or the client went away
+        response.call_on_close(_export_slots.release)
+        return response
+
+    server.add_url_rule(path, 'export', export)
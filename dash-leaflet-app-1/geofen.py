@@ -2,28 +2,43 @@ import dash
 from dash import dcc, html, Input, Output, State, callback
 import dash_leaflet as dl
 import dash_leaflet.express as dlx
+try:
+    import geobuf  # Optional: binary GeoJSON encoding for the vessel layers
+except ImportError:
+    geobuf = None
 import plotly.graph_objects as go
 import pandas as pd
-import psycopg2
+import numpy as np
 from datetime import datetime, timedelta
+import os
 import time
+import threading
+from functools import lru_cache
 import colorsys
 import json  # Add this import
 import math  # Also add this as it's used in haversine calculations
 from dash.exceptions import PreventUpdate
-from shapely.geometry import Point, Polygon
+import data_store
+import collision
+import db
+import geofence_filter
+import ingest
+import instrumentation
+import kinematics
+import map_diff
+import metadata
+import position_store
+import shared_snapshot
+import simplify
+import zone_events
+import zones
 
 # Initialize the Dash app
 app = dash.Dash(__name__)
 server = app.server
-
-# Database connection parameters
-DB_CONFIG = {
-    'dbname': 'vesselDB',
-    'user': 'postgres',
-    'password': 'root',
-    'host': 'localhost'
-}
+instrumentation.instrument(app)
+db.register_metrics_route(server)
+instrumentation.register_metrics_route(server)
 
 # Map configuration
 MAP_CENTER = [1.3521, 103.8198]  # Singapore coordinates
@@ -40,8 +55,99 @@ TRACK_COLORS = [
     "#99FF33", "#3399FF", "#FFCC33", "#CC33FF", "#33FFCC", "#FF33CC", "#CCFF33", "#33CCFF"
 ]
 
+# Fetch only rows newer than the last seen sourcedatetime instead of the whole window
+INCREMENTAL_FETCH = True
+
+# Refresh the store from one background LISTEN/NOTIFY (or polling) feed per process
+# instead of querying the database on every tick of every open dashboard
+BACKGROUND_INGEST = True
+
+# Draw tracks and markers as two GeoJSON layers (markers clustered below CLUSTER_MAX_ZOOM)
+# instead of one Dash component per vessel; False restores the per-component layers
+GEOJSON_RENDER = True
+CLUSTER_MAX_ZOOM = 10
+COORDINATE_DECIMALS = 5  # ~1 m, keeps the GeoJSON payload small
+
+# With several WSGI workers (e.g. gunicorn), let one worker run the ingest feed and publish
+# the store as a memory-mapped snapshot that the other workers read instead of polling
+SHARED_SNAPSHOT = True
+# A worker needing a longer time range than the snapshot holds asks the producer for it and
+# waits this long for it to be published before querying the database itself
+SNAPSHOT_WAIT_SECONDS = 10
+
+# Send only added, moved and removed vessels to the map on new data; full redraws are
+# kept for geofence, source and zoom changes. Diffs patch plain GeoJSON, so no geobuf.
+DIFF_UPDATES = True
+GEOJSON_FORMAT = 'geobuf' if geobuf is not None and not DIFF_UPDATES else 'geojson'
+
+# Track simplification before drawing polylines (see simplify.DEFAULT_CONFIG)
+SIMPLIFY_CONFIG = dict(simplify.DEFAULT_CONFIG)
+
+# Dead reckoning horizons in minutes for the predicted-positions layer and the selected vessel
+PREDICTION_HORIZONS = (5, 15, 30, 60)
+
+# Close-quarters alerts shown in the sidebar (thresholds are in collision.py)
+COLLISION_ALERTS_SHOWN = 10
+
+# Zone enter/exit events listed under the vessel table
+ZONE_EVENTS_SHOWN = 20
+
+# Send the geofence and source filters to PostGIS instead of filtering in pandas.
+# Needs setup_db.py to have created vessel_tracks.geom; falls back to Python otherwise.
+GEOFENCE_PUSHDOWN = False
+
+# Columns returned by the database, and the ones that identify a single position report
+RAW_TRACK_COLUMNS = ['source', 'vesselname', 'sourcedatetime', 'latitude', 'longitude', 'timestamp']
+TRACK_KEY_COLUMNS = ['source', 'vesselname', 'sourcedatetime', 'latitude', 'longitude']
+# Order of a vessel's reports, with reports in the same second in enrich.py's order
+TRACK_ORDER_COLUMNS = ['vesselname', 'timestamp', 'source', 'latitude', 'longitude']
+
+# Speed, course and gap stored by enrich.py, read when setup_db.py has added the columns;
+# enriched is False for rows the job has not reached yet
+ENRICHED_COLUMNS = ['speed_kn', 'course_deg', 'prev_gap_s', 'enriched']
+
 # Global variable to store vessel data
 vessel_data_df = pd.DataFrame()
+vessel_data_watermark = None  # Latest sourcedatetime held in vessel_data_df
+vessel_data_hours = None  # Time range the store was loaded for
+vessel_data_lock = threading.Lock()
+
+# The store holds the longest time range any session asked for within WINDOW_IDLE_SECONDS;
+# sessions with shorter ranges get slices of it, so different ranges don't reload each other
+WINDOW_IDLE_SECONDS = 300
+window_requests = {}  # Time range (hours) -> monotonic time a session last asked for it
+window_slices = {}  # Time range (hours) -> (store DataFrame it was cut from, slice)
+snapshot_waits = {}  # Time range (hours) -> monotonic time this worker started waiting for the snapshot to hold it
+window_lock = threading.Lock()
+filtered_view_lock = threading.Lock()
+
+# Distinct sources, refreshed by TTL and by every incremental fetch
+metadata_cache = metadata.MetadataCache()
+
+# Last map contents sent to each tab, for DIFF_UPDATES
+map_render_state = map_diff.RenderState()
+
+# Server-side versions of vessel_data_df, referenced from the browser by token
+vessel_store = data_store.DataStore()
+
+# Per-vessel ring buffers of the same window, for O(1) latest-position lookups
+positions = position_store.PositionStore()
+position_store.register_stats_route(positions, server)
+
+# Named geofences saved from the map, shared by every session
+zone_store = zones.ZoneStore()
+
+# Enter/exit events against the saved zones, fed with the positions as they arrive
+zone_event_engine = zone_events.ZoneEventEngine()
+
+# Snapshot of vessel_data_df shared between worker processes, for SHARED_SNAPSHOT. The file is
+# keyed on the database and this app's directory, unless VESSEL_SNAPSHOT_PATH is set.
+SNAPSHOT_KEY = f"{db.DB_CONFIG.get('host')}:{db.DB_CONFIG.get('port', 5432)}/{db.DB_CONFIG.get('dbname')}@{os.path.dirname(os.path.abspath(__file__))}"
+vessel_snapshot = shared_snapshot.SharedSnapshot(shared_snapshot.snapshot_path(SNAPSHOT_KEY))
+
+# CPA/TCPA candidate pairs, updated for the vessels that reported since the last data version
+collision_monitor = collision.CollisionMonitor()
+collision_lock = threading.Lock()
 
 # App layout with improved UI/UX
 app.layout = html.Div([
@@ -72,8 +178,36 @@ app.layout = html.Div([
                 value=[],  # Default value
                 style={'marginBottom': '20px'}
             ),
+            html.Label("Zones (vessels inside):", style={'fontWeight': 'bold'}),
+            dcc.Checklist(
+                id='zone-filter',
+                options=[],  # Saved zones with their vessel counts, refreshed every tick
+                value=[],
+                style={'marginBottom': '10px'}
+            ),
+            dcc.Input(id='zone-name', type='text', placeholder='Name for the drawn area',
+                      style={'width': '100%', 'marginBottom': '5px'}),
+            dcc.Dropdown(
+                id='zone-kind',
+                options=[{'label': kind, 'value': kind} for kind in zones.ZONE_KINDS],
+                value='other',
+                clearable=False,
+                style={'marginBottom': '5px'}
+            ),
+            html.Div([
+                html.Button("Save zone", id='save-zone', n_clicks=0),
+                html.Button("Delete selected", id='delete-zones', n_clicks=0, style={'marginLeft': '5px'}),
+            ], style={'marginBottom': '20px'}),
+            dcc.Checklist(
+                id='prediction-toggle',
+                options=[{'label': f" Predicted positions ({'/'.join(map(str, PREDICTION_HORIZONS))} min)", 'value': 'show'}],
+                value=[],
+                style={'marginBottom': '20px'}
+            ),
             html.Div(id='vessel-count', style={'marginTop': '20px', 'fontWeight': 'bold'}),  # Added vessel-count div
-            html.Div(id='selected-vessel-info', style={'marginTop': '20px'})
+            html.Div(id='track-stats', style={'marginTop': '5px', 'fontSize': '12px', 'color': '#555'}),
+            html.Div(id='selected-vessel-info', style={'marginTop': '20px'}),
+            html.Div(id='collision-alerts', style={'marginTop': '20px', 'fontSize': '12px'})
         ], style={
             'width': '15%', 'padding': '20px', 'backgroundColor': '#f8f9fa',
             'borderRight': '1px solid #ddd', 'boxShadow': '2px 0 5px rgba(0,0,0,0.1)', 'height': '100vh', 'overflowY': 'auto'
@@ -86,6 +220,26 @@ app.layout = html.Div([
                     dl.TileLayer(),
                     dl.LayerGroup(id="vessel-tracks"),
                     dl.LayerGroup(id="vessel-markers"),
+                    # Single-layer render path used when GEOJSON_RENDER is on
+                    dl.GeoJSON(
+                        id="vessel-tracks-geojson",
+                        format=GEOJSON_FORMAT,
+                        style={'variable': 'dashExtensions.default.trackStyle'},
+                    ),
+                    dl.GeoJSON(
+                        id="vessel-markers-geojson",
+                        format=GEOJSON_FORMAT,
+                        pointToLayer={'variable': 'dashExtensions.default.vesselPoint'},
+                        cluster=True,
+                        zoomToBoundsOnClick=True,
+                        superClusterOptions={'radius': 60, 'maxZoom': CLUSTER_MAX_ZOOM},
+                    ),
+                    dl.GeoJSON(
+                        id="prediction-geojson",
+                        format=GEOJSON_FORMAT,
+                        style={'variable': 'dashExtensions.default.predictionStyle'},
+                        pointToLayer={'variable': 'dashExtensions.default.predictionPoint'},
+                    ),
                     dl.LayerGroup(id="geofence-layer"),
                     dl.LayerGroup(id="trajectory-layer"),
                     dl.FeatureGroup([
@@ -115,13 +269,21 @@ app.layout = html.Div([
                 'backgroundColor': '#f0f0f0',
                 'borderRadius': '5px',
                 'boxShadow': '0 2px 5px rgba(0,0,0,0.1)'
+            }),
+            html.Div(id='zone-events', style={
+                'marginTop': '10px',
+                'padding': '10px',
+                'backgroundColor': '#f0f0f0',
+                'borderRadius': '5px',
+                'boxShadow': '0 2px 5px rgba(0,0,0,0.1)'
             })
         ], style={'width': '75%', 'display': 'inline-block', 'verticalAlign': 'top', 'padding': '20px'})
     ], style={'display': 'flex'}),
 
-    # Hidden divs for storage
+    # Hidden divs for storage; vessel-data only holds a version token for vessel_store
     html.Div(id='geofence-data', style={'display': 'none'}),
-    html.Div(id='vessel-data', style={'display': 'none'}),
+    dcc.Store(id='vessel-data'),
+    dcc.Store(id='map-render-state'),
     html.Div(id='selected-vessel', style={'display': 'none'}),
 
     # Interval for updating data
@@ -136,36 +298,53 @@ app.layout = html.Div([
 def epoch_to_datetime(epoch_time):
     return datetime.fromtimestamp(epoch_time)
 
+# Function to check the time range typed into time-range-input; None while it is
+# cleared or not a positive number
+def parse_hours(hours_ago):
+    try:
+        hours_ago = float(hours_ago)
+    except (TypeError, ValueError):
+        return None
+    return hours_ago if math.isfinite(hours_ago) and hours_ago > 0 else None
+
 # Updated fetch_all_vessel_data function to use user-defined time range
 def fetch_all_vessel_data(hours_ago=1):
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
+    hours_ago = parse_hours(hours_ago)
+    if hours_ago is None:
+        return pd.DataFrame()
 
-        # Calculate timestamp for the user-defined time range
-        time_ago = int((datetime.now() - timedelta(hours=hours_ago)).timestamp())
+    # Calculate timestamp for the user-defined time range
+    time_ago = int((datetime.now() - timedelta(hours=hours_ago)).timestamp())
 
+    df = fetch_vessel_rows(time_ago)
+    if df is None:
+        return pd.DataFrame()
+    if df.empty:
+        print("No data returned from the database.")
+        return df  # Return an empty DataFrame with the correct columns
+
+    # Calculate speed and course
+    return calculate_speed_and_course(df)
+
+# Function to fetch raw vessel rows at or after the given epoch
+def fetch_vessel_rows(since_epoch):
+    try:
         # Query to fetch all vessel data
         query = """
             SELECT 
                 source, vesselname, sourcedatetime, 
-                latitude, longitude
+                latitude, longitude{enriched}
             FROM vessel_tracks
             WHERE sourcedatetime >= %s
             ORDER BY sourcedatetime DESC
         """
-        params = [time_ago]
+        params = [since_epoch]
 
-        cursor.execute(query, params)
-        columns = [desc[0] for desc in cursor.description]
-        data = cursor.fetchall()
-
-        # Check if the query returned any data
-        if not data:
-            print("No data returned from the database.")
-            cursor.close()
-            conn.close()
-            return pd.DataFrame(columns=columns)  # Return an empty DataFrame with the correct columns
+        if db.has_enrichment():
+            query = query.format(enriched=", speed_kn, course_deg, prev_gap_s, prev_gap_s IS NOT NULL AS enriched")
+            columns, data = db.fetch_all(query, params, name='geofen_vessel_rows_enriched')
+        else:
+            columns, data = db.fetch_all(query.format(enriched=''), params, name='geofen_vessel_rows')
 
         # Create a DataFrame from the query result
         df = pd.DataFrame(data, columns=columns)
@@ -173,29 +352,289 @@ def fetch_all_vessel_data(hours_ago=1):
         # Convert sourcedatetime to datetime
         df['timestamp'] = pd.to_datetime(df['sourcedatetime'], unit='s')
 
-        # Calculate speed and course
-        df = calculate_speed_and_course(df)
-
-        cursor.close()
-        conn.close()
-
         return df
 
     except Exception as e:
         print(f"Database error: {e}")
-        return pd.DataFrame()
+        return None
+
+# Function to update the in-process store with only the rows newer than the watermark
+def update_vessel_data_incremental(hours_ago=1):
+    global vessel_data_df, vessel_data_watermark, vessel_data_hours
+    hours_ago = parse_hours(hours_ago)
+    if hours_ago is None:
+        return vessel_data_df
+
+    with vessel_data_lock:
+        # Reload the whole window on first use or when it grows; a shorter one is just trimmed
+        if vessel_data_watermark is None or hours_ago > vessel_data_hours or vessel_data_df.empty:
+            df = fetch_all_vessel_data(hours_ago)
+            df.attrs['hours'] = hours_ago
+            vessel_data_df = df
+            vessel_data_hours = hours_ago
+            reload_positions(df, hours_ago)
+            vessel_data_watermark = int(df['sourcedatetime'].max()) if not df.empty else None
+            return vessel_data_df
+
+        time_ago = int((datetime.now() - timedelta(hours=hours_ago)).timestamp())
+
+        # Rows sharing the watermark second may still be arriving, so re-read it and dedupe below
+        new_rows = fetch_vessel_rows(vessel_data_watermark)
+        if new_rows is None:
+            return vessel_data_df
+
+        # Trim rows that fell out of the window
+        df = vessel_data_df
+        expired = df['sourcedatetime'] < time_ago
+
+        # Drop the re-read rows already held, so a tick without new data keeps the same version
+        held = df.loc[df['sourcedatetime'] >= vessel_data_watermark, TRACK_KEY_COLUMNS]
+        if not held.empty and not new_rows.empty:
+            known = pd.MultiIndex.from_frame(new_rows[TRACK_KEY_COLUMNS]).isin(pd.MultiIndex.from_frame(held))
+            new_rows = new_rows[~known]
+
+        # Nothing arrived and nothing expired: keep the same DataFrame (and version token)
+        if new_rows.empty and not expired.any() and hours_ago == vessel_data_hours:
+            return vessel_data_df
+
+        trimmed_vessels = set(df.loc[expired, 'vesselname'].unique())
+        df = df[~expired]
+        positions.set_window(hours_ago)
+        positions.evict_before(time_ago)
+        zone_event_engine.forget_before(time_ago)
+        previous_watermark = vessel_data_watermark
+
+        if not new_rows.empty:
+            metadata_cache.observe(new_rows)
+            kept = len(df)
+            df = pd.concat([df, new_rows], ignore_index=True)
+            df = df.drop_duplicates(subset=TRACK_KEY_COLUMNS, keep='first')
+            # Only the rows not held before are tested against the zones
+            record_zone_events(df[df.index >= kept])
+            vessel_data_watermark = max(vessel_data_watermark, int(new_rows['sourcedatetime'].max()))
+
+        # Recompute speed and course only for vessels that gained or lost points
+        touched = trimmed_vessels | set(new_rows['vesselname'].unique())
+        if touched:
+            mask = df['vesselname'].isin(touched)
+            if mask.any():
+                columns = RAW_TRACK_COLUMNS + [column for column in ENRICHED_COLUMNS if column in df]
+                recomputed = calculate_speed_and_course(df.loc[mask, columns].copy())
+                df = pd.concat([df[~mask], recomputed], ignore_index=True)
+
+        vessel_data_df = df.reset_index(drop=True)
+        vessel_data_df.attrs['hours'] = hours_ago
+        vessel_data_hours = hours_ago
+
+        # The re-read rows now carry their speed and course; the store skips ones it already holds
+        if not new_rows.empty:
+            positions.append(vessel_data_df[vessel_data_df['sourcedatetime'] >= previous_watermark])
+        return vessel_data_df
+
+# Function to note that a session shows the last hours_ago hours; returns the time range
+# the store should hold. With a shared snapshot the range is also left for the producer.
+def request_window(hours_ago):
+    with window_lock:
+        window_requests[hours_ago] = time.monotonic()
+    window = current_window()
+    if SHARED_SNAPSHOT:
+        try:
+            vessel_snapshot.request(window)
+        except OSError as e:
+            print(f"Snapshot error: {e}")
+    return window
+
+# Function to get the longest time range asked for recently, forgetting idle ones; the
+# store keeps its current range while no session is asking. The producer also serves the
+# ranges other workers asked for.
+def current_window():
+    now = time.monotonic()
+    with window_lock:
+        for hours, asked_at in list(window_requests.items()):
+            if now - asked_at > WINDOW_IDLE_SECONDS:
+                del window_requests[hours]
+                window_slices.pop(hours, None)
+        windows = list(window_requests)
+    if SHARED_SNAPSHOT and vessel_snapshot.is_producer:
+        windows += vessel_snapshot.requests(WINDOW_IDLE_SECONDS)
+    return max(windows, default=vessel_data_hours or 1)
+
+# Function used by the ingest feed between notifications: True when the store should be
+# refreshed for a different time range
+def window_changed():
+    return current_window() != vessel_data_hours
+
+# Function to note that the snapshot doesn't hold a time range yet; True once this worker
+# has waited SNAPSHOT_WAIT_SECONDS for the producer to publish it
+def snapshot_wait_expired(hours_ago):
+    now = time.monotonic()
+    with window_lock:
+        started = snapshot_waits.setdefault(hours_ago, now)
+    return now - started > SNAPSHOT_WAIT_SECONDS
+
+# Function to get the store's data (or df, a version of it) for one session's time range: the
+# store itself when it holds exactly that range, otherwise a slice cut once per store version
+def vessel_data_for(hours_ago, df=None):
+    if df is None:
+        df = vessel_data_df
+    window = df.attrs.get('hours')
+    if window is None or hours_ago >= window:
+        return df
+    with window_lock:
+        cached = window_slices.get(hours_ago)
+    if cached is not None and cached[0] is df:
+        return cached[1]
+    sliced = slice_window(df, hours_ago)
+    with window_lock:
+        window_slices[hours_ago] = (df, sliced)
+    return sliced
+
+# Function to cut the last hours_ago hours out of the store. Each vessel's first row in the
+# slice loses its speed and course, as if the range had been fetched on its own.
+def slice_window(df, hours_ago):
+    time_ago = int((datetime.now() - timedelta(hours=hours_ago)).timestamp())
+    sliced = df[df['sourcedatetime'] >= time_ago].sort_values(['vesselname', 'timestamp'])
+    if not sliced.empty:
+        offsets = kinematics.group_offsets(sliced['vesselname'].to_numpy())
+        sizes = np.diff(np.append(offsets, len(sliced)))
+        columns = {name: sliced[name].to_numpy(dtype=float, copy=True)
+                   for name in ('speed', 'course', 'distance', 'time_diff')}
+        for values in columns.values():
+            values[offsets] = np.nan
+        # Vessels with only one data point
+        columns['course'][offsets[sizes == 1]] = 0
+        sliced = sliced.assign(**columns)
+    sliced.attrs['hours'] = hours_ago
+    sliced.attrs['since'] = time_ago
+    return sliced
+
+# Function to store one session's view of the data together with the latest positions of the
+# same version, so callbacks holding the token see both as they were; returns the token
+def put_vessel_data(hours_ago):
+    with vessel_data_lock:
+        df = vessel_data_df
+        snapshot = positions.snapshot()
+    view = vessel_data_for(hours_ago, df)
+    return vessel_store.put(view, positions=snapshot.restrict(view.attrs.get('since')))
+
+# Function to get the latest positions stored with a data version, falling back to the latest
+# version's (or the live store's, for data stored without them)
+def get_position_snapshot(vessel_data_token):
+    snapshot = vessel_store.resolve_extras(vessel_data_token).get('positions')
+    return snapshot if snapshot is not None else positions.snapshot()
+
+# Function to load a freshly fetched window into the position store and the zone event engine
+def reload_positions(df, hours_ago):
+    positions.load(df, hours_ago)
+    record_zone_events(df)
+
+# Function to run positions through the zone event engine; it skips the ones already seen
+def record_zone_events(rows):
+    zones_version, index = zone_store.index()
+    zone_event_engine.process(rows, zones_version, index)
+
+# Function used by the ingest feed to refresh the store; True when the data changed
+def refresh_vessel_data():
+    before = vessel_data_df
+    changed = update_vessel_data_incremental(current_window()) is not before
+    if changed:
+        publish_vessel_snapshot()
+    return changed
+
+# Function to publish the store for the other workers when this one is the producer
+def publish_vessel_snapshot():
+    if SHARED_SNAPSHOT and vessel_snapshot.is_producer:
+        df, hours = vessel_data_df, vessel_data_hours
+        try:
+            vessel_snapshot.publish(df, {'hours': hours})
+        except OSError as e:
+            print(f"Snapshot error: {e}")
+
+# Function to adopt the producer's snapshot; False when there is none covering this time range
+def use_vessel_snapshot(hours_ago):
+    global vessel_data_df, vessel_data_watermark, vessel_data_hours
+    try:
+        seq, meta, df = vessel_snapshot.read()
+    except (OSError, ValueError) as e:
+        print(f"Snapshot error: {e}")
+        return False
+    if df is None or (meta.get('hours') or 0) < hours_ago:
+        return False
+
+    with vessel_data_lock:
+        # read() returns the same DataFrame until a new version is published
+        if df is not vessel_data_df:
+            hours = meta['hours']
+            df.attrs['hours'] = hours
+            previous_watermark = vessel_data_watermark
+            same_window = previous_watermark is not None and hours == vessel_data_hours
+            vessel_data_df = df
+            vessel_data_hours = hours
+            vessel_data_watermark = int(df['sourcedatetime'].max()) if not df.empty else None
+            if not same_window:
+                reload_positions(df, hours)
+            else:
+                # Only rows from the previous watermark second on can be new; the position
+                # store and the zone engine skip the ones they already hold
+                time_ago = int((datetime.now() - timedelta(hours=hours)).timestamp())
+                positions.evict_before(time_ago)
+                zone_event_engine.forget_before(time_ago)
+                new_rows = df[df['sourcedatetime'].to_numpy() >= previous_watermark]
+                positions.append(new_rows)
+                record_zone_events(new_rows)
+    return True
+
+ingest_feed = ingest.IngestFeed(refresh_vessel_data, pending=window_changed)
 
 # Updated callback to fetch data based on user-defined time range
 @app.callback(
-    Output('vessel-data', 'children'),
+    Output('vessel-data', 'data'),
     [Input('interval-component', 'n_intervals'),
-     Input('time-range-input', 'value')]
+     Input('time-range-input', 'value')],
+    [State('vessel-data', 'data')]
 )
-def fetch_and_store_vessel_data(n_intervals, hours_ago):
-    global vessel_data_df
+def fetch_and_store_vessel_data(n_intervals, hours_ago, current_token):
+    global vessel_data_df, vessel_data_hours
+    # Keep showing the current data while the time range is cleared or being edited
+    hours_ago = parse_hours(hours_ago)
+    if hours_ago is None:
+        return dash.no_update
+    window = request_window(hours_ago)
+
+    if BACKGROUND_INGEST and SHARED_SNAPSHOT and not vessel_snapshot.try_acquire_producer():
+        # Another worker runs the ingest feed; read its snapshot instead of the database
+        if use_vessel_snapshot(window):
+            with window_lock:
+                snapshot_waits.pop(window, None)
+        elif snapshot_wait_expired(window):
+            # It hasn't published this time range in time; fetch it here
+            update_vessel_data_incremental(window)
+        else:
+            # Give the producer time to pick up the request (or to publish its first version)
+            return dash.no_update
+        token = put_vessel_data(hours_ago)
+        return dash.no_update if token == current_token else token
+
+    if BACKGROUND_INGEST:
+        # The ingest feed keeps the store current; ticks only hand out the latest token
+        ingest_feed.start()
+        if window != vessel_data_hours:
+            update_vessel_data_incremental(window)
+            publish_vessel_snapshot()
+        token = put_vessel_data(hours_ago)
+        return dash.no_update if token == current_token else token
+
     # Fetch the latest data from the database using the user-defined time range
-    vessel_data_df = fetch_all_vessel_data(hours_ago)
-    return vessel_data_df.to_json(date_format='iso', orient='split')
+    if INCREMENTAL_FETCH:
+        update_vessel_data_incremental(window)
+    else:
+        df = fetch_all_vessel_data(window)
+        df.attrs['hours'] = window
+        with vessel_data_lock:
+            vessel_data_df = df
+            vessel_data_hours = window
+            reload_positions(df, window)
+    return put_vessel_data(hours_ago)
 
 # Add a callback to dynamically update the source filter options and default values
 @app.callback(
@@ -206,20 +645,11 @@ def fetch_and_store_vessel_data(n_intervals, hours_ago):
 )
 def update_source_filter_options(n_intervals, current_selection):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
+        # Distinct sources come from the metadata cache, kept current by the incremental feed
+        sources = metadata_cache.sources()
 
-        # Query to fetch distinct sources
-        query = "SELECT DISTINCT source FROM vessel_tracks"
-        cursor.execute(query)
-        sources = cursor.fetchall()
-
-        # Close the connection
-        cursor.close()
-        conn.close()
-
-        # Filter out NULL values and convert to the format required by dcc.Checklist
-        options = [{'label': source[0], 'value': source[0]} for source in sources if source[0] is not None]
+        # Convert to the format required by dcc.Checklist
+        options = [{'label': source, 'value': source} for source in sources]
         all_values = [source['value'] for source in options]
 
         # Preserve the user's current selection, but ensure it only includes valid options
@@ -234,47 +664,208 @@ def update_source_filter_options(n_intervals, current_selection):
         print(f"Database error: {e}")
         return [], []
 
+# Function to get, for a data version, how many vessels are inside each saved zone.
+# Only the latest position of every vessel is tagged, in one STRtree query, so this
+# stays cheap on every tick.
+def get_zone_occupancy(vessel_data_token):
+    zones_version, index = zone_store.index()
+    return compute_zone_occupancy(get_position_snapshot(vessel_data_token), zones_version, index)
+
+# Keyed on the positions stored with the token, like compute_predictions
+@lru_cache(maxsize=4)
+def compute_zone_occupancy(position_snapshot, zones_version, index):
+    latest = position_snapshot.latest_positions()
+    _, zone_ids = index.tag(latest['latitude'].to_numpy(), latest['longitude'].to_numpy())
+    return pd.Series(zone_ids, dtype=object).value_counts().to_dict()
+
+# Callback to save and delete zones and to list them with their vessel counts
+@app.callback(
+    [Output('zone-filter', 'options'),
+     Output('zone-filter', 'value')],
+    [Input('interval-component', 'n_intervals'),
+     Input('save-zone', 'n_clicks'),
+     Input('delete-zones', 'n_clicks')],
+    [State('zone-filter', 'value'),
+     State('zone-name', 'value'),
+     State('zone-kind', 'value'),
+     State('draw', 'geojson'),
+     State('vessel-data', 'data')]
+)
+def update_zone_options(n_intervals, save_clicks, delete_clicks, selected_zones, zone_name, zone_kind,
+                        draw_geojson, vessel_data_token):
+    ctx = dash.callback_context
+    trigger = ctx.triggered[0]['prop_id'] if ctx.triggered else ''
+    selected_zones = list(selected_zones or [])
+
+    if trigger == 'save-zone.n_clicks':
+        # The most recently drawn area becomes the zone
+        drawn = drawn_geofences(draw_geojson)
+        if drawn and zone_name and zone_name.strip():
+            zone_id = zone_store.save(zone_name.strip(), zone_kind or 'other', drawn[-1])
+            if zone_id is not None:
+                selected_zones.append(zone_id)
+    elif trigger == 'delete-zones.n_clicks':
+        zone_store.delete(selected_zones)
+        selected_zones = []
+
+    saved_zones = zone_store.all()
+    counts = get_zone_occupancy(vessel_data_token) if vessel_data_token else {}
+    options = [
+        {'label': f" {zone['name']} ({zone['kind']}): {counts.get(zone_id, 0)}", 'value': zone_id}
+        for zone_id, zone in saved_zones.items()
+    ]
+    values = [zone_id for zone_id in dict.fromkeys(selected_zones) if zone_id in saved_zones]
+    return options, values
+
+# Callback to list the latest zone entries and exits, for the checked zones or all of them
+@app.callback(
+    Output('zone-events', 'children'),
+    [Input('vessel-data', 'data'),
+     Input('zone-filter', 'value')]
+)
+def update_zone_events(vessel_data_token, selected_zones):
+    saved_zones = zone_store.all()
+    events = zone_event_engine.events(ZONE_EVENTS_SHOWN, selected_zones)
+    header = html.H4("Zone Entries and Exits", style={'textAlign': 'center', 'marginBottom': '10px'})
+    if not events:
+        return [header, html.P("No zone entries or exits yet.")]
+
+    items = []
+    for event in events:
+        zone = saved_zones.get(event['zone_id'], {'name': f"zone {event['zone_id']}"})
+        verb = "entered" if event['event'] == 'enter' else "left"
+        items.append(html.Li(
+            f"{epoch_to_datetime(event['time']).strftime('%H:%M:%S')} {event['vesselname']} {verb} {zone['name']} ({event['source']})",
+            style={'color': '#27ae60' if event['event'] == 'enter' else '#c0392b'}
+        ))
+    return [header, html.Ul(items)]
+
+# Function to get the source- and geofence-filtered vessel data.
+# Both the table and the map ask for the same view on every update, so it is
+# computed once per (vessel data, geofence, sources) and shared between them.
+def get_filtered_view(vessel_data_token, geofence_json, selected_sources):
+    # Unknown or evicted tokens are served from the latest version
+    if vessel_store.get(vessel_data_token) is None:
+        vessel_data_token, _ = vessel_store.latest()
+    sources_key = tuple(sorted(selected_sources)) if selected_sources else ()
+    with filtered_view_lock:
+        return compute_filtered_view(vessel_data_token, geofence_json, sources_key)
+
+@lru_cache(maxsize=8)
+def compute_filtered_view(vessel_data_token, geofence_json, sources_key):
+    df = vessel_store.resolve(vessel_data_token)
+
+    # None tells callers there is no vessel data at all
+    if df is None or df.empty:
+        return None
+
+    # Let PostGIS pick the rows inside the geofence when it is set up
+    if GEOFENCE_PUSHDOWN and db.has_postgis():
+        pushed_down = fetch_vessels_in_geofence(df.attrs.get('hours', vessel_data_hours or 1), geofence_json, sources_key)
+        if pushed_down is not None:
+            return pushed_down
+
+    # Filter vessels by selected sources
+    if sources_key:
+        df = df[df['source'].isin(sources_key)]
+
+    # Filter vessels within the geofence
+    return df[geofence_filter.filter_mask(df, geofence_json)]
+
+# Function to fetch only the rows inside the geofence (and selected sources) using PostGIS.
+# Each row's previous position is looked up over all sources, as in the full-window path,
+# so speed and course come out the same as calculate_speed_and_course.
+def fetch_vessels_in_geofence(hours_ago, geofence_json, sources_key):
+    time_ago = int((datetime.now() - timedelta(hours=hours_ago)).timestamp())
+    polygon_wkt = geofence_filter.get_geofence(geofence_json).polygon.wkt
+
+    try:
+        query = """
+            SELECT
+                t.source, t.vesselname, t.sourcedatetime,
+                t.latitude, t.longitude,
+                p.latitude AS prev_lat, p.longitude AS prev_lon, p.sourcedatetime AS prev_time,
+                EXISTS (
+                    SELECT 1 FROM vessel_tracks n
+                    WHERE n.vesselname = t.vesselname AND n.sourcedatetime > t.sourcedatetime
+                ) AS has_next
+            FROM vessel_tracks t
+            LEFT JOIN LATERAL (
+                SELECT latitude, longitude, sourcedatetime
+                FROM vessel_tracks p
+                WHERE p.vesselname = t.vesselname
+                  AND p.sourcedatetime >= %s
+                  AND p.sourcedatetime < t.sourcedatetime
+                ORDER BY p.sourcedatetime DESC
+                LIMIT 1
+            ) p ON TRUE
+            WHERE t.sourcedatetime >= %s
+              AND ST_Contains(ST_GeomFromText(%s, 4326), t.geom)
+              AND (%s OR t.source = ANY(%s))
+        """
+        params = [time_ago, time_ago, polygon_wkt, not sources_key, list(sources_key)]
+        columns, data = db.fetch_all(query, params, name='geofen_vessels_in_geofence')
+    except Exception as e:
+        print(f"Database error: {e}")
+        return None
+
+    df = pd.DataFrame(data, columns=columns)
+    df['timestamp'] = pd.to_datetime(df['sourcedatetime'], unit='s')
+    df['distance'], df['time_diff'], df['speed'], df['course'] = kinematics.pairwise_kinematics(
+        df['prev_lat'].astype(float), df['prev_lon'].astype(float), df['prev_time'].astype(float),
+        df['latitude'], df['longitude'], df['sourcedatetime'])
+
+    # Single-point vessels get a course of 0
+    df.loc[df['prev_lat'].isna() & ~df['has_next'].astype(bool), 'course'] = 0
+
+    return df.drop(columns=['prev_lat', 'prev_lon', 'prev_time', 'has_next'])
+
 # Callback to filter vessels within the geofence using shapely and checklist
 @app.callback(
     [Output('vessel-count', 'children'),
      Output('vessel-details', 'children')],
     [Input('geofence-data', 'children'),
      Input('source-filter', 'value')],
-    [State('vessel-data', 'children')]
+    [State('vessel-data', 'data')]
 )
-def filter_vessels_within_geofence(geofence_json, selected_sources, vessel_data_json):
-    if not geofence_json or not vessel_data_json:
+def filter_vessels_within_geofence(geofence_json, selected_sources, vessel_data_token):
+    if not geofence_json or not vessel_data_token:
         return "Vessels in view: 0", "Please draw a geofence to view vessel data."
 
-    # Parse geofence and vessel data
-    geofence = json.loads(geofence_json)
-    df = pd.read_json(vessel_data_json, orient='split')
+    # Source- and geofence-filtered data, shared with the map callback
+    filtered_df = get_filtered_view(vessel_data_token, geofence_json, selected_sources)
 
-    if df.empty:
+    if filtered_df is None:
         return "Vessels in view: 0", "No vessel data available."
 
-    # Filter vessels by selected sources
-    if selected_sources:
-        df = df[df['source'].isin(selected_sources)]
-
-    # Create a shapely polygon from the geofence
-    geofence_polygon = Polygon([(lon, lat) for lat, lon in geofence])
-
-    # Filter vessels within the geofence
-    df['point'] = df.apply(lambda row: Point(row['longitude'], row['latitude']), axis=1)
-    filtered_df = df[df['point'].apply(geofence_polygon.contains)]
-
     if filtered_df.empty:
         return "Vessels in view: 0", "No vessels in selected area."
 
     # Get unique vessel count
     unique_vessels = filtered_df['vesselname'].nunique()
 
-    # Get latest positions for all vessels currently plotted on the map
-    latest_positions = filtered_df.sort_values('timestamp').groupby('vesselname').last().reset_index()
+    # Latest report of every vessel in view, read from the positions of the same data version
+    in_view = filtered_df['vesselname'].unique()
+    latest_positions = get_position_snapshot(vessel_data_token).latest_positions(in_view, selected_sources)
+
+    # A vessel that has since left the geofence shows its last report inside it
+    outside = ~geofence_filter.filter_mask(latest_positions, geofence_json)
+    fallback = set(latest_positions.loc[outside, 'vesselname']) | (set(in_view) - set(latest_positions['vesselname']))
+    if fallback:
+        last_inside = filtered_df[filtered_df['vesselname'].isin(fallback)]
+        last_inside = last_inside.sort_values('sourcedatetime', kind='stable').drop_duplicates('vesselname', keep='last')
+        latest_positions = pd.concat([latest_positions[~outside], last_inside[latest_positions.columns]], ignore_index=True)
 
     # Sort by timestamp with the earliest timing at the top
-    latest_positions = latest_positions.sort_values('timestamp', ascending=False).reset_index()
+    latest_positions = latest_positions.sort_values('timestamp', ascending=False).reset_index(drop=True)
+
+    # Saved zones each vessel is in, tagged in one STRtree query
+    saved_zones = zone_store.all()
+    _, zone_index = zone_store.index()
+    zone_names = [[] for _ in range(len(latest_positions))]
+    for row, zone_id in zip(*zone_index.tag(latest_positions['latitude'].to_numpy(), latest_positions['longitude'].to_numpy())):
+        if zone_id in saved_zones:
+            zone_names[row].append(saved_zones[zone_id]['name'])
 
     # Create vessel details display with beautified table
     details = html.Div([
@@ -286,7 +877,8 @@ def filter_vessels_within_geofence(geofence_json, selected_sources, vessel_data_
                 html.Th("Source", style={'padding': '10px', 'border': '1px solid #ddd', 'backgroundColor': '#f2f2f2'}),
                 html.Th("Speed (knots)", style={'padding': '10px', 'border': '1px solid #ddd', 'backgroundColor': '#f2f2f2'}),
                 html.Th("Course", style={'padding': '10px', 'border': '1px solid #ddd', 'backgroundColor': '#f2f2f2'}),
-                html.Th("Last Update", style={'padding': '10px', 'border': '1px solid #ddd', 'backgroundColor': '#f2f2f2'})
+                html.Th("Last Update", style={'padding': '10px', 'border': '1px solid #ddd', 'backgroundColor': '#f2f2f2'}),
+                html.Th("Zones", style={'padding': '10px', 'border': '1px solid #ddd', 'backgroundColor': '#f2f2f2'})
             ])),
             html.Tbody([html.Tr([
                 html.Td(_, style={'padding': '10px', 'border': '1px solid #ddd'}),
@@ -294,7 +886,8 @@ def filter_vessels_within_geofence(geofence_json, selected_sources, vessel_data_
                 html.Td(row['source'], style={'padding': '10px', 'border': '1px solid #ddd'}),
                 html.Td(f"{row['speed']:.1f}" if not pd.isna(row['speed']) else "N/A", style={'padding': '10px', 'border': '1px solid #ddd'}),
                 html.Td(f"{row['course']:.1f}°" if not pd.isna(row['course']) else "N/A", style={'padding': '10px', 'border': '1px solid #ddd'}),
-                html.Td(row['timestamp'].strftime('%H:%M:%S'), style={'padding': '10px', 'border': '1px solid #ddd'})
+                html.Td(row['timestamp'].strftime('%H:%M:%S'), style={'padding': '10px', 'border': '1px solid #ddd'}),
+                html.Td(", ".join(zone_names[_]) or "-", style={'padding': '10px', 'border': '1px solid #ddd'})
             ]) for _, row in latest_positions.iterrows()
             ])
         ], style={'width': '100%', 'borderCollapse': 'collapse', 'margin': 'auto'})
@@ -305,40 +898,36 @@ def filter_vessels_within_geofence(geofence_json, selected_sources, vessel_data_
 # Function to calculate speed and course between points
 def calculate_speed_and_course(df):
     # Sort by time for each vessel
-    df = df.sort_values(['vesselname', 'timestamp'])
-    
-    # Group by vessel
-    grouped = df.groupby('vesselname')
-    
-    # Calculate differences between consecutive points
-    df['prev_lat'] = grouped['latitude'].shift(1)
-    df['prev_lon'] = grouped['longitude'].shift(1)
-    df['prev_time'] = grouped['timestamp'].shift(1)
-    
-    # Handle vessels with only one data point
-    single_point_vessels = grouped.filter(lambda x: len(x) == 1).index
-    df.loc[single_point_vessels, 'speed'] = float('nan')  # Set speed to NaN
-    df.loc[single_point_vessels, 'course'] = 0  # Set course to 0
-    
-    # Calculate distance and time differences for other vessels
-    mask = ~df['prev_lat'].isna()
-    df.loc[mask, 'distance'] = df[mask].apply(
-        lambda row: haversine(row['prev_lon'], row['prev_lat'], row['longitude'], row['latitude']), axis=1)
-    df.loc[mask, 'time_diff'] = df[mask].apply(
-        lambda row: (row['timestamp'] - row['prev_time']).total_seconds(), axis=1)
-    
-    # Calculate speed (knots) and course
-    df.loc[mask, 'speed'] = df[mask].apply(
-        lambda row: row['distance'] / (row['time_diff'] / 3600) * 0.539957 if row['time_diff'] > 0 else 0, axis=1)
-    df.loc[mask, 'course'] = df[mask].apply(
-        lambda row: calculate_initial_compass_bearing(
-            (row['prev_lat'], row['prev_lon']),
-            (row['latitude'], row['longitude'])
-        ), axis=1)
-    
-    # Drop unnecessary columns
-    return df.drop(columns=['prev_lat', 'prev_lon', 'prev_time'])
-
+    df = df.sort_values([column for column in TRACK_ORDER_COLUMNS if column in df])
+    names = df['vesselname'].to_numpy()
+
+    # Vessels whose rows are all enriched use the stored values; the rest are computed here
+    stored = np.zeros(len(df), dtype=bool)
+    if 'enriched' in df and len(df):
+        offsets = kinematics.group_offsets(names)
+        enriched = df['enriched'].to_numpy(dtype=bool, na_value=False)
+        stored = np.repeat(np.logical_and.reduceat(enriched, offsets), np.diff(np.append(offsets, len(df))))
+
+    distance, time_diff, speed, course = (np.full(len(df), np.nan) for _ in range(4))
+    if stored.any():
+        distance[stored], time_diff[stored], speed[stored], course[stored] = kinematics.stored_track_kinematics(
+            names[stored], df['latitude'].to_numpy(dtype=float)[stored], df['longitude'].to_numpy(dtype=float)[stored],
+            df['speed_kn'].to_numpy(dtype=float)[stored],
+            df['course_deg'].to_numpy(dtype=float)[stored], df['prev_gap_s'].to_numpy(dtype=float)[stored])
+    if not stored.all():
+        # Vectorized over all vessels; per-vessel boundaries come from the sorted vessel names
+        seconds = (df['timestamp'] - pd.Timestamp(0)).dt.total_seconds().to_numpy()
+        computed = ~stored
+        distance[computed], time_diff[computed], speed[computed], course[computed] = kinematics.track_kinematics(
+            names[computed], seconds[computed], df['latitude'].to_numpy()[computed], df['longitude'].to_numpy()[computed])
+
+    df['speed'] = speed
+    df['course'] = course
+    df['distance'] = distance
+    df['time_diff'] = time_diff
+    return df
+
+# Reference implementations of the per-point formulas used by kinematics.py
 # Haversine formula to calculate distance between two points
 def haversine(lon1, lat1, lon2, lat2):
     # Convert decimal degrees to radians
@@ -399,78 +988,258 @@ def create_last_position_marker(row):
         id={'type': 'vessel-marker', 'index': row['vesselname']}
     )
 
-# Callback to filter vessels and plot tracks and markers
+# Function to create a GeoJSON LineString feature for one vessel's track
+def create_track_feature(vessel_name, group):
+    coordinates = group[['longitude', 'latitude']].round(COORDINATE_DECIMALS).to_numpy().tolist()
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'LineString', 'coordinates': coordinates},
+        'properties': {'color': get_vessel_color(vessel_name)},
+    }
+
+# Function to create a GeoJSON Point feature for a vessel's last known position
+def create_marker_feature(row):
+    course = 0 if pd.isna(row['course']) else round(float(row['course']), 1)
+    tooltip = f"Vessel: {row['vesselname']} | Bearing: {course:.1f}° | Source: {row['source']} | Last Reported: {row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}"
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [round(float(row['longitude']), COORDINATE_DECIMALS),
+                                                      round(float(row['latitude']), COORDINATE_DECIMALS)]},
+        'properties': {'vesselname': row['vesselname'], 'color': get_vessel_color(row['vesselname']),
+                       'course': course, 'tooltip': tooltip},
+    }
+
+# Function to wrap features into a FeatureCollection, encoded as geobuf when enabled
+def encode_geojson(features):
+    geojson = {'type': 'FeatureCollection', 'features': features}
+    if GEOJSON_FORMAT == 'geobuf':
+        return dlx.geojson_to_geobuf(geojson)
+    return geojson
+
+# Function to describe the track and marker layers of the simplified data.
+# Returns, per layer, a signature per vessel (changes when the vessel's item must be
+# redrawn) and a function building that vessel's map item.
+def build_vessel_layers(simplified_df):
+    grouped = simplified_df.groupby('vesselname')
+    latest = grouped.tail(1).set_index('vesselname', drop=False)
+    counts = grouped.size().reindex(latest.index)
+    courses = latest['course'].fillna(-1)
+
+    marker_signatures = dict(zip(latest.index, zip(latest['latitude'], latest['longitude'], courses,
+                                                   latest['sourcedatetime'])))
+    # A track's ends alone miss redraws: points expiring at the head while simplification
+    # keeps the count, or a different point kept in between. Sum a hash of every kept point.
+    point_hashes = pd.util.hash_pandas_object(simplified_df[['sourcedatetime', 'latitude', 'longitude']], index=False)
+    track_hashes = point_hashes.groupby(simplified_df['vesselname']).sum().reindex(latest.index)
+    firsts = grouped['sourcedatetime'].first().reindex(latest.index)
+    track_signatures = dict(zip(latest.index, zip(counts, firsts, latest['sourcedatetime'], track_hashes)))
+
+    if GEOJSON_RENDER:
+        def build_track(name):
+            return create_track_feature(name, grouped.get_group(name))
+
+        def build_marker(name):
+            return create_marker_feature(latest.loc[name])
+    else:
+        def build_track(name):
+            group = grouped.get_group(name)
+            return create_track_polyline(list(zip(group['latitude'], group['longitude'])), name)
+
+        def build_marker(name):
+            return create_last_position_marker(latest.loc[name])
+
+    return {
+        'tracks': (track_signatures, build_track),
+        'markers': (marker_signatures, build_marker),
+    }
+
+# Callback to filter vessels and plot tracks and markers.
+# Geofence, source and zoom changes redraw everything; new vessel data only sends the
+# vessels that were added, moved or removed since this tab's last update (DIFF_UPDATES).
 @app.callback(
     [Output('vessel-tracks', 'children'),
-     Output('vessel-markers', 'children')],
+     Output('vessel-markers', 'children'),
+     Output('vessel-tracks-geojson', 'data'),
+     Output('vessel-markers-geojson', 'data'),
+     Output('track-stats', 'children'),
+     Output('map-render-state', 'data')],
     [Input('geofence-data', 'children'),
-     Input('source-filter', 'value')],
-    [State('vessel-data', 'children')]
+     Input('source-filter', 'value'),
+     Input('map', 'zoom'),
+     Input('vessel-data', 'data')],
+    [State('map-render-state', 'data')]
 )
-def update_map_with_tracks_and_markers(geofence_json, selected_sources, vessel_data_json):
-    if not geofence_json or not vessel_data_json:
-        return [], []
-
-    # Parse geofence and vessel data
-    geofence = json.loads(geofence_json)
-    df = pd.read_json(vessel_data_json, orient='split')
-
-    if df.empty:
-        return [], []
-
-    # Filter vessels by selected sources
-    if selected_sources:
-        df = df[df['source'].isin(selected_sources)]
-
-    # Create a shapely polygon from the geofence
-    geofence_polygon = Polygon([(lon, lat) for lat, lon in geofence])
-
-    # Filter vessels within the geofence
-    df['point'] = df.apply(lambda row: Point(row['longitude'], row['latitude']), axis=1)
-    filtered_df = df[df['point'].apply(geofence_polygon.contains)]
-
-    if filtered_df.empty:
-        return [], []
-
-    # Create tracks and markers for the map
-    tracks = []
-    markers = []
-
-    for vessel_name, group in filtered_df.groupby('vesselname'):
-        # Sort by timestamp
-        group = group.sort_values('timestamp')
+def update_map_with_tracks_and_markers(geofence_json, selected_sources, zoom, vessel_data_token, render_state):
+    render_state = render_state or {}
+    client_id = render_state.get('client') or map_render_state.new_client_id()
 
-        # Create track coordinates
-        coordinates = list(zip(group['latitude'], group['longitude']))
-
-        # Create track as a polyline
-        tracks.append(create_track_polyline(coordinates, vessel_name))
-
-        # Create marker for the last known position
-        latest = group.iloc[-1]
-        markers.append(create_last_position_marker(latest))
+    # Without diffing, new data alone does not redraw the map
+    ctx = dash.callback_context
+    data_tick = bool(ctx.triggered) and all(t['prop_id'] == 'vessel-data.data' for t in ctx.triggered)
+    if data_tick and not DIFF_UPDATES:
+        raise PreventUpdate
 
-    return tracks, markers
+    empty_geojson = encode_geojson([])
+    if not geofence_json or not vessel_data_token:
+        map_render_state.drop(client_id)
+        return [], [], empty_geojson, empty_geojson, "", {'client': client_id, 'seq': None}
+
+    # Source- and geofence-filtered data, shared with the vessel table callback
+    filtered_df = get_filtered_view(vessel_data_token, geofence_json, selected_sources)
+
+    if filtered_df is None or filtered_df.empty:
+        map_render_state.drop(client_id)
+        return [], [], empty_geojson, empty_geojson, "", {'client': client_id, 'seq': None}
+
+    # Sort by vessel and timestamp, then simplify all tracks at once for the current zoom
+    filtered_df = filtered_df.sort_values(['vesselname', 'timestamp'])
+    keep, stats = simplify.simplify_tracks(
+        filtered_df['vesselname'].to_numpy(),
+        (filtered_df['timestamp'] - pd.Timestamp(0)).dt.total_seconds().to_numpy(),
+        filtered_df['latitude'].to_numpy(), filtered_df['longitude'].to_numpy(),
+        zoom, SIMPLIFY_CONFIG)
+    simplified_df = filtered_df[keep]
+
+    layers = build_vessel_layers(simplified_df)
+    render_key = [geofence_json, sorted(selected_sources or []), zoom, GEOJSON_RENDER]
+    previous = map_render_state.get(client_id, render_state.get('seq')) if DIFF_UPDATES else None
+
+    if previous is not None and previous['key'] == render_key:
+        # Send only the vessels that changed since this tab's last update
+        outputs = {}
+        sent_layers = {}
+        for layer, (signatures, build_item) in layers.items():
+            old_names, old_signatures = previous['layers'][layer]
+            patch = dash.Patch()
+            target = patch['features'] if GEOJSON_RENDER else patch
+            changed, names = map_diff.patch_layer(target, old_names, old_signatures, signatures, build_item)
+            outputs[layer] = patch if changed else dash.no_update
+            sent_layers[layer] = (names, signatures)
+        seq = map_render_state.save(client_id, render_key, sent_layers)
+        state = {'client': client_id, 'seq': seq}
+        if GEOJSON_RENDER:
+            return (dash.no_update, dash.no_update, outputs['tracks'], outputs['markers'],
+                    simplify.format_stats(stats), state)
+        return (outputs['tracks'], outputs['markers'], dash.no_update, dash.no_update,
+                simplify.format_stats(stats), state)
+
+    # Full render of tracks and markers for the map
+    items = {}
+    sent_layers = {}
+    for layer, (signatures, build_item) in layers.items():
+        names = list(signatures)
+        items[layer] = [build_item(name) for name in names]
+        sent_layers[layer] = (names, signatures)
+    seq = map_render_state.save(client_id, render_key, sent_layers) if DIFF_UPDATES else None
+    state = {'client': client_id, 'seq': seq}
+
+    # One FeatureCollection per layer instead of a component tree per vessel
+    if GEOJSON_RENDER:
+        return ([], [], encode_geojson(items['tracks']), encode_geojson(items['markers']),
+                simplify.format_stats(stats), state)
+    return (items['tracks'], items['markers'], empty_geojson, empty_geojson,
+            simplify.format_stats(stats), state)
+
+# Function to get the dead-reckoned positions of every moving vessel for a data version.
+# Returns the latest positions (indexed by vessel name) and (vessels, horizons) arrays of
+# predicted latitudes and longitudes, in the same row order.
+def get_predictions(vessel_data_token):
+    # Unknown or evicted tokens are served from the latest version, as in get_filtered_view
+    return compute_predictions(get_position_snapshot(vessel_data_token))
+
+# Keyed on the positions stored with the token, so a version is projected from its own data
+@lru_cache(maxsize=4)
+def compute_predictions(position_snapshot):
+    latest = position_snapshot.latest_positions()
+    latest = latest[(latest['speed'] > 0) & latest['course'].notna()].set_index('vesselname')
+    pred_lat, pred_lon = kinematics.dead_reckon(
+        latest['latitude'].to_numpy(), latest['longitude'].to_numpy(),
+        latest['speed'].to_numpy(), latest['course'].to_numpy(), PREDICTION_HORIZONS)
+    return latest, pred_lat, pred_lon
+
+# Function to build the predicted-track features (a line and the horizon points) for some vessels
+def create_prediction_features(predictions, vessel_names):
+    latest, pred_lat, pred_lon = predictions
+    rows = latest.index.get_indexer(vessel_names)
+    rows = rows[rows >= 0]
+    lat = np.round(np.column_stack((latest['latitude'].to_numpy()[rows], pred_lat[rows])), COORDINATE_DECIMALS)
+    lon = np.round(np.column_stack((latest['longitude'].to_numpy()[rows], pred_lon[rows])), COORDINATE_DECIMALS)
+
+    features = []
+    for name, lats, lons in zip(latest.index[rows], lat.tolist(), lon.tolist()):
+        coordinates = [[x, y] for y, x in zip(lats, lons)]
+        properties = {'vesselname': name, 'minutes': list(PREDICTION_HORIZONS)}
+        features.append({'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': coordinates},
+                         'properties': properties})
+        features.append({'type': 'Feature', 'geometry': {'type': 'MultiPoint', 'coordinates': coordinates[1:]},
+                         'properties': properties})
+    return features
+
+# Callback to draw the predicted positions of the vessels in view when the layer is switched on.
+# Predictions are computed once per data version; only the geofence/source filtering is per call.
+@app.callback(
+    Output('prediction-geojson', 'data'),
+    [Input('prediction-toggle', 'value'),
+     Input('geofence-data', 'children'),
+     Input('source-filter', 'value'),
+     Input('vessel-data', 'data')]
+)
+def update_prediction_layer(toggle, geofence_json, selected_sources, vessel_data_token):
+    if not toggle or not geofence_json or not vessel_data_token:
+        return encode_geojson([])
+
+    filtered_df = get_filtered_view(vessel_data_token, geofence_json, selected_sources)
+    if filtered_df is None or filtered_df.empty:
+        return encode_geojson([])
+
+    predictions = get_predictions(vessel_data_token)
+    return encode_geojson(create_prediction_features(predictions, filtered_df['vesselname'].unique()))
+
+# Function to get the close-quarters alerts for a data version, soonest first, and the stats
+# of the monitor update that found them
+def get_collision_alerts(vessel_data_token):
+    # One update-then-alerts at a time, so a version never caches another's alerts
+    with collision_lock:
+        return compute_collision_alerts(get_position_snapshot(vessel_data_token))
+
+# Keyed on the positions stored with the token, like compute_predictions
+@lru_cache(maxsize=4)
+def compute_collision_alerts(position_snapshot):
+    collision_monitor.update(position_snapshot.latest_positions())
+    return collision_monitor.alerts(), collision_monitor.stats
+
+# Callback to list vessel pairs heading for close quarters. Without a geofence the whole
+# fleet is checked; with one, pairs with at least one vessel in view are shown.
+@app.callback(
+    Output('collision-alerts', 'children'),
+    [Input('geofence-data', 'children'),
+     Input('source-filter', 'value'),
+     Input('vessel-data', 'data')]
+)
+def update_collision_alerts(geofence_json, selected_sources, vessel_data_token):
+    if not vessel_data_token:
+        raise PreventUpdate
 
-# Function to calculate trajectory
-def calculate_trajectory(lat, lon, speed, course, duration_minutes=30):
-    # Convert speed from knots to km/h
-    speed_kmh = speed * 1.852
-    
-    # Convert course to radians (0 is north, 90 is east)
-    course_rad = (90 - course) * (math.pi / 180)
-    
-    # Earth's radius in km
-    R = 6378.1
-    
-    # Calculate distance traveled in duration_minutes
-    distance = (speed_kmh * (duration_minutes / 60)) / R
-    
-    # Calculate new position
-    new_lat = lat + (distance * math.cos(course_rad)) * (180 / math.pi)
-    new_lon = lon + (distance * math.sin(course_rad) / math.cos(lat * (math.pi / 180))) * (180 / math.pi)
-    
-    return [(lat, lon), (new_lat, new_lon)]
+    alerts, stats = get_collision_alerts(vessel_data_token)
+    if geofence_json:
+        filtered_df = get_filtered_view(vessel_data_token, geofence_json, selected_sources)
+        in_view = filtered_df['vesselname'].unique() if filtered_df is not None else []
+        alerts = alerts[alerts['vessel_a'].isin(in_view) | alerts['vessel_b'].isin(in_view)]
+
+    header = html.H4(f"Close-quarters alerts ({len(alerts)})")
+    footer = html.P(f"{stats['candidate_pairs']} candidate pairs, {stats['moved']} of {stats['vessels']} vessels updated",
+                    style={'color': '#555'})
+    if alerts.empty:
+        threshold_nm = collision_monitor.threshold_m / collision.METERS_PER_NAUTICAL_MILE
+        horizon_minutes = collision_monitor.horizon_seconds / 60
+        return [header, html.P(f"No vessels within {threshold_nm:g} nm in the next {horizon_minutes:g} min"), footer]
+
+    items = [
+        html.Li(f"{row.vessel_a} / {row.vessel_b}: CPA {row.cpa_nm:.2f} nm in {row.tcpa_minutes:.1f} min"
+                f" (now {row.distance_nm:.2f} nm)")
+        for row in alerts.head(COLLISION_ALERTS_SHOWN).itertuples()
+    ]
+    return [header, html.Ul(items, style={'paddingLeft': '15px', 'color': '#c0392b'}), footer]
 
 # Callback to update current time
 @app.callback(
@@ -481,64 +1250,99 @@ def update_time(n_intervals):
     current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     return f"Current Time: {current_time}"
 
-# Callback for geofence drawing
+# Function to get the rings of every polygon and rectangle drawn on the map, as [[lat, lon], ...]
+def drawn_geofences(geojson):
+    geofences = []
+    for feature in (geojson or {}).get('features', []):
+        if feature['geometry']['type'] in ['Polygon', 'Rectangle']:
+            # Convert coordinates from [lon, lat] to [lat, lon] format
+            geofences.append([[lat, lon] for lon, lat in feature['geometry']['coordinates'][0]])
+    return geofences
+
+# Callback for geofence drawing and zone selection. A single drawn area is stored as before;
+# several areas (drawn or saved zones) are stored by id and filtered through one STRtree.
 @app.callback(
     [Output('geofence-layer', 'children'),
      Output('geofence-data', 'children')],
-    [Input('draw', 'geojson')],
+    [Input('draw', 'geojson'),
+     Input('zone-filter', 'value')],
+    [State('geofence-data', 'children')],
     prevent_initial_call=True
 )
-def handle_geofence(geojson):
-    if not geojson:
+def handle_geofence(geojson, selected_zones, current_geofence_json):
+    drawn = drawn_geofences(geojson)
+    saved_zones = zone_store.all()
+    selected = {zone_id: saved_zones[zone_id] for zone_id in selected_zones or [] if zone_id in saved_zones}
+
+    if not drawn and not selected:
+        geofence_json = None
+    elif len(drawn) == 1 and not selected:
+        geofence_json = json.dumps(drawn[0])
+    else:
+        areas = {f"drawn-{number}": geofence for number, geofence in enumerate(drawn, 1)}
+        areas.update({zone_id: zone['coordinates'] for zone_id, zone in selected.items()})
+        geofence_json = json.dumps(areas)
+
+    # The zone checklist is refreshed every tick; only redraw when the areas changed
+    if geofence_json == current_geofence_json:
         raise PreventUpdate
 
-    if 'features' in geojson and len(geojson['features']) > 0:
-        feature = geojson['features'][-1]  # Get the last drawn feature
-        if feature['geometry']['type'] in ['Polygon', 'Rectangle']:
-            coordinates = feature['geometry']['coordinates'][0]
-            # Convert coordinates from [lon, lat] to [lat, lon] format
-            geofence = [[lat, lon] for lon, lat in coordinates]
-            
-            # Create polygon layer
-            polygon = dl.Polygon(
-                positions=geofence,
-                color='#3388ff',
-                fillColor='#3388ff',
-                fillOpacity=0.1,
-                weight=2
-            )
-            
-            return [polygon], json.dumps(geofence)
-
-    return dash.no_update, dash.no_update
+    # Create polygon layers
+    polygons = [
+        dl.Polygon(positions=geofence, color='#3388ff', fillColor='#3388ff', fillOpacity=0.1, weight=2)
+        for geofence in drawn
+    ]
+    for zone in selected.values():
+        color = zones.ZONE_COLORS.get(zone['kind'], zones.ZONE_COLORS['other'])
+        polygons.append(dl.Polygon(
+            dl.Tooltip(zone['name']),
+            positions=zone['coordinates'],
+            color=color,
+            fillColor=color,
+            fillOpacity=0.1,
+            weight=2
+        ))
+
+    return polygons, geofence_json
 
 # Callback for vessel selection and trajectory
 @app.callback(
     [Output('selected-vessel-info', 'children'),
      Output('trajectory-layer', 'children'),
      Output('selected-vessel', 'children')],
-    [Input({'type': 'vessel-marker', 'index': dash.dependencies.ALL}, 'n_clicks')],
-    [State('vessel-data', 'children')]
+    [Input({'type': 'vessel-marker', 'index': dash.dependencies.ALL}, 'n_clicks'),
+     Input('vessel-markers-geojson', 'clickData')],
+    [State('vessel-data', 'data')]
 )
-def handle_vessel_selection(clicks, vessel_data_json):
-    # Check if there are any clicks or if vessel data is missing
-    if not vessel_data_json or not clicks or all(click is None for click in clicks):
-        raise PreventUpdate
-
+def handle_vessel_selection(clicks, geojson_click, vessel_data_token):
     # Get the context of the triggered callback
     ctx = dash.callback_context
-    if not ctx.triggered or 'index' not in ctx.triggered[0]['prop_id']:
+    if not vessel_data_token or not ctx.triggered:
         raise PreventUpdate
 
-    # Extract the vessel name from the triggered marker
-    triggered_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    try:
-        vessel_name = json.loads(triggered_id)['index']
-    except (KeyError, ValueError):
+    if ctx.triggered[0]['prop_id'] == 'vessel-markers-geojson.clickData':
+        # Clicks on a cluster carry no vessel name
+        vessel_name = ((geojson_click or {}).get('properties') or {}).get('vesselname')
+        if not vessel_name:
+            raise PreventUpdate
+    else:
+        # Check if there are any clicks
+        if not clicks or all(click is None for click in clicks):
+            raise PreventUpdate
+        if 'index' not in ctx.triggered[0]['prop_id']:
+            raise PreventUpdate
+
+        # Extract the vessel name from the triggered marker
+        triggered_id = ctx.triggered[0]['prop_id'].split('.')[0]
+        try:
+            vessel_name = json.loads(triggered_id)['index']
+        except (KeyError, ValueError):
+            raise PreventUpdate
+
+    # Look up vessel data by its version token
+    df = vessel_store.resolve(vessel_data_token)
+    if df is None:
         raise PreventUpdate
-
-    # Parse vessel data
-    df = pd.read_json(vessel_data_json, orient='split')
     vessel_data = df[df['vesselname'] == vessel_name]
 
     if vessel_data.empty:
@@ -556,13 +1360,13 @@ def handle_vessel_selection(clicks, vessel_data_json):
         html.P(f"Last Update: {latest['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}")
     ])
 
-    # Calculate and create trajectory
+    # Predicted track from the cached fleet-wide dead reckoning
     trajectory = []
-    if not pd.isna(latest['speed']) and not pd.isna(latest['course']):
-        traj_coords = calculate_trajectory(
-            latest['latitude'], latest['longitude'],
-            latest['speed'], latest['course']
-        )
+    predicted, pred_lat, pred_lon = get_predictions(vessel_data_token)
+    if vessel_name in predicted.index:
+        row = predicted.index.get_loc(vessel_name)
+        traj_coords = [(float(predicted['latitude'].iloc[row]), float(predicted['longitude'].iloc[row]))]
+        traj_coords += list(zip(pred_lat[row].tolist(), pred_lon[row].tolist()))
         trajectory = [dl.Polyline(
             positions=traj_coords,
             color='red',
@@ -0,0 +1,128 @@
+import json
+from functools import lru_cache
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+from shapely.ops import unary_union
+
+# shapely 2 ships vectorized predicates; older versions fall back to the NumPy kernel below
+HAS_SHAPELY_ARRAYS = hasattr(shapely, 'contains_xy')
+
+# Grid that ZoneIndex snaps points to before querying its tree (~1 km)
+TAG_CELL_DEGREES = 0.01
+CELL_OFFSET = 1 << 20  # Keeps cell numbers positive when packed into one int64
+
+
+# A geofence polygon with its bounding box and a prepared shapely geometry
+class Geofence:
+    def __init__(self, coordinates):
+        # Geofences are stored as [lat, lon] pairs, shapely wants (lon, lat)
+        self.lats = np.array([lat for lat, lon in coordinates], dtype=float)
+        self.lons = np.array([lon for lat, lon in coordinates], dtype=float)
+        self.polygon = Polygon(zip(self.lons, self.lats))
+        self.min_lon, self.min_lat, self.max_lon, self.max_lat = self.polygon.bounds
+        if HAS_SHAPELY_ARRAYS:
+            shapely.prepare(self.polygon)
+
+    # Boolean mask of the points strictly inside the polygon
+    def contains(self, lat, lon):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+
+        # Cheap bounding-box rejection before the exact test
+        mask = (lat >= self.min_lat) & (lat <= self.max_lat) & (lon >= self.min_lon) & (lon <= self.max_lon)
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return mask
+
+        if HAS_SHAPELY_ARRAYS:
+            inside = shapely.contains_xy(self.polygon, lon[candidates], lat[candidates])
+        else:
+            inside = ray_cast(self.lons, self.lats, lon[candidates], lat[candidates])
+        mask[candidates] = inside
+        return mask
+
+
+# Many geofences at once, keyed by zone id, behind an STRtree. Points are snapped to a
+# TAG_CELL_DEGREES grid and the tree is queried once with the boxes of the occupied cells;
+# only points in cells that overlap a zone's bounding box get the exact polygon test.
+class ZoneIndex:
+    def __init__(self, zones):
+        self.zone_ids = np.array(list(zones), dtype=object)
+        self.geofences = [Geofence(coordinates) for coordinates in zones.values()]
+        self.polygons = np.array([geofence.polygon for geofence in self.geofences], dtype=object)
+        # The union as one valid geometry, for PostGIS pushdown; overlapping zones would make
+        # a plain MultiPolygon invalid, and ST_Contains is undefined on invalid geometries
+        self.polygon = unary_union(list(self.polygons))
+        self.tree = shapely.STRtree(self.polygons) if HAS_SHAPELY_ARRAYS else None
+
+    # (row, zone id) pairs of the points strictly inside each zone, as two aligned arrays
+    def tag(self, lat, lon):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        if len(self.geofences) == 0 or len(lat) == 0:
+            return np.zeros(0, dtype=np.int64), self.zone_ids[:0]
+
+        if self.tree is None:
+            hits = [np.flatnonzero(geofence.contains(lat, lon)) for geofence in self.geofences]
+            zones = np.repeat(np.arange(len(hits)), [len(h) for h in hits])
+            return np.concatenate(hits), self.zone_ids[zones]
+
+        # Occupied grid cells, and the points of each cell in one sorted run
+        cell_lat = np.floor(lat / TAG_CELL_DEGREES).astype(np.int64)
+        cell_lon = np.floor(lon / TAG_CELL_DEGREES).astype(np.int64)
+        cells, cell_of_point = np.unique((cell_lat + CELL_OFFSET) << 32 | (cell_lon + CELL_OFFSET), return_inverse=True)
+        cell_lat = (cells >> 32) - CELL_OFFSET
+        cell_lon = (cells & 0xFFFFFFFF) - CELL_OFFSET
+        boxes = shapely.box(cell_lon * TAG_CELL_DEGREES, cell_lat * TAG_CELL_DEGREES,
+                            (cell_lon + 1) * TAG_CELL_DEGREES, (cell_lat + 1) * TAG_CELL_DEGREES)
+        order = np.argsort(cell_of_point, kind='stable')
+        counts = np.bincount(cell_of_point, minlength=len(cells))
+        starts = np.cumsum(counts) - counts
+
+        # One tree query for all cells, expanded to (point, zone) candidates
+        cell_index, zone_index = self.tree.query(boxes)
+        repeats = counts[cell_index]
+        offsets = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        rows = order[np.repeat(starts[cell_index], repeats) + offsets]
+        zones = np.repeat(zone_index, repeats)
+
+        inside = shapely.contains_xy(self.polygons[zones], lon[rows], lat[rows])
+        return rows[inside], self.zone_ids[zones[inside]]
+
+    # Boolean mask of the points inside any of the zones
+    def contains(self, lat, lon):
+        mask = np.zeros(len(lat), dtype=bool)
+        rows, _ = self.tag(lat, lon)
+        mask[rows] = True
+        return mask
+
+
+# Even-odd ray casting over all points at once, looping only over the polygon edges
+def ray_cast(poly_x, poly_y, x, y):
+    inside = np.zeros(len(x), dtype=bool)
+    xj, yj = poly_x[-1], poly_y[-1]
+    for xi, yi in zip(poly_x, poly_y):
+        crosses = (yi > y) != (yj > y)
+        if crosses.any():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cross = (xj - xi) * (y - yi) / (yj - yi) + xi
+            inside ^= crosses & (x < x_cross)
+        xj, yj = xi, yi
+    return inside
+
+
+# Function to get the parsed, prepared geofence for a geofence-data JSON string: either one
+# polygon as [[lat, lon], ...] or several as {zone id: [[lat, lon], ...]}
+@lru_cache(maxsize=32)
+def get_geofence(geofence_json):
+    coordinates = json.loads(geofence_json)
+    if isinstance(coordinates, dict):
+        return ZoneIndex(coordinates)
+    return Geofence(coordinates)
+
+
+# Function to build a mask of the rows of df that fall inside the geofence (or any of the zones)
+def filter_mask(df, geofence_json):
+    return get_geofence(geofence_json).contains(df['latitude'].to_numpy(), df['longitude'].to_numpy())
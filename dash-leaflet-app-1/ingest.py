@@ -0,0 +1,93 @@
+import select
+import threading
+import time
+
+import psycopg2
+
+import db
+
+# Channel the vessel_tracks insert trigger notifies (see setup_db.py)
+CHANNEL = 'vessel_tracks_insert'
+TRIGGER_NAME = 'vessel_tracks_notify_insert'
+
+POLL_INTERVAL = 1  # Seconds between refreshes when falling back to polling
+IDLE_REFRESH_INTERVAL = 30  # Refresh this often without notifications so old rows still expire
+RECONNECT_DELAY = 5
+
+
+# One background feed per process that keeps the in-memory store current.
+# It LISTENs on the insert trigger's channel when the trigger exists and falls back to a
+# single shared poller otherwise, so N open dashboards cost one DB feed instead of N.
+# refresh() updates the store; callbacks only hand out the store's current version token,
+# so ticks without new data send nothing. pending(), when given, is checked between
+# notifications and forces a refresh when it returns True (e.g. a longer time range was asked for).
+class IngestFeed:
+    def __init__(self, refresh, channel=CHANNEL, poll_interval=POLL_INTERVAL, pending=None):
+        self.refresh = refresh
+        self.pending = pending
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.mode = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    # Start the background thread once; safe to call from every callback
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ingest-feed', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if trigger_installed():
+                    self.mode = 'listen'
+                    self._listen()
+                else:
+                    self.mode = 'poll'
+                    self._poll()
+            except Exception as e:
+                print(f"Ingest feed error: {e}")
+                self._stop.wait(RECONNECT_DELAY)
+
+    def _listen(self):
+        conn = psycopg2.connect(**db.DB_CONFIG)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel}")
+
+            # Catch up on anything inserted before LISTEN took effect
+            self.refresh()
+            last_refresh = time.monotonic()
+
+            while not self._stop.is_set():
+                ready, _, _ = select.select([conn], [], [], self.poll_interval)
+                if ready:
+                    conn.poll()
+                if conn.notifies:
+                    # Inserts arriving together collapse into a single refresh
+                    conn.notifies.clear()
+                    self.refresh()
+                    last_refresh = time.monotonic()
+                elif time.monotonic() - last_refresh >= IDLE_REFRESH_INTERVAL or (self.pending and self.pending()):
+                    self.refresh()
+                    last_refresh = time.monotonic()
+        finally:
+            conn.close()
+
+    def _poll(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.poll_interval)
+
+
+# Function to check whether setup_db.py has installed the insert trigger
+def trigger_installed():
+    row = db.fetch_one("SELECT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = %s)", (TRIGGER_NAME,))
+    return bool(row and row[0])
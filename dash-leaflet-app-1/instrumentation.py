@@ -0,0 +1,270 @@
+import bisect
+import functools
+import heapq
+import json
+import sys
+import threading
+import time
+from collections import Counter
+
+from dash.exceptions import PreventUpdate
+from flask import Response, g, request
+
+import db
+
+# Per-callback histograms served at /metrics; False leaves the callbacks untouched
+CALLBACK_METRICS = True
+
+# Opt-in sampling profiler: samples the stacks of running callbacks and keeps the slowest
+# invocations, served at /metrics/slowest. Costs a background thread while enabled.
+PROFILE_SLOWEST = False
+PROFILE_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+PROFILE_KEEP = 20  # Slowest invocations kept
+PROFILE_STACK_DEPTH = 40
+PROFILE_TOP_STACKS = 10  # Most sampled stacks reported per invocation
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+# Cumulative histogram with fixed upper bounds, in the Prometheus layout
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+# Histograms per callback for wall time, time spent in the database, time spent turning the
+# return value into the JSON response, and the size of that response
+class CallbackMetrics:
+    SERIES = {
+        'dash_callback_duration_seconds': ('Wall time of the callback request', SECONDS_BUCKETS),
+        'dash_callback_db_seconds': ('Time spent waiting for and running database queries', SECONDS_BUCKETS),
+        'dash_callback_serialization_seconds': ('Time spent serializing the response', SECONDS_BUCKETS),
+        'dash_callback_payload_bytes': ('Size of the JSON response', BYTES_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {name: {} for name in self.SERIES}
+        self.errors = Counter()
+
+    def observe(self, callback, **values):
+        with self._lock:
+            for name, value in values.items():
+                series = self._histograms[f'dash_callback_{name}']
+                histogram = series.get(callback)
+                if histogram is None:
+                    histogram = series[callback] = Histogram(self.SERIES[f'dash_callback_{name}'][1])
+                histogram.observe(value)
+
+    def record_error(self, callback):
+        with self._lock:
+            self.errors[callback] += 1
+
+    # Prometheus text exposition of the callback histograms and the pool metrics
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (description, buckets) in self.SERIES.items():
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+                for callback, histogram in sorted(self._histograms[name].items()):
+                    label = f'callback="{callback}"'
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.count}')
+            lines += ["# HELP dash_callback_errors_total Callbacks that raised", "# TYPE dash_callback_errors_total counter"]
+            lines += [f'dash_callback_errors_total{{callback="{callback}"}} {count}' for callback, count in sorted(self.errors.items())]
+
+        pool = db.get_metrics()
+        lines += [
+            "# TYPE db_pool_wait_seconds_total counter",
+            f"db_pool_wait_seconds_total {pool['pool_wait']['seconds']}",
+            "# TYPE db_pool_waits_total counter",
+            f"db_pool_waits_total {pool['pool_wait']['count']}",
+            "# TYPE db_connects_total counter",
+            f"db_connects_total {pool['connects']}",
+            "# TYPE db_query_seconds_total counter",
+        ]
+        lines += [f'db_query_seconds_total{{query="{name}"}} {stats["seconds"]}' for name, stats in sorted(pool['queries'].items())]
+        lines += ["# TYPE db_queries_total counter"]
+        lines += [f'db_queries_total{{query="{name}"}} {stats["count"]}' for name, stats in sorted(pool['queries'].items())]
+        return '\n'.join(lines) + '\n'
+
+
+# Background sampler of the stacks of threads that are inside a callback. Each callback
+# invocation collects its own sample counts; the PROFILE_KEEP slowest are kept.
+class SlowestProfiler:
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL, keep=PROFILE_KEEP):
+        self.interval = interval
+        self.keep = keep
+        self._active = {}  # thread id -> (callback, Counter of stacks)
+        self._slowest = []  # Min-heap of (seconds, sequence, report)
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='callback-profiler', daemon=True)
+                self._thread.start()
+
+    def begin(self, callback):
+        samples = Counter()
+        with self._lock:
+            self._active[threading.get_ident()] = (callback, samples)
+        return samples
+
+    def end(self, callback, samples, seconds):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+            if len(self._slowest) >= self.keep and seconds <= self._slowest[0][0]:
+                return
+            report = {
+                'callback': callback,
+                'seconds': seconds,
+                'finished': time.time(),
+                'samples': sum(samples.values()),
+                'stacks': [{'stack': list(stack), 'samples': count}
+                           for stack, count in samples.most_common(PROFILE_TOP_STACKS)],
+            }
+            self._sequence += 1
+            heapq.heappush(self._slowest, (seconds, self._sequence, report))
+            if len(self._slowest) > self.keep:
+                heapq.heappop(self._slowest)
+
+    def slowest(self):
+        with self._lock:
+            return [report for _, _, report in sorted(self._slowest, reverse=True)]
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            # Under the lock, so end() never reads a Counter that is being updated
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, (_, samples) in self._active.items():
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None and len(stack) < PROFILE_STACK_DEPTH:
+                        code = frame.f_code
+                        stack.append(f"{code.co_filename}:{frame.f_lineno} {code.co_name}")
+                        frame = frame.f_back
+                    samples[tuple(reversed(stack))] += 1
+
+
+metrics = CallbackMetrics()
+profiler = SlowestProfiler()
+_timing = threading.local()
+
+
+# Wrapper around the user function: time not spent in it is serialization and Dash overhead
+def _time_function(func):
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _timing.function_seconds = time.perf_counter() - started
+    return timed
+
+
+# Wrapper around Dash's registered callback: counts errors and feeds the profiler. The
+# histograms are observed from the final Flask response (see instrument), since what the
+# callback returns depends on the Dash version and on sync, async or background callbacks.
+def _time_request(name, dash_callback):
+    @functools.wraps(dash_callback)
+    def timed_request(*args, **kwargs):
+        samples = profiler.begin(name) if PROFILE_SLOWEST else None
+        started = time.perf_counter()
+        try:
+            return dash_callback(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            metrics.record_error(name)
+            raise
+        finally:
+            if samples is not None:
+                profiler.end(name, samples, time.perf_counter() - started)
+
+    timed_request._instrumented = True
+    return timed_request
+
+
+# Function to instrument every callback later registered with app.callback.
+# Call it right after creating the app, before the callbacks are declared.
+def instrument(app):
+    if not CALLBACK_METRICS:
+        return
+    if PROFILE_SLOWEST:
+        profiler.start()
+    register = app.callback
+    names = {}  # Callback output id (the request's 'output') -> function name
+    update_path = app.config.routes_pathname_prefix + '_dash-update-component'
+
+    @functools.wraps(register)
+    def callback(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+
+        def wrap(func):
+            decorator(_time_function(func))
+            for output_id, entry in app.callback_map.items():
+                dash_callback = entry.get('callback')
+                if dash_callback is not None and not getattr(dash_callback, '_instrumented', False):
+                    entry['callback'] = _time_request(func.__name__, dash_callback)
+                    names[output_id] = func.__name__
+            # The module keeps the plain function, so direct calls are not measured
+            return func
+        return wrap
+
+    app.callback = callback
+
+    @app.server.before_request
+    def start_timing():
+        if request.path == update_path:
+            _timing.function_seconds = None
+            g.callback_started = (time.perf_counter(), db.thread_db_seconds())
+
+    # Observed once the response body is final, so payload and serialization cover what is sent.
+    # No-update (204) and failed requests are left out, as before.
+    @app.server.after_request
+    def observe_response(response):
+        started = g.pop('callback_started', None)
+        if started is None or response.status_code != 200:
+            return response
+        output_id = (request.get_json(silent=True) or {}).get('output')
+        seconds = time.perf_counter() - started[0]
+        values = {
+            'duration_seconds': seconds,
+            'db_seconds': db.thread_db_seconds() - started[1],
+        }
+        function_seconds = _timing.function_seconds
+        if function_seconds is not None:
+            values['serialization_seconds'] = max(seconds - function_seconds, 0.0)
+        payload_bytes = response.calculate_content_length()
+        if payload_bytes is not None:
+            values['payload_bytes'] = payload_bytes
+        metrics.observe(names.get(output_id, output_id), **values)
+        return response
+
+
+# Function to serve the metrics (and the profiler's slowest invocations) from a Flask server
+def register_metrics_route(server, path='/metrics'):
+    server.add_url_rule(path, 'metrics', lambda: Response(metrics.render(), mimetype='text/plain; version=0.0.4'))
+    server.add_url_rule(f'{path}/slowest', 'metrics_slowest',
+                        lambda: Response(json.dumps(profiler.slowest(), indent=2), mimetype='application/json'))
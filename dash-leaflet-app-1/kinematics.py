@@ -0,0 +1,136 @@
+import numpy as np
+
+# Radius of Earth in kilometers, matching the scalar haversine in geofen.py
+EARTH_RADIUS_KM = 6371
+KM_TO_NAUTICAL_MILES = 0.539957
+KNOTS_TO_KMH = 1.852
+
+
+# Great-circle distance in kilometers between arrays of points
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(a)) * EARTH_RADIUS_KM
+
+
+# Initial compass bearing in degrees (0-360) from the first to the second array of points
+def initial_bearing(lat1, lon1, lat2, lon2):
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    dlon = np.radians(np.asarray(lon2) - np.asarray(lon1))
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+
+# Great-circle destination in degrees after travelling distance_km from each point on its
+# initial bearing. Arrays broadcast, so one call can project many points to many distances.
+def destination_point(lat, lon, bearing, distance_km):
+    lat1 = np.radians(lat)
+    lon1 = np.radians(lon)
+    theta = np.radians(bearing)
+    delta = np.asarray(distance_km, dtype=float) / EARTH_RADIUS_KM
+    lat2 = np.arcsin(np.sin(lat1) * np.cos(delta) + np.cos(lat1) * np.sin(delta) * np.cos(theta))
+    lon2 = lon1 + np.arctan2(np.sin(theta) * np.sin(delta) * np.cos(lat1),
+                             np.cos(delta) - np.sin(lat1) * np.sin(lat2))
+    return np.degrees(lat2), (np.degrees(lon2) + 540) % 360 - 180
+
+
+# Dead-reckoned positions of each vessel at each horizon, keeping speed (knots) and course constant.
+# Returns (lat, lon) arrays of shape (vessels, horizons).
+def dead_reckon(lat, lon, speed, course, minutes):
+    lat = np.asarray(lat, dtype=float)[:, None]
+    lon = np.asarray(lon, dtype=float)[:, None]
+    course = np.asarray(course, dtype=float)[:, None]
+    distance = np.asarray(speed, dtype=float)[:, None] * KNOTS_TO_KMH * np.asarray(minutes, dtype=float)[None, :] / 60
+    return destination_point(lat, lon, course, distance)
+
+
+# Start offset of every run of equal keys in an already sorted array
+def group_offsets(keys):
+    keys = np.asarray(keys)
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+    changes = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    return np.concatenate(([0], changes))
+
+
+# Distance (km), time delta (s), speed (knots) and course (degrees) from each previous point to the current one.
+# Rows without a previous point (NaN prev_lat) get NaN for all four.
+def pairwise_kinematics(prev_lat, prev_lon, prev_seconds, lat, lon, seconds):
+    prev_lat = np.asarray(prev_lat, dtype=float)
+    prev_lon = np.asarray(prev_lon, dtype=float)
+    prev_seconds = np.asarray(prev_seconds, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    seconds = np.asarray(seconds, dtype=float)
+
+    distance = haversine_km(prev_lat, prev_lon, lat, lon)
+    time_diff = seconds - prev_seconds
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(time_diff > 0, distance / (time_diff / 3600) * KM_TO_NAUTICAL_MILES, 0)
+    speed[np.isnan(prev_lat)] = np.nan
+    course = initial_bearing(prev_lat, prev_lon, lat, lon)
+    return distance, time_diff, speed, course
+
+
+# Distance (km), time delta (s), speed (knots) and course (degrees) for points sorted by vessel then time.
+# The first point of each vessel has no predecessor and gets NaN, except that
+# single-point vessels get a course of 0 like calculate_speed_and_course always did.
+def track_kinematics(vessel_keys, seconds, lat, lon):
+    seconds = np.asarray(seconds, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    n = len(lat)
+
+    distance = np.full(n, np.nan)
+    time_diff = np.full(n, np.nan)
+    speed = np.full(n, np.nan)
+    course = np.full(n, np.nan)
+    if n == 0:
+        return distance, time_diff, speed, course
+
+    offsets = group_offsets(vessel_keys)
+    has_prev = np.ones(n, dtype=bool)
+    has_prev[offsets] = False
+    cur = np.flatnonzero(has_prev)
+    prev = cur - 1
+
+    distance[cur], time_diff[cur], speed[cur], course[cur] = pairwise_kinematics(
+        lat[prev], lon[prev], seconds[prev], lat[cur], lon[cur], seconds[cur])
+
+    # Vessels with only one data point
+    sizes = np.diff(np.append(offsets, n))
+    course[offsets[sizes == 1]] = 0
+
+    return distance, time_diff, speed, course
+
+
+# Same as track_kinematics, from the speed, course and time delta enrich.py stored for every
+# row against the vessel's previous report in the whole table. Only the first point of each
+# vessel is reset, because its previous report is not among the given points. The distance is
+# speed times gap, except for reports in the same second as the previous one (speed 0), which
+# are measured against the point before them.
+def stored_track_kinematics(vessel_keys, lat, lon, speed, course, time_diff):
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    speed = np.array(speed, dtype=float)
+    course = np.array(course, dtype=float)
+    time_diff = np.array(time_diff, dtype=float)
+    distance = speed * time_diff / 3600 / KM_TO_NAUTICAL_MILES
+    n = len(speed)
+    if n == 0:
+        return distance, time_diff, speed, course
+
+    same_second = np.flatnonzero(time_diff[1:] == 0) + 1
+    distance[same_second] = haversine_km(lat[same_second - 1], lon[same_second - 1], lat[same_second], lon[same_second])
+
+    offsets = group_offsets(vessel_keys)
+    for values in (distance, time_diff, speed, course):
+        values[offsets] = np.nan
+    sizes = np.diff(np.append(offsets, n))
+    course[offsets[sizes == 1]] = 0
+
+    return distance, time_diff, speed, course
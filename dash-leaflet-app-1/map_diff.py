@@ -0,0 +1,72 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+MAX_CLIENTS = 256
+
+
+# What was last sent to each browser tab, so the next update can send only the changes.
+# Each layer is stored as the ordered vessel names the client holds plus a signature per
+# vessel. A sequence number round-trips through the client; if the client's number does
+# not match ours (another worker rendered in between, or we restarted) we do a full render.
+class RenderState:
+    def __init__(self, max_clients=MAX_CLIENTS):
+        self._max_clients = max_clients
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def new_client_id(self):
+        return uuid.uuid4().hex
+
+    # Last state for the client, or None if unknown or out of sync
+    def get(self, client_id, seq):
+        with self._lock:
+            state = self._clients.get(client_id)
+            if state is None or state['seq'] != seq:
+                return None
+            self._clients.move_to_end(client_id)
+            return state
+
+    # Remember what was just sent; returns the sequence number to hand to the client
+    def save(self, client_id, key, layers):
+        with self._lock:
+            previous = self._clients.pop(client_id, None)
+            seq = previous['seq'] + 1 if previous else 1
+            self._clients[client_id] = {'seq': seq, 'key': key, 'layers': layers}
+            while len(self._clients) > self._max_clients:
+                self._clients.popitem(last=False)
+            return seq
+
+    def drop(self, client_id):
+        with self._lock:
+            self._clients.pop(client_id, None)
+
+
+# Function to record removed, changed and added vessels of one layer on a dash.Patch list target.
+# Returns whether anything changed and the vessel order the client will hold afterwards.
+def patch_layer(target, names, old_signatures, new_signatures, build_item):
+    names = list(names)
+    changed = False
+
+    # Removals first, from the end so earlier indices stay valid
+    for index in reversed(range(len(names))):
+        if names[index] not in new_signatures:
+            del target[index]
+            del names[index]
+            changed = True
+
+    # Vessels that moved (or otherwise changed) are replaced in place
+    for index, name in enumerate(names):
+        if new_signatures[name] != old_signatures.get(name):
+            target[index] = build_item(name)
+            changed = True
+
+    # New vessels go on the end
+    known = set(names)
+    for name in new_signatures:
+        if name not in known:
+            target.append(build_item(name))
+            names.append(name)
+            changed = True
+
+    return changed, names
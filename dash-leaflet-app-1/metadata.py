@@ -0,0 +1,200 @@
+import threading
+import time
+
+import pandas as pd
+
+import db
+
+METADATA_TTL = 300  # Seconds before the cached lists are reloaded from the database
+RETRY_DELAY = 5  # Seconds before retrying a failed load; doubles on each failure, up to the TTL
+PRESENCE_BUCKET_SECONDS = 86400  # Each vessel's first/last report is kept per day
+
+PRESENCE_QUERY = """
+    SELECT source, vesselname, sourcedatetime / %s AS bucket, MIN(sourcedatetime), MAX(sourcedatetime)
+    FROM vessel_tracks
+    GROUP BY 1, 2, 3
+"""
+
+# Vessels among the candidates with at least one report in the range
+PRESENT_QUERY = """
+    SELECT v FROM unnest(%s::text[]) AS v
+    WHERE EXISTS (SELECT 1 FROM vessel_tracks t
+                  WHERE t.vesselname = v AND t.sourcedatetime BETWEEN %s AND %s)
+"""
+
+NEW_ROWS_QUERY = """
+    SELECT source, vesselname, sourcedatetime FROM vessel_tracks
+    WHERE sourcedatetime >= %s
+"""
+
+
+# In-memory cache of the distinct sources and of each vessel's first/last report time per
+# day bucket. Loaded with one grouped scan of vessel_tracks per TTL and kept current in
+# between by observe(), which the incremental feeds call with every batch of new rows, so
+# the dropdown and checklist callbacks read memory instead of scanning the table.
+# Reloads after the first run in a background thread while readers keep the previous lists.
+class MetadataCache:
+    def __init__(self, ttl=METADATA_TTL):
+        self.ttl = ttl
+        self._sources = set()
+        self._vessels = {}  # vessel name -> [first seen, last seen, {bucket: [first, last]}]
+        self._watermark = None  # Newest report time the cache has read from vessel_tracks
+        self._loaded = False
+        self._next_load_at = 0
+        self._retry_delay = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # Only one thread reloads at a time
+
+    # Sorted list of the known (non-NULL) sources
+    def sources(self):
+        self._ensure_loaded()
+        with self._lock:
+            return sorted(self._sources)
+
+    # Sorted list of vessels with at least one report in [start_epoch, end_epoch].
+    # Decided from the day buckets; only a vessel whose reports straddle a range that lies
+    # inside one of its buckets is checked against the database.
+    def vessels_between(self, start_epoch, end_epoch):
+        self._ensure_loaded()
+        present, candidates = [], []
+        with self._lock:
+            for name, (first_seen, last_seen, buckets) in self._vessels.items():
+                if first_seen > end_epoch or last_seen < start_epoch:
+                    continue
+                found = (start_epoch <= first_seen or last_seen <= end_epoch
+                         or reports_between(buckets, start_epoch, end_epoch))
+                if found is None:
+                    candidates.append(name)
+                elif found:
+                    present.append(name)
+
+        if candidates:
+            try:
+                _, rows = db.fetch_all(PRESENT_QUERY, (candidates, start_epoch, end_epoch),
+                                       name='metadata_vessels_present')
+                present.extend(name for name, in rows)
+            except Exception as e:
+                # List them anyway; they report on both sides of the range the same day
+                print(f"Database error: {e}")
+                present.extend(candidates)
+        return sorted(present)
+
+    # Fold newly ingested rows (a DataFrame with source, vesselname, sourcedatetime) into the cache
+    def observe(self, rows):
+        if rows is None or rows.empty:
+            return
+        sources = set(rows['source'].dropna().unique())
+        times = rows['sourcedatetime']
+        spans = times.groupby([rows['vesselname'], times // PRESENCE_BUCKET_SECONDS]).agg(['min', 'max'])
+        with self._lock:
+            self._sources |= sources
+            for (name, bucket), first_seen, last_seen in zip(spans.index, spans['min'], spans['max']):
+                add_presence(self._vessels, name, int(bucket), int(first_seen), int(last_seen))
+
+    # Function for an ingest feed: fold in the rows added since the last read; True when there were any
+    def observe_new_rows(self):
+        with self._lock:
+            watermark = self._watermark
+        if watermark is None:
+            # Nothing loaded yet; the first load reads everything
+            return False
+        try:
+            columns, rows = db.fetch_all(NEW_ROWS_QUERY, (watermark,), name='metadata_new_rows')
+        except Exception as e:
+            print(f"Database error: {e}")
+            return False
+        df = pd.DataFrame(rows, columns=columns)
+        self.observe(df)
+        newest = int(df['sourcedatetime'].max()) if not df.empty else watermark
+        with self._lock:
+            # A reload may have moved the watermark meanwhile
+            if self._watermark is not None:
+                self._watermark = max(self._watermark, newest)
+        return newest > watermark
+
+    # Force a reload on the next read
+    def invalidate(self):
+        with self._lock:
+            self._next_load_at = 0
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if time.monotonic() < self._next_load_at:
+                return
+            loaded = self._loaded
+        if not loaded:
+            # Nothing to serve yet, so the first load runs in the caller
+            with self._load_lock:
+                if not self._loaded and time.monotonic() >= self._next_load_at:
+                    self._load()
+        elif self._load_lock.acquire(blocking=False):
+            threading.Thread(target=self._load_in_background, name='metadata-refresh', daemon=True).start()
+
+    def _load_in_background(self):
+        try:
+            if time.monotonic() >= self._next_load_at:
+                self._load()
+        finally:
+            self._load_lock.release()
+
+    def _load(self):
+        try:
+            _, rows = db.fetch_all(PRESENCE_QUERY, (PRESENCE_BUCKET_SECONDS,), name='metadata_presence')
+        except Exception as e:
+            # Keep serving the previous lists and back off before the next attempt
+            print(f"Database error: {e}")
+            with self._lock:
+                self._retry_delay = min(self._retry_delay * 2 or RETRY_DELAY, self.ttl)
+                self._next_load_at = time.monotonic() + self._retry_delay
+            return
+
+        sources = set()
+        vessels = {}
+        watermark = None
+        for source, name, bucket, first_seen, last_seen in rows:
+            if source is not None:
+                sources.add(source)
+            add_presence(vessels, name, int(bucket), first_seen, last_seen)
+            watermark = last_seen if watermark is None else max(watermark, last_seen)
+
+        with self._lock:
+            self._sources = sources
+            self._vessels = vessels
+            # Rows observed while the scan ran are read again from here
+            self._watermark = watermark if watermark is not None else 0
+            self._loaded = True
+            self._retry_delay = 0
+            self._next_load_at = time.monotonic() + self.ttl
+
+
+# Function to widen a vessel's overall and per-bucket report spans in place
+def add_presence(vessels, name, bucket, first_seen, last_seen):
+    entry = vessels.get(name)
+    if entry is None:
+        vessels[name] = [first_seen, last_seen, {bucket: [first_seen, last_seen]}]
+        return
+    entry[0] = min(entry[0], first_seen)
+    entry[1] = max(entry[1], last_seen)
+    span = entry[2].get(bucket)
+    if span is None:
+        entry[2][bucket] = [first_seen, last_seen]
+    else:
+        span[0] = min(span[0], first_seen)
+        span[1] = max(span[1], last_seen)
+
+
+# Function to tell from a vessel's day buckets whether it reports in [start_epoch, end_epoch]:
+# True or False when the buckets decide it, None when a bucket's reports straddle the range
+def reports_between(buckets, start_epoch, end_epoch):
+    keys = range(start_epoch // PRESENCE_BUCKET_SECONDS, end_epoch // PRESENCE_BUCKET_SECONDS + 1)
+    if len(keys) > len(buckets):
+        keys = [bucket for bucket in buckets if keys.start <= bucket < keys.stop]
+    straddled = False
+    for bucket in keys:
+        span = buckets.get(bucket)
+        if span is None or span[0] > end_epoch or span[1] < start_epoch:
+            continue
+        if span[0] >= start_epoch or span[1] <= end_epoch:
+            return True
+        straddled = True
+    return None if straddled else False
@@ -0,0 +1,254 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Columns held per position, and their dtypes
+COLUMNS = {
+    'sourcedatetime': np.int64,
+    'latitude': np.float64,
+    'longitude': np.float64,
+    'speed': np.float64,
+    'course': np.float64,
+}
+
+INITIAL_CAPACITY = 64  # Positions per ring before the first growth
+MIN_REPORT_INTERVAL = 1  # Fastest expected report rate in seconds; caps ring size for the window
+
+
+# Source column as an object array with None for every missing source (NaN never equals
+# itself, so each report without a source would otherwise start a feed of its own)
+def _sources(df):
+    sources = df['source'].to_numpy(dtype=object, copy=True)
+    sources[pd.isna(sources)] = None
+    return sources
+
+
+# Fixed-capacity circular buffer of one vessel feed, one NumPy array per column.
+# Positions are appended in time order, so the newest is always at the tail.
+class _Ring:
+    def __init__(self, capacity):
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.capacity = capacity
+        self.head = 0  # Index of the oldest position
+        self.size = 0
+
+    def _index(self, offset):
+        return (self.head + offset) % self.capacity
+
+    # Value of a column for the newest position
+    def last(self, name):
+        return self.columns[name][self._index(self.size - 1)]
+
+    # Whether the newest positions already include this exact report
+    def has(self, seconds, lat, lon):
+        times, lats, lons = self.columns['sourcedatetime'], self.columns['latitude'], self.columns['longitude']
+        for offset in range(self.size - 1, -1, -1):
+            i = self._index(offset)
+            if times[i] != seconds:
+                return False
+            if lats[i] == lat and lons[i] == lon:
+                return True
+        return False
+
+    # Copy the positions into arrays twice the size, oldest first
+    def grow(self, capacity):
+        order = self._index(np.arange(self.size))
+        columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        for name, values in self.columns.items():
+            columns[name][:self.size] = values[order]
+        self.columns = columns
+        self.capacity = capacity
+        self.head = 0
+
+    def append(self, values):
+        if self.size == self.capacity:
+            # Full at the size limit: overwrite the oldest position
+            self.head = self._index(1)
+            self.size -= 1
+        i = self._index(self.size)
+        for name, value in values.items():
+            self.columns[name][i] = value
+        self.size += 1
+
+    # Drop positions older than the cutoff from the head; returns how many were dropped
+    def evict_before(self, cutoff):
+        times = self.columns['sourcedatetime']
+        dropped = 0
+        while self.size and times[self.head] < cutoff:
+            self.head = self._index(1)
+            self.size -= 1
+            dropped += 1
+        return dropped
+
+    def nbytes(self):
+        return sum(values.nbytes for values in self.columns.values())
+
+
+# Latest position of every feed at one version of a PositionStore, as plain arrays.
+# Rings are written in place, so callbacks keep one of these next to their data version
+# instead of reading the live store; it hashes by (version, since) for lru_cache keys.
+class PositionSnapshot:
+    def __init__(self, version, tails, since=None):
+        self.version = version
+        self.since = since  # Feeds whose latest position is older are left out
+        self._tails = tails  # DataFrame, one row per feed: source, vesselname and COLUMNS
+
+    def __hash__(self):
+        return hash((self.version, self.since))
+
+    def __eq__(self, other):
+        return isinstance(other, PositionSnapshot) and (self.version, self.since) == (other.version, other.since)
+
+    # The same version limited to feeds reporting since an epoch, for a shorter time range
+    def restrict(self, since):
+        if since is None or since == self.since:
+            return self
+        return PositionSnapshot(self.version, self._tails, since)
+
+    # Latest position of each vessel as a DataFrame, optionally limited to some vessels
+    # and sources. A vessel reported by several sources shows its most recent report.
+    def latest_positions(self, vessel_names=None, sources=None):
+        tails = self._tails
+        mask = np.ones(len(tails), dtype=bool)
+        if self.since is not None:
+            mask &= tails['sourcedatetime'].to_numpy() >= self.since
+        if vessel_names is not None:
+            mask &= tails['vesselname'].isin(list(vessel_names)).to_numpy()
+        if sources:
+            mask &= tails['source'].isin(list(sources)).to_numpy()
+        tails = tails[mask]
+        # First feed holding the newest report of each vessel
+        newest = tails.groupby('vesselname', sort=False)['sourcedatetime'].idxmax()
+        df = tails.loc[newest.to_numpy()].reset_index(drop=True)
+        df['timestamp'] = pd.to_datetime(df['sourcedatetime'], unit='s')
+        return df
+
+
+# Rolling window of recent positions with one ring buffer per (source, vessel) feed.
+# Appends are O(1) amortized (rings double until the window's size limit), old positions
+# are evicted from the ring heads by time, and each feed's latest position is its tail,
+# so the latest-position table reads V rows instead of sorting and grouping the window.
+class PositionStore:
+    def __init__(self, hours=1, initial_capacity=INITIAL_CAPACITY):
+        self._initial_capacity = initial_capacity
+        self._rings = {}  # (source, vesselname) -> _Ring
+        self._lock = threading.RLock()
+        self.version = 0  # Bumped whenever the held positions change
+        self._snapshot = None
+        self.set_window(hours)
+
+    # Size limit of each ring for a window of this many hours
+    def set_window(self, hours):
+        with self._lock:
+            self.hours = hours
+            self.max_capacity = max(int(hours * 3600 / MIN_REPORT_INTERVAL), self._initial_capacity)
+
+    def clear(self):
+        with self._lock:
+            self._rings = {}
+            self.version += 1
+
+    # Replace the contents with a whole window, building each ring from array slices
+    def load(self, df, hours):
+        rings = {}
+        if df is not None and not df.empty:
+            df = df.sort_values(['source', 'vesselname', 'sourcedatetime'], kind='stable')
+            df = df.drop_duplicates(subset=['source', 'vesselname', 'sourcedatetime', 'latitude', 'longitude'])
+            sources = _sources(df)
+            vessels = df['vesselname'].to_numpy()
+            changes = np.flatnonzero((sources[1:] != sources[:-1]) | (vessels[1:] != vessels[:-1])) + 1
+            starts = np.concatenate(([0], changes))
+            ends = np.append(changes, len(df))
+            columns = {name: df[name].to_numpy(dtype=dtype) for name, dtype in COLUMNS.items()}
+            max_capacity = max(int(hours * 3600 / MIN_REPORT_INTERVAL), self._initial_capacity)
+            for start, end in zip(starts, ends):
+                # Keep the newest positions if a feed reports faster than the size limit allows
+                start = max(start, end - max_capacity)
+                size = int(end - start)
+                ring = _Ring(min(max(self._initial_capacity, size), max_capacity))
+                for name, values in columns.items():
+                    ring.columns[name][:size] = values[start:end]
+                ring.size = size
+                rings[(sources[start], vessels[start])] = ring
+
+        with self._lock:
+            self.set_window(hours)
+            self._rings = rings
+            self.version += 1
+
+    # Append positions from a DataFrame with source, vesselname and the COLUMNS.
+    # Reports already held (re-read at the watermark) or older than a feed's newest are skipped.
+    def append(self, df):
+        if df is None or df.empty:
+            return 0
+        df = df.sort_values('sourcedatetime', kind='stable')
+        keys = zip(_sources(df), df['vesselname'])
+        columns = [df[name].to_numpy() for name in COLUMNS]
+        appended = 0
+        with self._lock:
+            for key, *values in zip(keys, *columns):
+                ring = self._rings.get(key)
+                if ring is None:
+                    ring = self._rings[key] = _Ring(min(self._initial_capacity, self.max_capacity))
+                elif ring.size:
+                    seconds, last_seconds = values[0], ring.last('sourcedatetime')
+                    if seconds < last_seconds or (seconds == last_seconds and ring.has(*values[:3])):
+                        continue
+                if ring.size == ring.capacity and ring.capacity < self.max_capacity:
+                    ring.grow(min(ring.capacity * 2, self.max_capacity))
+                ring.append(dict(zip(COLUMNS, values)))
+                appended += 1
+            if appended:
+                self.version += 1
+        return appended
+
+    # Drop positions older than the cutoff epoch, and feeds left empty
+    def evict_before(self, cutoff):
+        with self._lock:
+            dropped = 0
+            for key in list(self._rings):
+                ring = self._rings[key]
+                dropped += ring.evict_before(cutoff)
+                if ring.size == 0:
+                    del self._rings[key]
+            if dropped:
+                self.version += 1
+            return dropped
+
+    # Snapshot of every feed's latest position at the current version, built once per version
+    def snapshot(self):
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != self.version:
+                keys = list(self._rings)
+                rings = [self._rings[key] for key in keys]
+                tails = pd.DataFrame({
+                    'source': [source for source, _ in keys],
+                    'vesselname': [vesselname for _, vesselname in keys],
+                    **{name: np.array([ring.last(name) for ring in rings], dtype=dtype) for name, dtype in COLUMNS.items()},
+                })
+                self._snapshot = PositionSnapshot(self.version, tails)
+            return self._snapshot
+
+    # Latest position of each vessel as a DataFrame, optionally limited to some vessels
+    # and sources. A vessel reported by several sources shows its most recent report.
+    def latest_positions(self, vessel_names=None, sources=None):
+        return self.snapshot().latest_positions(vessel_names, sources)
+
+    # Memory held by the store
+    def memory_stats(self):
+        with self._lock:
+            rings = list(self._rings.values())
+            return {
+                'feeds': len(rings),
+                'vessels': len({vesselname for _, vesselname in self._rings}),
+                'positions': sum(ring.size for ring in rings),
+                'capacity': sum(ring.capacity for ring in rings),
+                'bytes': sum(ring.nbytes() for ring in rings),
+                'max_ring_capacity': self.max_capacity,
+            }
+
+
+# Function to serve the memory stats as JSON from a Flask server
+def register_stats_route(store, server, path='/position-store'):
+    server.add_url_rule(path, 'position_store', lambda: store.memory_stats())
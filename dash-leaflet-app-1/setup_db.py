@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+# Creates the indexes, the insert notification trigger and (when PostGIS is installed)
+# the geometry column the apps rely on. Safe to run repeatedly.
+import sys
+
+import psycopg2
+
+import db
+
+# Indexes for time-window scans and per-vessel lookups
+INDEX_STATEMENTS = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS vessel_tracks_sourcedatetime_idx "
+    "ON vessel_tracks (sourcedatetime)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS vessel_tracks_vessel_time_idx "
+    "ON vessel_tracks (vesselname, sourcedatetime)",
+]
+
+# Statement-level trigger feeding ingest.IngestFeed through LISTEN/NOTIFY
+TRIGGER_STATEMENTS = [
+    """
+    CREATE OR REPLACE FUNCTION notify_vessel_tracks_insert() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('vessel_tracks_insert', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS vessel_tracks_notify_insert ON vessel_tracks",
+    "CREATE TRIGGER vessel_tracks_notify_insert AFTER INSERT ON vessel_tracks "
+    "FOR EACH STATEMENT EXECUTE PROCEDURE notify_vessel_tracks_insert()",
+]
+
+# Named geofences (anchorages, TSS lanes, port limits, ...) as [[lat, lon], ...] rings
+ZONE_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS geofence_zones (
+        zone_id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        kind TEXT NOT NULL DEFAULT 'other',
+        coordinates JSONB NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+]
+
+# Per-row speed, course and gap to the vessel's previous report, filled in by enrich.py.
+# NULL means not enriched yet; NaN means the row has no previous report.
+ENRICHMENT_STATEMENTS = [
+    "ALTER TABLE vessel_tracks ADD COLUMN IF NOT EXISTS speed_kn DOUBLE PRECISION",
+    "ALTER TABLE vessel_tracks ADD COLUMN IF NOT EXISTS course_deg DOUBLE PRECISION",
+    "ALTER TABLE vessel_tracks ADD COLUMN IF NOT EXISTS prev_gap_s DOUBLE PRECISION",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS vessel_tracks_unenriched_idx "
+    "ON vessel_tracks (vesselname, sourcedatetime) WHERE prev_gap_s IS NULL",
+]
+
+# Point geometry kept in sync with latitude/longitude, with a GiST index for ST_Contains
+POSTGIS_STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS postgis",
+    "ALTER TABLE vessel_tracks ADD COLUMN IF NOT EXISTS geom geometry(Point, 4326) "
+    "GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)) STORED",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS vessel_tracks_geom_idx "
+    "ON vessel_tracks USING GIST (geom)",
+]
+
+
+def run(cursor, statements):
+    for statement in statements:
+        print(f"  {' '.join(statement.split())[:100]}")
+        cursor.execute(statement)
+
+
+def postgis_installable(cursor):
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'postgis'")
+    return cursor.fetchone() is not None
+
+
+def main():
+    print("Connecting to database\n	->%s@%s/%s" % (db.DB_CONFIG['user'], db.DB_CONFIG['host'], db.DB_CONFIG['dbname']))
+    try:
+        with db.get_connection() as conn, conn.cursor() as cursor:
+            print("Creating indexes:")
+            run(cursor, INDEX_STATEMENTS)
+
+            print("Creating insert notification trigger:")
+            run(cursor, TRIGGER_STATEMENTS)
+
+            print("Creating geofence zones table:")
+            run(cursor, ZONE_STATEMENTS)
+
+            print("Adding enrichment columns (fill them with enrich.py):")
+            run(cursor, ENRICHMENT_STATEMENTS)
+
+            if postgis_installable(cursor):
+                print("Setting up PostGIS:")
+                run(cursor, POSTGIS_STATEMENTS)
+            else:
+                print("PostGIS is not available; geofence filtering will stay in Python.")
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        sys.exit(1)
+
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
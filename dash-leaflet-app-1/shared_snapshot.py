@@ -0,0 +1,211 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl  # Not on Windows, where the dev server runs a single process anyway
+except ImportError:
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+# tmpfs where available, so the snapshot lives in shared memory rather than on disk
+SNAPSHOT_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+SNAPSHOT_PATH_ENV = 'VESSEL_SNAPSHOT_PATH'  # Set to pin the snapshot file explicitly
+
+MAGIC = b'VSNAP001'
+PREAMBLE = struct.Struct('<8sQ')  # Magic, header length
+ALIGNMENT = 64
+REQUEST_REFRESH_SECONDS = 5  # A worker rewrites an unchanged request this often, so it doesn't go stale
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# Function to get the snapshot file for one deployment: $VESSEL_SNAPSHOT_PATH when set, otherwise
+# a file in SNAPSHOT_DIR named after a hash of key, so deployments with different keys
+# (e.g. database and app directory) on one host never share a snapshot
+def snapshot_path(key=''):
+    path = os.environ.get(SNAPSHOT_PATH_ENV)
+    if path:
+        return path
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_DIR, f'vessel_snapshot_{digest}.bin')
+
+
+# Columnar snapshot of a DataFrame in one file, shared by every worker process on the host.
+# One worker holds an exclusive lock on <path>.lock and is the only producer; it writes each
+# new version to a temporary file and renames it over the snapshot, so readers always see a
+# complete file. Readers map the file copy-on-write and numeric columns are np.frombuffer views
+# over the mapping, so nothing is parsed, unpickled or copied; a mapped version stays valid after
+# the producer renames a newer one over it. String columns are stored as codes plus a list of
+# distinct values and decoded on read. Every version carries a sequence number in its header.
+# Other workers leave requests (e.g. the time range they need) in <path>.request.<pid> files.
+class SharedSnapshot:
+    def __init__(self, path=None):
+        self.path = path or snapshot_path()
+        self._lock_file = None
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._cached = None  # (inode, mtime, seq, meta, df) of the last version read
+        self._requested = None  # (value, monotonic time) of this process's last request
+
+    @property
+    def is_producer(self):
+        return self._lock_file is not None
+
+    # Become the producer if no other process is; sticky once acquired, and picked up by
+    # another worker when the producer exits because the OS releases its lock
+    def try_acquire_producer(self):
+        with self._lock:
+            if self._lock_file is not None:
+                return True
+            lock_file = open(self.path + '.lock', 'a')
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    return False
+            self._lock_file = lock_file
+            return True
+
+    # Give up the producer role, so another worker can take it
+    def release_producer(self):
+        with self._lock:
+            if self._lock_file is not None:
+                self._lock_file.close()  # Closing drops the flock
+                self._lock_file = None
+
+    # Leave a JSON-serializable request for the producer; one per process, replacing the last
+    def request(self, value):
+        now = time.monotonic()
+        with self._lock:
+            if self._requested is not None and self._requested[0] == value \
+                    and now - self._requested[1] < REQUEST_REFRESH_SECONDS:
+                return
+            self._requested = (value, now)
+        path = f"{self.path}.request.{os.getpid()}"
+        with open(path + '.tmp', 'w') as f:
+            json.dump(value, f)
+        os.replace(path + '.tmp', path)
+
+    # Requests of all workers written in the last max_age seconds; older ones are removed
+    def requests(self, max_age):
+        values = []
+        for path in glob.glob(glob.escape(self.path) + '.request.*'):
+            if path.endswith('.tmp'):
+                continue
+            try:
+                if time.time() - os.stat(path).st_mtime > max_age:
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    values.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # Removed or replaced meanwhile
+        return values
+
+    # Write a new version; returns its sequence number. meta is any JSON-serializable dict.
+    def publish(self, df, meta=None):
+        with self._publish_lock:
+            return self._publish(df, meta)
+
+    def _publish(self, df, meta):
+        previous = self._read_header()
+        seq = previous['seq'] + 1 if previous else 1
+
+        columns = []
+        blobs = []
+        offset = 0
+        for name in df.columns:
+            values = df[name].to_numpy()
+            if values.dtype == object:
+                codes, uniques = pd.factorize(df[name])
+                column = {'name': name, 'kind': 'strings', 'categories': [str(value) for value in uniques]}
+                values = codes.astype(np.int32)
+            else:
+                column = {'name': name, 'kind': 'array'}
+            values = np.ascontiguousarray(values)
+            offset = _aligned(offset)
+            column.update(dtype=values.dtype.str, offset=offset, count=len(values))
+            columns.append(column)
+            blobs.append((offset, values))
+            offset += values.nbytes
+
+        header = json.dumps({'seq': seq, 'rows': len(df), 'meta': meta or {}, 'columns': columns}).encode()
+        data_start = _aligned(PREAMBLE.size + len(header))
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(PREAMBLE.pack(MAGIC, len(header)))
+            f.write(header)
+            for blob_offset, values in blobs:
+                f.seek(data_start + blob_offset)
+                f.write(values.tobytes())
+        os.replace(tmp_path, self.path)
+        return seq
+
+    # Latest version as (seq, meta, DataFrame), or (None, None, None) if there is none yet.
+    # Unchanged files are detected with a stat and return the same DataFrame object.
+    def read(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None, None, None
+
+        with self._lock:
+            cached = self._cached
+            if cached is not None and cached[:2] == (stat.st_ino, stat.st_mtime_ns):
+                return cached[2:]
+
+            with open(self.path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                # Copy-on-write: columns are writable views, and writes stay in this process
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            header, data_start = self._parse_header(buffer)
+            if header is None:
+                return None, None, None
+
+            data = {}
+            for column in header['columns']:
+                values = np.frombuffer(buffer, dtype=np.dtype(column['dtype']), count=column['count'],
+                                       offset=data_start + column['offset'])
+                if column['kind'] == 'strings':
+                    # -1 codes are missing values
+                    categories = np.array(column['categories'] + [None], dtype=object)
+                    values = categories[values]
+                data[column['name']] = values
+            # The arrays keep the mapping (and the file version it maps) alive
+            df = pd.DataFrame(data, copy=False)
+
+            self._cached = (stat.st_ino, stat.st_mtime_ns, header['seq'], header['meta'], df)
+            return self._cached[2:]
+
+    def _read_header(self):
+        try:
+            with open(self.path, 'rb') as f:
+                preamble = f.read(PREAMBLE.size)
+                if len(preamble) < PREAMBLE.size:
+                    return None
+                magic, length = PREAMBLE.unpack(preamble)
+                return json.loads(f.read(length)) if magic == MAGIC else None
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _parse_header(self, buffer):
+        if len(buffer) < PREAMBLE.size:
+            return None, None
+        magic, length = PREAMBLE.unpack_from(buffer)
+        if magic != MAGIC:
+            return None, None
+        header = json.loads(buffer[PREAMBLE.size:PREAMBLE.size + length])
+        return header, _aligned(PREAMBLE.size + length)
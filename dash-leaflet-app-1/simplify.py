@@ -0,0 +1,148 @@
+import math
+import time
+
+import numpy as np
+
+from kinematics import group_offsets
+
+METERS_PER_DEGREE = 111320.0
+
+# Default simplification settings; each app keeps its own copy in SIMPLIFY_CONFIG
+DEFAULT_CONFIG = {
+    'enabled': True,
+    'tolerance_px': 1.5,  # Douglas-Peucker tolerance in screen pixels at the current zoom
+    'min_seconds': 0,  # Keep at most one point per vessel per this many seconds (0 disables)
+    'min_meters': 0,  # Drop points that stay within this many meters of the previous one (0 disables)
+}
+
+
+# Ground distance covered by one Web Mercator pixel at the given zoom and latitude
+def meters_per_pixel(zoom, lat):
+    return 156543.03392 * math.cos(math.radians(lat)) / 2 ** zoom
+
+
+# First and last index of every vessel's run in arrays sorted by vessel then time
+def _track_bounds(vessel_keys):
+    offsets = group_offsets(vessel_keys)
+    ends = np.append(offsets[1:], len(vessel_keys)) - 1
+    return offsets, ends
+
+
+# Mask of points kept by time and distance decimation. Works on all vessels at once by
+# bucketing each point by time and by a metric grid cell and keeping the points where the
+# bucket changes; a vessel's first and last points are always kept.
+def decimate_mask(vessel_keys, seconds, lat, lon, min_seconds=0, min_meters=0):
+    n = len(lat)
+    keep = np.ones(n, dtype=bool)
+    if n == 0:
+        return keep
+    offsets, ends = _track_bounds(vessel_keys)
+    first = np.zeros(n, dtype=bool)
+    first[offsets] = True
+
+    if min_seconds > 0:
+        bucket = np.floor_divide(np.asarray(seconds, dtype=float), min_seconds)
+        changed = np.ones(n, dtype=bool)
+        changed[1:] = bucket[1:] != bucket[:-1]
+        keep &= first | changed
+
+    if min_meters > 0:
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        cell_y = np.floor(lat * METERS_PER_DEGREE / min_meters)
+        cell_x = np.floor(lon * METERS_PER_DEGREE * np.cos(np.radians(lat)) / min_meters)
+        changed = np.ones(n, dtype=bool)
+        changed[1:] = (cell_y[1:] != cell_y[:-1]) | (cell_x[1:] != cell_x[:-1])
+        keep &= first | changed
+
+    keep[ends] = True
+    return keep
+
+
+# Mask of points kept by Douglas-Peucker with a tolerance in meters. Every pass splits
+# all open segments of all vessels at once, so the number of NumPy passes grows with
+# the recursion depth rather than with the number of vessels or points.
+def douglas_peucker_mask(vessel_keys, lat, lon, tolerance_m):
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    n = len(lat)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    offsets, ends = _track_bounds(vessel_keys)
+    keep[offsets] = True
+    keep[ends] = True
+
+    starts, stops = offsets, ends
+    while True:
+        open_segments = stops - starts > 1
+        starts, stops = starts[open_segments], stops[open_segments]
+        if len(starts) == 0:
+            break
+
+        # Indices of the interior points of every segment, grouped by segment
+        counts = stops - starts - 1
+        segment = np.repeat(np.arange(len(starts)), counts)
+        first_interior = np.cumsum(counts) - counts
+        idx = np.arange(counts.sum()) - np.repeat(first_interior, counts) + np.repeat(starts + 1, counts)
+
+        # Distance to the chord in a local equirectangular projection
+        s, e = starts[segment], stops[segment]
+        scale = np.cos(np.radians(lat[s])) * METERS_PER_DEGREE
+        ax, ay = lon[s] * scale, lat[s] * METERS_PER_DEGREE
+        bx, by = lon[e] * scale, lat[e] * METERS_PER_DEGREE
+        px, py = lon[idx] * scale, lat[idx] * METERS_PER_DEGREE
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(np.where(length_sq > 0, ((px - ax) * dx + (py - ay) * dy) / length_sq, 0), 0, 1)
+        distance = np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+        # Farthest point of every segment
+        max_distance = np.maximum.reduceat(distance, first_interior)
+        is_max = distance == max_distance[segment]
+        farthest_segment, first_max = np.unique(segment[is_max], return_index=True)
+        farthest = idx[is_max][first_max]
+
+        split = max_distance[farthest_segment] > tolerance_m
+        split_segment, split_at = farthest_segment[split], farthest[split]
+        keep[split_at] = True
+
+        starts = np.concatenate((starts[split_segment], split_at))
+        stops = np.concatenate((split_at, stops[split_segment]))
+
+    return keep
+
+
+# Simplify tracks sorted by vessel then time for display at the given zoom.
+# Returns the mask of points to draw and stats on the reduction and its cost.
+def simplify_tracks(vessel_keys, seconds, lat, lon, zoom, config=DEFAULT_CONFIG):
+    started = time.perf_counter()
+    n = len(lat)
+    keep = np.ones(n, dtype=bool)
+
+    if config.get('enabled', True) and n > 0:
+        keep = decimate_mask(vessel_keys, seconds, lat, lon,
+                             config.get('min_seconds', 0), config.get('min_meters', 0))
+        tolerance_px = config.get('tolerance_px', 0)
+        if tolerance_px > 0 and zoom is not None:
+            tolerance_m = tolerance_px * meters_per_pixel(zoom, float(np.mean(lat)))
+            kept = np.flatnonzero(keep)
+            dp_keep = douglas_peucker_mask(np.asarray(vessel_keys)[kept], np.asarray(lat)[kept],
+                                           np.asarray(lon)[kept], tolerance_m)
+            keep[kept[~dp_keep]] = False
+
+    points_out = int(keep.sum())
+    stats = {
+        'points_in': n,
+        'points_out': points_out,
+        'reduction': 1 - points_out / n if n else 0.0,
+        'seconds': time.perf_counter() - started,
+    }
+    return keep, stats
+
+
+# Function to describe simplification stats for display
+def format_stats(stats):
+    return (f"Track points: {stats['points_in']} → {stats['points_out']} "
+            f"({stats['reduction']:.0%} fewer, {stats['seconds'] * 1000:.1f} ms)")
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+# The apps are flat modules one level up; the benchmarks' data generators are reused too
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [APP_DIR, os.path.join(APP_DIR, 'benchmarks')]
+
+import db  # noqa: E402
+
+# Integration tests run against the PostgreSQL database this libpq DSN points to, e.g.
+# VESSEL_TEST_DSN="host=localhost dbname=vessel_test user=postgres"; they are skipped without it.
+# Each test works in a schema of its own that is dropped afterwards.
+TEST_DSN_ENV = 'VESSEL_TEST_DSN'
+
+VESSEL_TRACKS_TABLE = """
+    CREATE TABLE vessel_tracks (
+        id SERIAL PRIMARY KEY,
+        source TEXT,
+        vesselname TEXT,
+        sourcedatetime BIGINT,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION
+    )
+"""
+
+
+# Connection to an empty vessel_tracks table in a throwaway schema, with db.DB_CONFIG pointed at it.
+# Yields a function that inserts a DataFrame of vessel_tracks rows.
+@pytest.fixture
+def pg_tracks(monkeypatch):
+    dsn = os.environ.get(TEST_DSN_ENV)
+    if not dsn:
+        pytest.skip(f"set {TEST_DSN_ENV} to run the database integration tests")
+    import psycopg2
+    from psycopg2.extensions import parse_dsn
+    from psycopg2.extras import execute_values
+
+    schema = f"vessel_test_{os.getpid()}"
+    admin = psycopg2.connect(dsn)
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {schema}")
+        cursor.execute(f"SET search_path TO {schema}, public")
+        cursor.execute(VESSEL_TRACKS_TABLE)
+
+    def insert(tracks):
+        columns = ['source', 'vesselname', 'sourcedatetime', 'latitude', 'longitude']
+        rows = [(source, name, int(seconds), float(lat), float(lon))
+                for source, name, seconds, lat, lon in tracks[columns].itertuples(index=False, name=None)]
+        with admin.cursor() as cursor:
+            execute_values(cursor, f"INSERT INTO vessel_tracks ({', '.join(columns)}) VALUES %s", rows)
+
+    # Fresh pool and feature checks for the test schema; PostGIS stays reachable through public
+    config = dict(parse_dsn(dsn), options=f"-csearch_path={schema},public")
+    monkeypatch.setattr(db, 'DB_CONFIG', config)
+    monkeypatch.setattr(db, '_pool', None)
+    monkeypatch.setattr(db, '_postgis_available', None)
+    monkeypatch.setattr(db, '_enrichment_available', None)
+    try:
+        yield insert
+    finally:
+        if db._pool is not None:
+            db._pool.closeall()
+        with admin.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        admin.close()
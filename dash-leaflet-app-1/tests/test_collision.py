@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import collision
+
+NOW = 1792200000.0
+
+
+# Latest reports of a crowded anchorage, with some glitched speeds and positions mixed in
+def latest_reports(rng, vessels=300):
+    latest = pd.DataFrame({
+        'vesselname': [f'VESSEL {i:04d}' for i in range(vessels)],
+        'sourcedatetime': NOW - rng.integers(0, 900, size=vessels),
+        'latitude': 1.2 + rng.normal(0, 0.05, size=vessels),
+        'longitude': 103.8 + rng.normal(0, 0.05, size=vessels),
+        'speed': rng.uniform(0, 25, size=vessels),
+        'course': rng.uniform(0, 360, size=vessels),
+    })
+    latest.loc[rng.choice(vessels, 10, replace=False), 'speed'] = rng.uniform(100, 1e6, size=10)
+    latest.loc[rng.choice(vessels, 5, replace=False), 'course'] = np.nan
+    latest.loc[rng.choice(vessels, 3, replace=False), 'latitude'] = [89.999, -89.99, 95.0]
+    return latest
+
+
+# Every pair checked directly from the monitor's state, without the spatial hash
+def brute_force(monitor, now):
+    state, names = monitor._state, monitor._names
+    i, j = np.triu_indices(len(names), k=1)
+    fresh = (now - state['seconds'][i] <= monitor.max_age_seconds) & (now - state['seconds'][j] <= monitor.max_age_seconds)
+    i, j = i[fresh], j[fresh]
+    cpa, _, _ = collision.cpa_tcpa(i, j, state['seconds'], state['lat'], state['lon'],
+                                   state['v_east'], state['v_north'], now, monitor.horizon_seconds)
+    close = cpa < monitor.threshold_m
+    return {frozenset(pair) for pair in zip(names[i[close]], names[j[close]])}
+
+
+def alert_pairs(monitor, now):
+    alerts = monitor.alerts(now)
+    return {frozenset(pair) for pair in zip(alerts['vessel_a'], alerts['vessel_b'])}
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_alerts_match_brute_force_across_updates(seed):
+    rng = np.random.default_rng(seed)
+    monitor = collision.CollisionMonitor()
+    latest = latest_reports(rng)
+    for step in range(4):
+        monitor.update(latest)
+        now = NOW + step * 60
+        assert alert_pairs(monitor, now) == brute_force(monitor, now)
+
+        # A few vessels report again, some of them now near the pole where boxes get wide
+        moved = rng.choice(len(latest), 30, replace=False)
+        latest = latest.copy()
+        latest.loc[moved, 'sourcedatetime'] = now + 60
+        latest.loc[moved, 'latitude'] += rng.normal(0, 0.01, size=30)
+        latest.loc[moved[:2], 'latitude'] = 89.9
+
+
+def test_implausible_speed_is_stationary_and_boxes_are_capped():
+    monitor = collision.CollisionMonitor()
+    monitor.update(pd.DataFrame({
+        'vesselname': ['GLITCH', 'POLAR', 'NORMAL'],
+        'sourcedatetime': [NOW, NOW, NOW],
+        'latitude': [1.2, 89.99, 1.3],
+        'longitude': [103.8, 0.0, 103.9],
+        'speed': [1e6, 10.0, 12.0],
+        'course': [90.0, 45.0, 180.0],
+    }))
+    assert monitor._state['v_east'][0] == 0 and monitor._state['v_north'][0] == 0
+    assert monitor.stats['wide'] == 1
+    counts = np.bincount(monitor._cell_slots, minlength=3)
+    assert counts.max() <= collision.MAX_CELLS_PER_VESSEL and counts[1] == 0
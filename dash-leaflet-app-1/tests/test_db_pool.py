@@ -0,0 +1,146 @@
+import threading
+import time
+
+import psycopg2
+import pytest
+from psycopg2 import pool
+
+import db
+
+
+# Stand-in for a psycopg2 connection that records the statements run on it
+class FakeConnection:
+    def __init__(self, **config):
+        self.config = config
+        self.closed = False
+        self.autocommit = False
+        self.executed = []
+        self.fail = False
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    description = [('value',)]
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if self.conn.fail:
+            self.conn.closed = True
+            raise psycopg2.OperationalError('server closed the connection')
+        self.conn.executed.append(query)
+
+    def fetchall(self):
+        return [(1,)]
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(**config):
+        opened.append(FakeConnection(**config))
+        return opened[-1]
+
+    monkeypatch.setattr(db.psycopg2, 'connect', connect)
+    monkeypatch.setattr(db, 'metrics', db.PoolMetrics())
+    return opened
+
+
+@pytest.fixture
+def shared_pool(connections, monkeypatch):
+    connection_pool = db.ConnectionPool(2, timeout=0.1, dbname='vesselDB')
+    monkeypatch.setattr(db, '_pool', connection_pool)
+    return connection_pool
+
+
+def test_connections_get_a_connect_timeout(connections):
+    with db.ConnectionPool(1, dbname='vesselDB').connection():
+        pass
+    assert connections[0].config['connect_timeout'] == db.CONNECT_TIMEOUT
+    assert connections[0].autocommit
+
+
+def test_exhausted_pool_times_out_and_recovers(connections):
+    connection_pool = db.ConnectionPool(1, timeout=0.05)
+    with connection_pool.connection():
+        started = time.perf_counter()
+        with pytest.raises(pool.PoolError):
+            with connection_pool.connection():
+                pass
+        assert time.perf_counter() - started >= 0.05
+
+    # The slot is back, and the idle connection is reused rather than reopened
+    with connection_pool.connection() as conn:
+        assert conn is connections[0]
+    assert len(connections) == 1
+
+
+def test_waiters_get_the_connection_when_it_is_released(connections):
+    connection_pool = db.ConnectionPool(1, timeout=2)
+    got = []
+
+    def wait_for_connection():
+        with connection_pool.connection() as conn:
+            got.append(conn)
+
+    with connection_pool.connection():
+        waiter = threading.Thread(target=wait_for_connection)
+        waiter.start()
+        time.sleep(0.05)
+        assert not got
+    waiter.join(1)
+    assert got == [connections[0]]
+
+
+def test_statements_are_prepared_once_per_connection(shared_pool, connections):
+    for _ in range(3):
+        db.fetch_all("SELECT %s", (1,), name='test_statement')
+    assert connections[0].executed.count("PREPARE test_statement AS SELECT $1") == 1
+    assert connections[0].executed.count("EXECUTE test_statement (%s)") == 3
+
+    # A broken connection is discarded with its prepared set; its replacement prepares again
+    connections[0].fail = True
+    with pytest.raises(psycopg2.OperationalError):
+        db.fetch_all("SELECT %s", (1,), name='test_statement')
+    db.fetch_all("SELECT %s", (1,), name='test_statement')
+    assert connections[1].executed.count("PREPARE test_statement AS SELECT $1") == 1
+    assert id(connections[0]) not in shared_pool._prepared
+
+
+def test_idle_connections_are_pinged_after_the_health_check_interval(connections):
+    connection_pool = db.ConnectionPool(1)
+    with connection_pool.connection():
+        pass
+    conn = connections[0]
+
+    # Recently used: handed out without a round trip
+    with connection_pool.connection():
+        pass
+    assert conn.executed == []
+
+    # Idle past the interval: pinged before reuse
+    connection_pool._idle = [(conn, time.monotonic() - db.HEALTH_CHECK_INTERVAL - 1)]
+    with connection_pool.connection() as reused:
+        assert reused is conn
+    assert conn.executed == ["SELECT 1"]
+
+    # A failed ping replaces the connection
+    conn.fail = True
+    connection_pool._idle = [(conn, time.monotonic() - db.HEALTH_CHECK_INTERVAL - 1)]
+    with connection_pool.connection() as replaced:
+        assert replaced is connections[1]
+    assert conn.closed
+    assert db.metrics.health_failures == 1
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+import db
+
+CONFIG = {'enabled': True, 'point_budget': 20000, 'turn_degrees': 15, 'min_bucket_seconds': 60}
+
+
+@pytest.mark.parametrize('start, end, vessels, expected', [
+    (0, 86400, 1, 0),  # 10000 buckets per vessel would be 9 s each, finer than the minimum
+    (0, 7 * 86400, 1, 61),
+    (0, 7 * 86400, 10, 605),  # 1000 buckets per vessel
+    (0, 3600, 20000, 3600),  # Budget below one bucket per vessel: still one bucket
+    (0, 86400, 0, 0),
+])
+def test_downsample_bucket_seconds(start, end, vessels, expected):
+    assert app.downsample_bucket_seconds(start, end, vessels, CONFIG) == expected
+
+
+def test_downsampling_can_be_disabled():
+    assert app.downsample_bucket_seconds(0, 30 * 86400, 5, dict(CONFIG, enabled=False)) == 0
+
+
+def test_last_bearing_uses_the_raw_previous_fix():
+    # The last two kept points head north; the raw fix before the last one is due west of it
+    downsampled = {'latitude': np.array([1.0, 1.1]), 'longitude': np.array([103.8, 103.8]),
+                   'prev_latitude': np.array([np.nan, 1.1]), 'prev_longitude': np.array([np.nan, 103.79])}
+    assert app.last_bearing(downsampled) == pytest.approx(90, abs=0.01)
+    assert app.last_bearing({'latitude': np.array([1.0, 1.1]), 'longitude': np.array([103.8, 103.8])}) == 0
+    assert app.last_bearing({'latitude': np.array([1.0]), 'longitude': np.array([103.8])}) == 0
+    assert app.last_bearing(dict(downsampled, course_deg=np.array([np.nan, 42.0]))) == 42.0
+
+
+# Compass bearing from one fix to the next, as the query computes it with atan2d
+def bearing(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    return np.degrees(np.arctan2(np.sin(lon2 - lon1) * np.cos(lat2),
+                                 np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)))
+
+
+# (vessel, latitude) of the rows DOWNSAMPLED_VESSELS_QUERY keeps: the first of each bucket,
+# each vessel's last, and the sharpest turn of a bucket when above the threshold
+def reference_kept(tracks, bucket_seconds, turn_degrees):
+    kept = set()
+    for name, group in tracks.sort_values(['vesselname', 'sourcedatetime']).groupby('vesselname'):
+        lat, lon = group['latitude'].to_numpy(), group['longitude'].to_numpy()
+        course_in = np.full(len(group), np.nan)
+        course_out = np.full(len(group), np.nan)
+        course_in[1:] = bearing(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        course_out[:-1] = course_in[1:]
+        change = np.abs(course_out - course_in)
+        turn = np.minimum(change, 360 - change)
+        buckets = np.floor(group['sourcedatetime'].to_numpy() / bucket_seconds)
+        for bucket in np.unique(buckets):
+            rows = np.flatnonzero(buckets == bucket)
+            kept.add((name, lat[rows[0]]))
+            if not np.isnan(turn[rows]).all():
+                sharpest = rows[np.nanargmax(turn[rows])]
+                if turn[sharpest] > turn_degrees:
+                    kept.add((name, lat[sharpest]))
+        kept.add((name, lat[-1]))
+    return kept
+
+
+# Wandering tracks with sharp turns, over integer or fractional epochs
+def wandering_tracks(fractional, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for vessel in range(5):
+        points = 300
+        seconds = 1792108800 + np.cumsum(rng.uniform(5, 40, points))
+        heading = np.radians(np.cumsum(rng.choice([0, 0, 0, 5, -5, 60, -90], points)))
+        step = rng.uniform(0.0005, 0.002, points)
+        frames.append(pd.DataFrame({
+            'source': 'AIS',
+            'vesselname': f'VESSEL {vessel}',
+            'sourcedatetime': seconds if fractional else np.round(seconds),
+            'latitude': 1.2 + np.cumsum(step * np.cos(heading)),
+            'longitude': 103.8 + np.cumsum(step * np.sin(heading)),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.mark.parametrize('column_type', ['BIGINT', 'DOUBLE PRECISION'])
+def test_downsampled_query_keeps_bucket_firsts_turns_and_last_points(pg_tracks, column_type):
+    with db.get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE vessel_tracks ALTER COLUMN sourcedatetime TYPE {column_type}")
+    tracks = wandering_tracks(fractional=column_type != 'BIGINT')
+    pg_tracks(tracks)
+    app.get_vessels_data.cache_clear()
+
+    names = tuple(sorted(tracks['vesselname'].unique()))
+    start, end = int(tracks['sourcedatetime'].min()), int(tracks['sourcedatetime'].max()) + 1
+    bucket_seconds = 300
+    data = app.get_vessels_data(start, end, names, bucket_seconds)
+    app.get_vessels_data.cache_clear()
+
+    kept = {(name, lat) for name, columns in data.items() for lat in columns['latitude']}
+    assert kept == reference_kept(tracks, bucket_seconds, app.DOWNSAMPLE_CONFIG['turn_degrees'])
+
+    # The last point carries the raw fix before it
+    for name, group in tracks.sort_values('sourcedatetime').groupby('vesselname'):
+        assert data[name]['latitude'][-1] == group['latitude'].iloc[-1]
+        assert data[name]['prev_latitude'][-1] == group['latitude'].iloc[-2]
@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point, Polygon
+
+import geofence_filter
+
+# Concave polygon as [lat, lon] pairs, like the drawn geofences
+CONCAVE = [[1.0, 103.0], [1.5, 103.2], [1.1, 103.4], [1.5, 103.6], [1.0, 103.8], [1.0, 103.0]]
+
+
+# Points around the polygon's bounding box, so some are rejected by the box and some by the exact test
+def random_points(seed=0, n=5000):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0.9, 1.6, n), rng.uniform(102.9, 103.9, n)
+
+
+# One shapely Point per row, as the filter did before geofence_filter.py
+def reference_mask(coordinates, lat, lon):
+    polygon = Polygon([(lon, lat) for lat, lon in coordinates])
+    return np.array([polygon.contains(Point(x, y)) for y, x in zip(lat, lon)])
+
+
+@pytest.mark.parametrize('shapely_arrays', [True, False])
+def test_contains_matches_shapely_points(monkeypatch, shapely_arrays):
+    # Without shapely 2 the NumPy ray-casting kernel is used
+    monkeypatch.setattr(geofence_filter, 'HAS_SHAPELY_ARRAYS', shapely_arrays and geofence_filter.HAS_SHAPELY_ARRAYS)
+    lat, lon = random_points()
+    mask = geofence_filter.Geofence(CONCAVE).contains(lat, lon)
+    np.testing.assert_array_equal(mask, reference_mask(CONCAVE, lat, lon))
+
+
+def test_ray_cast_matches_shapely_points():
+    lat, lon = random_points(1)
+    geofence = geofence_filter.Geofence(CONCAVE)
+    inside = geofence_filter.ray_cast(geofence.lons, geofence.lats, lon, lat)
+    np.testing.assert_array_equal(inside, reference_mask(CONCAVE, lat, lon))
+
+
+def test_filter_mask_from_geofence_json():
+    lat, lon = random_points(2)
+    df = pd.DataFrame({'latitude': lat, 'longitude': lon})
+    mask = geofence_filter.filter_mask(df, json.dumps(CONCAVE))
+    np.testing.assert_array_equal(mask, reference_mask(CONCAVE, lat, lon))
+
+
+def test_empty_input():
+    assert len(geofence_filter.Geofence(CONCAVE).contains([], [])) == 0
@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+import geofen
+import geofence_filter
+from fixture_db import FixtureDB
+from synthetic import central_geofence_json, generate_tracks
+
+# Two overlapping zones and one apart, as geofence-data holds saved zones
+ZONES = {
+    '1': [[1.1, 103.5], [1.4, 103.5], [1.4, 103.9], [1.1, 103.9], [1.1, 103.5]],
+    '2': [[1.2, 103.7], [1.5, 103.7], [1.5, 104.1], [1.2, 104.1], [1.2, 103.7]],
+    '3': [[1.0, 103.4], [1.1, 103.4], [1.1, 103.5], [1.0, 103.5], [1.0, 103.4]],
+}
+
+
+# Synthetic window answered from memory: the in-process path reads geofen_vessel_rows and the
+# pushdown path geofen_vessels_in_geofence, both from the same tracks
+@pytest.fixture
+def fixture_db():
+    tracks = generate_tracks(60, 200, 2, seed=1)
+    # A vessel with a single report in the window, where zones 1 and 2 overlap
+    single = tracks.iloc[[0]].assign(vesselname='SINGLE', sourcedatetime=tracks['sourcedatetime'].max(),
+                                     latitude=1.3, longitude=103.85)
+    fixture = FixtureDB(pd.concat([tracks, single], ignore_index=True))
+    fixture.install()
+    yield fixture
+    fixture.uninstall()
+
+
+# Rows the Python path keeps: speed and course over the whole window, then source and area filters
+def in_process(geofence_json, sources_key):
+    window = geofen.fetch_all_vessel_data(1)
+    if sources_key:
+        window = window[window['source'].isin(sources_key)]
+    return window[geofence_filter.filter_mask(window, geofence_json)]
+
+
+@pytest.mark.parametrize('geofence_json', [central_geofence_json(), json.dumps(ZONES)])
+@pytest.mark.parametrize('sources_key', [(), ('AIS',)])
+def test_pushdown_matches_in_process_filter(fixture_db, geofence_json, sources_key):
+    expected = in_process(geofence_json, sources_key)
+    pushed_down = geofen.fetch_vessels_in_geofence(1, geofence_json, sources_key)
+    assert 'SINGLE' in set(expected['vesselname'])
+    assert len(pushed_down) == len(expected)
+
+    merged = expected.merge(pushed_down, on=geofen.TRACK_KEY_COLUMNS, suffixes=('', '_pushed'))
+    assert len(merged) == len(expected)
+    for column in ('speed', 'course', 'distance', 'time_diff'):
+        np.testing.assert_allclose(merged[column + '_pushed'].to_numpy(dtype=float), merged[column].to_numpy(dtype=float),
+                                   rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=column)
+
+
+def test_zone_union_is_valid_for_overlapping_zones():
+    index = geofence_filter.ZoneIndex(ZONES)
+    assert index.polygon.is_valid
+    lat, lon = np.meshgrid(np.linspace(0.95, 1.55, 60), np.linspace(103.35, 104.15, 60))
+    np.testing.assert_array_equal(shapely.contains_xy(index.polygon, lon.ravel(), lat.ravel()),
+                                  index.contains(lat.ravel(), lon.ravel()))
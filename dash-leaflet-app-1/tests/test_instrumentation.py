@@ -0,0 +1,91 @@
+import re
+
+import dash
+import pytest
+from dash import Input, Output, html
+
+import instrumentation
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setattr(instrumentation, 'metrics', instrumentation.CallbackMetrics())
+    return instrumentation.metrics
+
+
+# A small instrumented app with one callback, served through Flask's test client
+@pytest.fixture
+def client(metrics):
+    app = dash.Dash(__name__)
+    instrumentation.instrument(app)
+    instrumentation.register_metrics_route(app.server)
+    app.layout = html.Div([html.Div(id=name) for name in ('in', 'out', 'left', 'right')])
+
+    @app.callback(Output('out', 'children'), Input('in', 'children'))
+    def echo(value):
+        return [html.Span(value) for _ in range(100)]
+
+    @app.callback([Output('left', 'children'), Output('right', 'children')], Input('in', 'children'))
+    def split(value):
+        return value, value
+
+    client = app.server.test_client()
+    assert client.get('/').status_code == 200
+    return client
+
+
+def update_component(client, value):
+    return client.post('/_dash-update-component', json={
+        'output': 'out.children',
+        'outputs': {'id': 'out', 'property': 'children'},
+        'inputs': [{'id': 'in', 'property': 'children', 'value': value}],
+        'changedPropIds': ['in.children'],
+        'state': [],
+    })
+
+
+def test_every_histogram_family_is_recorded_for_a_callback_request(client):
+    bodies = []
+    for value in ('hello', 'again'):
+        response = update_component(client, value)
+        assert response.status_code == 200
+        bodies.append(response.get_data())
+
+    text = client.get('/metrics').get_data(as_text=True)
+    for family in instrumentation.CallbackMetrics.SERIES:
+        assert re.search(rf'^{family}_count{{callback="echo"}} 2$', text, re.MULTILINE), family
+
+    # The payload is the body Dash sent, measured on the final response
+    payload_sum = re.search(r'^dash_callback_payload_bytes_sum{callback="echo"} (\S+)$', text, re.MULTILINE)[1]
+    assert float(payload_sum) == sum(len(body) for body in bodies)
+
+
+def test_multi_output_callbacks_are_named_by_their_function(client):
+    response = client.post('/_dash-update-component', json={
+        'output': '..left.children...right.children..',
+        'outputs': [{'id': 'left', 'property': 'children'}, {'id': 'right', 'property': 'children'}],
+        'inputs': [{'id': 'in', 'property': 'children', 'value': 'x'}],
+        'changedPropIds': ['in.children'],
+        'state': [],
+    })
+    assert response.status_code == 200
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'dash_callback_payload_bytes_count{callback="split"} 1' in text
+
+
+def test_errors_are_counted_and_not_observed(metrics):
+    app = dash.Dash(__name__)
+    instrumentation.instrument(app)
+    instrumentation.register_metrics_route(app.server)
+    app.layout = html.Div([html.Div(id='in'), html.Div(id='out')])
+
+    @app.callback(Output('out', 'children'), Input('in', 'children'))
+    def broken(value):
+        raise ValueError(value)
+
+    client = app.server.test_client()
+    client.get('/')
+    assert update_component(client, 'x').status_code == 500
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'dash_callback_errors_total{callback="broken"} 1' in text
+    assert 'callback="broken",le=' not in text
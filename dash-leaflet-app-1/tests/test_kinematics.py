@@ -0,0 +1,186 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import enrich
+import geofen
+import kinematics
+from kinematics import KM_TO_NAUTICAL_MILES, KNOTS_TO_KMH
+
+
+# Row-by-row speed and course with the scalar helpers, as calculate_speed_and_course did
+# before kinematics.py. Points must be sorted by vessel, then time.
+def reference_kinematics(names, seconds, lat, lon):
+    n = len(names)
+    distance, time_diff, speed, course = (np.full(n, np.nan) for _ in range(4))
+    for i in range(n):
+        first = i == 0 or names[i] != names[i - 1]
+        last = i == n - 1 or names[i] != names[i + 1]
+        if first:
+            if last:
+                course[i] = 0  # Vessels with only one data point
+            continue
+        distance[i] = geofen.haversine(lon[i - 1], lat[i - 1], lon[i], lat[i])
+        time_diff[i] = seconds[i] - seconds[i - 1]
+        speed[i] = distance[i] / (time_diff[i] / 3600) * KM_TO_NAUTICAL_MILES if time_diff[i] > 0 else 0
+        course[i] = geofen.calculate_initial_compass_bearing((lat[i - 1], lon[i - 1]), (lat[i], lon[i]))
+    return distance, time_diff, speed, course
+
+
+# Random tracks sorted by vessel and time, with single-point vessels and repeated timestamps
+def random_tracks(seed=0, vessels=40):
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, 30, vessels)
+    sizes[:5] = 1
+    names = np.repeat([f"VESSEL {i:03d}" for i in range(vessels)], sizes)
+    seconds = np.concatenate([np.sort(rng.integers(0, 3600, size)) for size in sizes]).astype(float)
+    lat = rng.uniform(-60, 60, len(names))
+    lon = rng.uniform(-180, 180, len(names))
+    return names, seconds, lat, lon
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_track_kinematics_matches_scalar_helpers(seed):
+    names, seconds, lat, lon = random_tracks(seed)
+    expected = reference_kinematics(names, seconds, lat, lon)
+    actual = kinematics.track_kinematics(names, seconds, lat, lon)
+    for column, want, got in zip(['distance', 'time_diff', 'speed', 'course'], expected, actual):
+        np.testing.assert_allclose(got, want, rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=column)
+
+
+def test_single_point_vessel_gets_course_zero():
+    distance, time_diff, speed, course = kinematics.track_kinematics(
+        np.array(['A', 'B', 'B']), np.array([0.0, 0.0, 60.0]), np.array([1.0, 1.0, 1.01]), np.array([103.0, 103.0, 103.0]))
+    assert course[0] == 0 and math.isnan(speed[0]) and math.isnan(course[1])
+    assert course[2] == pytest.approx(geofen.calculate_initial_compass_bearing((1.0, 103.0), (1.01, 103.0)))
+
+
+def test_empty_input():
+    result = kinematics.track_kinematics(np.array([], dtype=object), np.array([]), np.array([]), np.array([]))
+    assert all(len(values) == 0 for values in result)
+
+
+def test_calculate_speed_and_course_matches_scalar_helpers():
+    names, seconds, lat, lon = random_tracks(3)
+    df = pd.DataFrame({'source': 'AIS', 'vesselname': names, 'sourcedatetime': seconds.astype(np.int64),
+                       'latitude': lat, 'longitude': lon})
+    df['timestamp'] = pd.to_datetime(df['sourcedatetime'], unit='s')
+    # Shuffled, so the function has to sort by vessel and time itself
+    result = geofen.calculate_speed_and_course(df.sample(frac=1, random_state=0))
+
+    # The reference walks the rows in the order the function sorted them into
+    expected = reference_kinematics(result['vesselname'].to_numpy(), result['sourcedatetime'].to_numpy(),
+                                    result['latitude'].to_numpy(), result['longitude'].to_numpy())
+    for column, want in zip(['distance', 'time_diff', 'speed', 'course'], expected):
+        np.testing.assert_allclose(result[column].to_numpy(), want, rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=column)
+
+
+# The scalar flat-earth projection dead_reckon replaced, as it was in geofen.py
+def calculate_trajectory(lat, lon, speed, course, duration_minutes=30):
+    speed_kmh = speed * 1.852
+    course_rad = (90 - course) * (math.pi / 180)
+    R = 6378.1
+    distance = (speed_kmh * (duration_minutes / 60)) / R
+    new_lat = lat + (distance * math.cos(course_rad)) * (180 / math.pi)
+    new_lon = lon + (distance * math.sin(course_rad) / math.cos(lat * (math.pi / 180))) * (180 / math.pi)
+    return [(lat, lon), (new_lat, new_lon)]
+
+
+# Latest positions to project: moderate latitudes, harbour to ocean speeds, every course
+def moving_vessels(seed=0, vessels=200):
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(-60, 60, vessels), rng.uniform(-180, 180, vessels),
+            rng.uniform(0.5, 30, vessels), rng.uniform(0, 360, vessels))
+
+
+@pytest.mark.parametrize('minutes', [5, 30])
+def test_dead_reckon_matches_the_scalar_trajectory(minutes):
+    lat, lon, speed, course = moving_vessels()
+    # calculate_trajectory measured its angle from east, so it moved a vessel on course c
+    # along compass bearing 90 - c (a northbound vessel went east); on the diagonals the two agree
+    for bearing, legacy_course in ((course, 90 - course), (np.full_like(course, 45), np.full_like(course, 45)),
+                                   (np.full_like(course, 225), np.full_like(course, 225))):
+        pred_lat, pred_lon = kinematics.dead_reckon(lat, lon, speed, bearing, [minutes])
+        expected = np.array([calculate_trajectory(*args, duration_minutes=minutes)[1]
+                             for args in zip(lat, lon, speed, legacy_course)])
+
+        # Flat earth vs great circle (and a 6378.1 km radius) differ by well under 1% of the run
+        travelled = speed * KNOTS_TO_KMH * minutes / 60
+        error = kinematics.haversine_km(pred_lat[:, 0], pred_lon[:, 0], expected[:, 0], expected[:, 1])
+        assert np.all(error < 0.01 * travelled)
+
+
+def test_destination_point_round_trips_with_haversine_and_bearing():
+    lat, lon, _, course = moving_vessels(1)
+    distance = np.random.default_rng(1).uniform(0.1, 500, len(lat))
+    lat2, lon2 = kinematics.destination_point(lat, lon, course, distance)
+    np.testing.assert_allclose(kinematics.haversine_km(lat, lon, lat2, lon2), distance, rtol=1e-9)
+    turn = (kinematics.initial_bearing(lat, lon, lat2, lon2) - course + 180) % 360 - 180
+    np.testing.assert_allclose(turn, 0, atol=1e-6)
+    assert np.all((lon2 >= -180) & (lon2 < 180))
+
+
+def test_dead_reckon_shapes_and_stopped_vessels():
+    pred_lat, pred_lon = kinematics.dead_reckon([1.2, 1.3], [103.8, 103.9], [0.0, 12.0], [90.0, 0.0], [5, 15, 30])
+    assert pred_lat.shape == pred_lon.shape == (2, 3)
+    np.testing.assert_allclose(pred_lat[0], 1.2)
+    np.testing.assert_allclose(pred_lon[0], 103.8)
+    # Due north: latitude grows with the horizon, longitude stays put
+    assert np.all(np.diff(pred_lat[1]) > 0)
+    np.testing.assert_allclose(pred_lon[1], 103.9, atol=1e-9)
+
+
+# vessel_tracks as enrich.py sees it: rows inserted in batches, with the job run after each
+class EnrichedTable:
+    def __init__(self):
+        self.rows = pd.DataFrame(columns=enrich.ORDER_COLUMNS + ['speed_kn', 'course_deg', 'prev_gap_s', 'pending'])
+
+    def insert(self, rows):
+        rows = rows.assign(speed_kn=np.nan, course_deg=np.nan, prev_gap_s=np.nan, pending=True)
+        self.rows = pd.concat([self.rows, rows], ignore_index=True).astype({'pending': bool})
+
+    # One enrich_pending over every vessel: ROWS_QUERY's rows, then UPDATE_QUERY
+    def enrich(self):
+        table = self.rows.sort_values(enrich.ORDER_COLUMNS)
+        parts = []
+        for _, rows in table.groupby('vesselname', sort=False):
+            if not rows['pending'].any():
+                continue
+            since = rows.loc[rows['pending'], 'sourcedatetime'].min()
+            before = rows['sourcedatetime'] < since
+            parts += [rows[before].tail(1).assign(context=True), rows[~before].assign(context=False)]
+        if not parts:
+            return
+        updates = enrich.compute_enrichment(pd.concat(parts, ignore_index=True)).set_index(enrich.ORDER_COLUMNS)
+        table = self.rows.set_index(enrich.ORDER_COLUMNS)
+        table.loc[updates.index, ['speed_kn', 'course_deg', 'prev_gap_s']] = updates.to_numpy()
+        table.loc[updates.index, 'pending'] = False
+        self.rows = table.reset_index()
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_stored_kinematics_match_calculate_speed_and_course(seed):
+    names, seconds, lat, lon = random_tracks(seed)
+    rng = np.random.default_rng(seed)
+    reports = pd.DataFrame({'vesselname': names, 'sourcedatetime': seconds.astype(np.int64),
+                            'source': rng.choice(['AIS', 'RADAR', 'SAT'], len(names)),
+                            'latitude': lat, 'longitude': lon})
+    # Reports in the same second as another one, from another place
+    ties = reports.sample(40, random_state=seed).assign(latitude=lambda d: d['latitude'] + 0.01, source='TIES')
+    reports = pd.concat([reports, ties], ignore_index=True)
+
+    # Inserted out of order, the job running between batches, so late reports land before enriched ones
+    table = EnrichedTable()
+    for batch in np.array_split(rng.permutation(len(reports)), 6):
+        table.insert(reports.iloc[batch])
+        table.enrich()
+    assert not table.rows['pending'].any()
+
+    window = table.rows[table.rows['sourcedatetime'] >= 1200].assign(enriched=True)
+    window['timestamp'] = pd.to_datetime(window['sourcedatetime'], unit='s')
+    stored = geofen.calculate_speed_and_course(window.copy())
+    computed = geofen.calculate_speed_and_course(window.drop(columns=geofen.ENRICHED_COLUMNS))
+    pd.testing.assert_frame_equal(stored[computed.columns], computed, rtol=1e-9)
+    assert ((stored['time_diff'] == 0) & (stored['distance'] > 0)).any()
@@ -0,0 +1,79 @@
+import dash
+import pandas as pd
+import pytest
+
+import geofen
+import map_diff
+
+
+def test_seq_round_trips_and_mismatches_force_a_full_render():
+    state = map_diff.RenderState()
+    client = state.new_client_id()
+    assert state.get(client, None) is None
+
+    seq = state.save(client, 'key', {'tracks': (['A'], {'A': 1})})
+    assert seq == 1
+    assert state.get(client, seq)['layers']['tracks'] == (['A'], {'A': 1})
+    assert state.save(client, 'key', {}) == 2
+
+    # A stale number (another worker rendered, or the tab replayed an old one) is a miss
+    assert state.get(client, 1) is None
+    assert state.get(client, 2) is not None
+    state.drop(client)
+    assert state.get(client, 2) is None
+
+
+def test_least_recently_used_clients_are_forgotten():
+    state = map_diff.RenderState(max_clients=2)
+    seqs = {client: state.save(client, 'key', {}) for client in ('a', 'b')}
+    state.get('a', seqs['a'])
+    state.save('c', 'key', {})
+    assert state.get('b', seqs['b']) is None
+    assert state.get('a', seqs['a']) is not None
+
+
+# The client's list after applying patch_layer, next to a full render of the new signatures
+@pytest.mark.parametrize('old, new', [
+    ({'A': 1, 'B': 1, 'C': 1}, {'A': 1, 'B': 1, 'C': 1}),  # Nothing changed
+    ({'A': 1, 'B': 1, 'C': 1}, {'A': 1, 'C': 1}),  # Removal in the middle
+    ({'A': 1, 'B': 1, 'C': 1}, {'A': 2, 'B': 1, 'C': 3}),  # Updates in place
+    ({'A': 1}, {'A': 1, 'D': 1, 'E': 1}),  # Additions
+    ({'A': 1, 'B': 1, 'C': 1, 'D': 1}, {'B': 2, 'E': 1, 'D': 1}),  # All at once
+])
+def test_patch_layer_turns_the_old_list_into_the_new_one(old, new):
+    client = [f"{name}{version}" for name, version in old.items()]
+    changed, names = map_diff.patch_layer(client, list(old), old, new, lambda name: f"{name}{new[name]}")
+
+    assert changed == (old != new)
+    assert sorted(client) == sorted(f"{name}{version}" for name, version in new.items())
+    assert client == [f"{name}{new[name]}" for name in names]
+
+
+def test_patch_layer_records_operations_on_a_dash_patch():
+    patch = dash.Patch()
+    old = {'A': 1, 'B': 1}
+    changed, names = map_diff.patch_layer(patch['features'], list(old), old, {'B': 2, 'C': 1}, lambda name: name)
+    operations = [operation['operation'] for operation in patch.to_plotly_json()['operations']]
+    assert changed and names == ['B', 'C']
+    assert operations == ['Delete', 'Assign', 'Append']
+
+
+# One vessel's simplified track as the map callback hands it to build_vessel_layers
+def track(times, lats):
+    return pd.DataFrame({'vesselname': 'A', 'source': 'AIS', 'sourcedatetime': times, 'latitude': lats,
+                         'longitude': 103.8, 'course': 90.0, 'speed': 10.0,
+                         'timestamp': pd.to_datetime(times, unit='s')})
+
+
+def track_signature(df):
+    signatures, _ = geofen.build_vessel_layers(df)['tracks']
+    return signatures['A']
+
+
+def test_track_signature_changes_when_the_head_expires_at_the_same_count():
+    before = track([100, 200, 300], [1.0, 1.1, 1.2])
+    assert track_signature(before) == track_signature(track([100, 200, 300], [1.0, 1.1, 1.2]))
+    # Oldest point expired while a simplified-away point in between reappeared
+    assert track_signature(before) != track_signature(track([150, 200, 300], [1.05, 1.1, 1.2]))
+    # Same ends and count, different point kept in between
+    assert track_signature(before) != track_signature(track([100, 250, 300], [1.0, 1.15, 1.2]))
@@ -0,0 +1,102 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import metadata
+from fixture_db import FixtureDB
+
+DAY = metadata.PRESENCE_BUCKET_SECONDS
+START = 1792108800  # Midnight UTC
+
+
+# Vessels reporting in bursts over five days with gaps between them, some from two sources
+def gappy_tracks(seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for vessel in range(40):
+        bursts = rng.integers(1, 6)
+        for _ in range(bursts):
+            begin = START + int(rng.integers(0, 5 * DAY))
+            times = begin + np.cumsum(rng.integers(10, 600, size=rng.integers(1, 30)))
+            frames.append(pd.DataFrame({
+                'source': rng.choice(['AIS', 'SAT']),
+                'vesselname': f'VESSEL {vessel:03d}',
+                'sourcedatetime': times,
+                'latitude': 1.2,
+                'longitude': 103.8,
+            }))
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.fixture
+def fixture_db():
+    fixture = FixtureDB(gappy_tracks())
+    fixture.install()
+    yield fixture
+    fixture.uninstall()
+
+
+# What SELECT DISTINCT vesselname ... WHERE sourcedatetime BETWEEN start AND end returns
+def distinct_vessels(tracks, start_epoch, end_epoch):
+    return sorted(tracks.loc[tracks['sourcedatetime'].between(start_epoch, end_epoch), 'vesselname'].unique())
+
+
+def test_vessels_between_matches_distinct_scan(fixture_db):
+    cache = metadata.MetadataCache()
+    rng = np.random.default_rng(1)
+    # Narrow ranges inside one day, ranges across a day boundary, and wide ones
+    for width in [60, 3600, DAY, 3 * DAY]:
+        for start_epoch in START + rng.integers(0, 6 * DAY, size=50):
+            start_epoch = int(start_epoch)
+            assert cache.vessels_between(start_epoch, start_epoch + width) == \
+                distinct_vessels(fixture_db.tracks, start_epoch, start_epoch + width)
+
+
+def test_observe_new_rows_lists_new_vessels_and_sources(fixture_db):
+    cache = metadata.MetadataCache()
+    newest = int(fixture_db.tracks['sourcedatetime'].max())
+    assert 'NEW VESSEL' not in cache.vessels_between(START, newest + 60)
+
+    fixture_db.tracks = pd.concat([fixture_db.tracks, pd.DataFrame({
+        'source': ['RADAR'], 'vesselname': ['NEW VESSEL'], 'sourcedatetime': [newest + 30],
+        'latitude': [1.2], 'longitude': [103.8]})], ignore_index=True)
+    assert cache.observe_new_rows()
+    assert 'NEW VESSEL' in cache.vessels_between(newest, newest + 60)
+    assert 'RADAR' in cache.sources()
+    assert not cache.observe_new_rows()
+
+
+def test_failed_load_backs_off(fixture_db, monkeypatch):
+    calls = []
+
+    def failing_fetch(query, params=None, name=None):
+        calls.append(name)
+        raise RuntimeError('database down')
+
+    monkeypatch.setattr(metadata.db, 'fetch_all', failing_fetch)
+    cache = metadata.MetadataCache()
+    assert cache.sources() == []
+    assert cache.sources() == []
+    assert calls == ['metadata_presence']
+
+
+def test_reload_runs_in_background_and_serves_the_previous_lists(fixture_db, monkeypatch):
+    cache = metadata.MetadataCache()
+    before = cache.sources()
+    release = threading.Event()
+    fetch_all = metadata.db.fetch_all
+
+    def slow_fetch(query, params=None, name=None):
+        release.wait(5)
+        return fetch_all(query, params, name)
+
+    monkeypatch.setattr(metadata.db, 'fetch_all', slow_fetch)
+    cache.invalidate()
+    # Answered from the previous load while the reload waits on the database
+    assert cache.sources() == before
+    assert cache._load_lock.locked()
+    release.set()
+    with cache._load_lock:
+        assert cache.sources() == before
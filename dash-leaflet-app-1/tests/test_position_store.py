@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_store
+import geofen
+import position_store
+from synthetic import central_geofence_json
+
+
+# Reports of one or more feeds as the store's append and load take them
+def reports(rows):
+    df = pd.DataFrame(rows, columns=['source', 'vesselname', 'sourcedatetime', 'latitude', 'longitude'])
+    return df.assign(speed=10.0, course=90.0)
+
+
+def test_ring_has_checks_only_the_newest_second():
+    ring = position_store._Ring(4)
+    for seconds, lat in ((100, 1.0), (200, 1.1), (200, 1.2)):
+        ring.append({'sourcedatetime': seconds, 'latitude': lat, 'longitude': 103.8, 'speed': 0, 'course': 0})
+    assert ring.has(200, 1.1, 103.8) and ring.has(200, 1.2, 103.8)
+    assert not ring.has(200, 1.3, 103.8)
+    # Older seconds are not scanned: appends never go back in time
+    assert not ring.has(100, 1.0, 103.8)
+
+
+def test_append_skips_re_read_and_late_reports():
+    store = position_store.PositionStore()
+    assert store.append(reports([('AIS', 'A', 100, 1.0, 103.8), ('AIS', 'A', 200, 1.1, 103.8)])) == 2
+    version = store.version
+    # The watermark second re-read, an older report and a new one at the same second
+    assert store.append(reports([('AIS', 'A', 200, 1.1, 103.8), ('AIS', 'A', 150, 1.05, 103.8)])) == 0
+    assert store.version == version
+    assert store.append(reports([('AIS', 'A', 200, 1.2, 103.8)])) == 1
+    assert store.version == version + 1
+    assert store.memory_stats()['positions'] == 3
+
+
+def test_rings_grow_up_to_the_window_limit():
+    store = position_store.PositionStore(hours=1, initial_capacity=4)
+    store.max_capacity = 10
+    store.append(reports([('AIS', 'A', t, 1.0 + t / 1000, 103.8) for t in range(25)]))
+    ring = store._rings[('AIS', 'A')]
+    assert ring.capacity == 10 and ring.size == 10
+    # The oldest positions were overwritten; the newest is still the tail
+    times = ring.columns['sourcedatetime'][ring._index(np.arange(ring.size))]
+    assert times.tolist() == list(range(15, 25))
+    assert ring.last('sourcedatetime') == 24
+
+
+def test_evict_before_drops_old_positions_and_empty_feeds():
+    store = position_store.PositionStore()
+    store.append(reports([('AIS', 'A', 100, 1.0, 103.8), ('AIS', 'A', 300, 1.1, 103.8),
+                          ('RADAR', 'B', 200, 1.2, 103.9)]))
+    version = store.version
+    assert store.evict_before(250) == 2
+    assert store.version == version + 1
+    assert list(store._rings) == [('AIS', 'A')]
+    assert store.evict_before(250) == 0
+    assert store.version == version + 1
+
+
+def test_latest_positions_picks_the_newest_feed_per_vessel():
+    store = position_store.PositionStore()
+    store.load(reports([('AIS', 'A', 100, 1.0, 103.8), ('RADAR', 'A', 200, 1.1, 103.8),
+                        ('AIS', 'B', 150, 1.2, 103.9)]), 1)
+    latest = store.latest_positions().set_index('vesselname')
+    assert latest.loc['A', 'source'] == 'RADAR' and latest.loc['B', 'sourcedatetime'] == 150
+    assert store.latest_positions(sources=['AIS']).set_index('vesselname').loc['A', 'sourcedatetime'] == 100
+    assert store.latest_positions(vessel_names=['B'])['vesselname'].tolist() == ['B']
+
+
+def test_snapshots_are_pinned_to_a_version():
+    store = position_store.PositionStore()
+    store.append(reports([('AIS', 'A', 100, 1.0, 103.8)]))
+    snapshot = store.snapshot()
+    assert store.snapshot() is snapshot
+    store.append(reports([('AIS', 'A', 200, 1.1, 103.8)]))
+    assert store.snapshot() != snapshot
+    assert snapshot.latest_positions()['sourcedatetime'].tolist() == [100]
+    assert snapshot.restrict(150).latest_positions().empty
+    assert snapshot.restrict(150) != snapshot and hash(snapshot.restrict(None)) == hash(snapshot)
+
+
+def test_memory_stats():
+    store = position_store.PositionStore(initial_capacity=8)
+    store.append(reports([('AIS', 'A', 100, 1.0, 103.8), ('RADAR', 'A', 100, 1.0, 103.8),
+                          ('AIS', 'B', 100, 1.2, 103.9)]))
+    stats = store.memory_stats()
+    assert stats['feeds'] == 3 and stats['vessels'] == 2 and stats['positions'] == 3
+    assert stats['capacity'] == 24
+    assert stats['bytes'] == 24 * sum(np.dtype(dtype).itemsize for dtype in position_store.COLUMNS.values())
+
+
+def test_extras_stay_with_their_version():
+    store = data_store.DataStore(max_versions=2)
+    first = store.put(pd.DataFrame(), positions='first')
+    second = store.put(pd.DataFrame(), positions='second')
+    assert store.resolve_extras(first) == {'positions': 'first'}
+    store.put(pd.DataFrame(), positions='third')
+    # Evicted tokens fall back to the latest version's extras
+    assert store.resolve_extras(first) == {'positions': 'third'}
+    assert store.resolve_extras(second) == {'positions': 'second'}
+
+
+def test_table_shows_the_tokens_positions_inside_the_geofence(monkeypatch):
+    # Vessel A is in the central geofence; B was, and has since left it
+    now = int(pd.Timestamp.now().timestamp())
+    window = reports([('AIS', 'A', now - 60, 1.30, 103.85), ('AIS', 'B', now - 60, 1.29, 103.84),
+                      ('AIS', 'B', now - 30, 1.29, 103.84)])
+    window['timestamp'] = pd.to_datetime(window['sourcedatetime'], unit='s')
+    window.attrs['hours'] = 1
+    monkeypatch.setattr(geofen, 'vessel_data_df', window)
+    monkeypatch.setattr(geofen, 'positions', position_store.PositionStore())
+    monkeypatch.setattr(geofen, 'vessel_store', data_store.DataStore())
+    monkeypatch.setattr(geofen, 'GEOFENCE_PUSHDOWN', False)
+    geofen.compute_filtered_view.cache_clear()
+    geofen.positions.load(window, 1)
+    geofen.positions.append(reports([('AIS', 'B', now, 50.0, 10.0)]))
+    token = geofen.put_vessel_data(1)
+
+    # Later positions don't change what the token shows
+    geofen.positions.append(reports([('AIS', 'A', now + 10, 1.31, 103.85)]))
+    count, details = geofen.filter_vessels_within_geofence(central_geofence_json(), [], token)
+    rows = {row.children[1].children: row.children[5].children for row in details.children[1].children[1].children}
+    assert count == "Vessels in view: 2"
+    assert rows == {'A': pd.Timestamp(now - 60, unit='s').strftime('%H:%M:%S'),
+                    'B': pd.Timestamp(now - 30, unit='s').strftime('%H:%M:%S')}
+    geofen.compute_filtered_view.cache_clear()
+
+
+def test_predictions_follow_the_tokens_positions(monkeypatch):
+    monkeypatch.setattr(geofen, 'positions', position_store.PositionStore())
+    monkeypatch.setattr(geofen, 'vessel_store', data_store.DataStore())
+    monkeypatch.setattr(geofen, 'vessel_data_df', pd.DataFrame())
+    geofen.positions.append(reports([('AIS', 'A', 100, 1.0, 103.8)]))
+    first = geofen.put_vessel_data(1)
+    geofen.positions.append(reports([('AIS', 'A', 200, 1.1, 103.8)]))
+    monkeypatch.setattr(geofen, 'vessel_data_df', pd.DataFrame())  # A new version of the data
+    second = geofen.put_vessel_data(1)
+
+    assert geofen.get_predictions(first)[0].loc['A', 'latitude'] == 1.0
+    assert geofen.get_predictions(second)[0].loc['A', 'latitude'] == 1.1
+
+
+def test_collision_alerts_follow_the_tokens_positions(monkeypatch):
+    monkeypatch.setattr(geofen, 'positions', position_store.PositionStore())
+    monkeypatch.setattr(geofen, 'vessel_store', data_store.DataStore())
+    monkeypatch.setattr(geofen, 'vessel_data_df', pd.DataFrame())
+    monkeypatch.setattr(geofen, 'collision_monitor', geofen.collision.CollisionMonitor())
+    geofen.compute_collision_alerts.cache_clear()
+    now = int(pd.Timestamp.now().timestamp())
+    # A and B head for each other; then B reports far to the north
+    geofen.positions.append(reports([('AIS', 'A', now, 1.2, 103.80), ('AIS', 'B', now, 1.2, 103.81)])
+                            .assign(course=[90.0, 270.0]))
+    first = geofen.put_vessel_data(1)
+    geofen.positions.append(reports([('AIS', 'B', now + 1, 1.5, 103.81)]))
+    monkeypatch.setattr(geofen, 'vessel_data_df', pd.DataFrame())
+    second = geofen.put_vessel_data(1)
+
+    alerts, stats = geofen.get_collision_alerts(first)
+    assert len(alerts) == 1 and stats['vessels'] == 2
+    assert geofen.get_collision_alerts(second)[0].empty
+    # The first version's alerts are still its own
+    assert len(geofen.get_collision_alerts(first)[0]) == 1
+    geofen.compute_collision_alerts.cache_clear()
+
+
+def test_reports_without_a_source_form_one_feed():
+    rows = reports([(None, 'A', 100, 1.0, 103.8), (None, 'A', 200, 1.1, 103.8), ('AIS', 'A', 150, 1.2, 103.8)])
+    loaded = position_store.PositionStore()
+    loaded.load(rows, 1)
+    appended = position_store.PositionStore()
+    appended.append(rows.astype({'source': 'str'}))
+    for store in (loaded, appended):
+        assert store.memory_stats()['feeds'] == 2 and store.memory_stats()['positions'] == 3
+        assert store.latest_positions()['sourcedatetime'].tolist() == [200]
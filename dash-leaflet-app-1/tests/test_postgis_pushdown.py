@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import db
+import geofen
+import setup_db
+from synthetic import central_geofence_json, generate_tracks
+from test_geofence_pushdown import ZONES
+
+
+# vessel_tracks set up by setup_db.py, with PostGIS, holding the last 30 minutes of two
+# sources plus a vessel with a single report where zones 1 and 2 overlap
+@pytest.fixture
+def postgis_tracks(pg_tracks, monkeypatch):
+    tracks = generate_tracks(40, 180, 2, seed=3)
+    single = tracks.iloc[[0]].assign(vesselname='SINGLE', sourcedatetime=tracks['sourcedatetime'].max(),
+                                     latitude=1.3, longitude=103.85)
+    pg_tracks(pd.concat([tracks, single], ignore_index=True))
+    setup_db.main()
+    if not db.has_postgis():
+        pytest.skip("PostGIS is not installed on the test database")
+
+    # An empty store, so the window is loaded from the test schema
+    monkeypatch.setattr(geofen, 'vessel_data_df', pd.DataFrame())
+    monkeypatch.setattr(geofen, 'vessel_data_watermark', None)
+    monkeypatch.setattr(geofen, 'vessel_data_hours', None)
+    geofen.compute_filtered_view.cache_clear()
+    geofen.update_vessel_data_incremental(1)
+    yield geofen.put_vessel_data(1)
+    geofen.compute_filtered_view.cache_clear()
+
+
+# Vessel count and table rows (without the index column) the geofence callback shows
+def geofence_table(token, geofence_json, sources, pushdown, monkeypatch):
+    monkeypatch.setattr(geofen, 'GEOFENCE_PUSHDOWN', pushdown)
+    geofen.compute_filtered_view.cache_clear()
+    count, details = geofen.filter_vessels_within_geofence(geofence_json, sources, token)
+    rows = details.children[1].children[1].children
+    return count, sorted([cell.children for cell in row.children[1:]] for row in rows)
+
+
+@pytest.mark.parametrize('geofence_json', [central_geofence_json(), json.dumps(ZONES)])
+@pytest.mark.parametrize('sources', [[], ['AIS']])
+def test_pushdown_query_matches_in_process_filter(postgis_tracks, geofence_json, sources, monkeypatch):
+    token = postgis_tracks
+    sources_key = tuple(sorted(sources))
+
+    monkeypatch.setattr(geofen, 'GEOFENCE_PUSHDOWN', False)
+    geofen.compute_filtered_view.cache_clear()
+    expected = geofen.get_filtered_view(token, geofence_json, sources)
+    pushed_down = geofen.fetch_vessels_in_geofence(1, geofence_json, sources_key)
+    assert pushed_down is not None
+    assert set(pushed_down['vesselname']) == set(expected['vesselname'])
+    assert len(pushed_down) == len(expected)
+
+    merged = expected.merge(pushed_down, on=geofen.TRACK_KEY_COLUMNS, suffixes=('', '_pushed'))
+    assert len(merged) == len(expected)
+    for column in ('speed', 'course'):
+        np.testing.assert_allclose(merged[column + '_pushed'].to_numpy(dtype=float), merged[column].to_numpy(dtype=float),
+                                   rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=column)
+
+    # The geofence callback shows the same vessels and latest rows either way
+    assert geofence_table(token, geofence_json, sources, True, monkeypatch) == \
+        geofence_table(token, geofence_json, sources, False, monkeypatch)
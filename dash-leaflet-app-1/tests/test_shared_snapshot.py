@@ -0,0 +1,170 @@
+import mmap
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_store
+import geofen
+import position_store
+import shared_snapshot
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'vessel_snapshot.bin')
+
+
+# A window of reports as the store holds it, with missing strings and a datetime column
+def window(start=1792108800, rows=50):
+    seconds = start + np.arange(rows, dtype=np.int64) * 10
+    df = pd.DataFrame({
+        'source': np.array(['AIS', 'SAT', None, 'AIS', 'AIS'] * (rows // 5), dtype=object),
+        'vesselname': [f'VESSEL {i % 7}' for i in range(rows)],
+        'sourcedatetime': seconds,
+        'latitude': np.linspace(1.2, 1.3, rows),
+        'longitude': np.linspace(103.8, 103.9, rows),
+        'speed': np.full(rows, 10.0),
+        'course': np.full(rows, 90.0),
+    })
+    df['timestamp'] = pd.to_datetime(df['sourcedatetime'], unit='s')
+    return df
+
+
+# The object a NumPy array's memory ultimately belongs to
+def owner(values):
+    while isinstance(values, np.ndarray) and values.base is not None:
+        values = values.base
+    return values.obj if isinstance(values, memoryview) else values
+
+
+def test_publish_and_read_round_trip(path):
+    producer, reader = shared_snapshot.SharedSnapshot(path), shared_snapshot.SharedSnapshot(path)
+    assert reader.read() == (None, None, None)
+
+    df = window()
+    assert producer.publish(df, {'hours': 2}) == 1
+    seq, meta, read = reader.read()
+    assert seq == 1 and meta == {'hours': 2}
+    pd.testing.assert_frame_equal(read, df)
+
+
+def test_numeric_columns_are_views_of_the_mapping(path):
+    producer, reader = shared_snapshot.SharedSnapshot(path), shared_snapshot.SharedSnapshot(path)
+    producer.publish(window(), {'hours': 1})
+    _, _, df = reader.read()
+    for column in ('sourcedatetime', 'latitude', 'longitude', 'speed', 'timestamp'):
+        assert isinstance(owner(df[column].to_numpy()), mmap.mmap), column
+    assert np.shares_memory(df['latitude'].to_numpy(), df['latitude'].to_numpy()[1:])
+
+    # Writes stay in this process: the mapping is copy-on-write
+    df.loc[0, 'latitude'] = 50.0
+    _, _, fresh = shared_snapshot.SharedSnapshot(path).read()
+    assert fresh.loc[0, 'latitude'] == 1.2
+
+
+def test_seq_increments_and_unchanged_files_return_the_same_frame(path):
+    producer, reader = shared_snapshot.SharedSnapshot(path), shared_snapshot.SharedSnapshot(path)
+    producer.publish(window(), {'hours': 1})
+    first = reader.read()
+    assert reader.read()[2] is first[2]
+
+    assert producer.publish(window(start=1792108900), {'hours': 1}) == 2
+    seq, _, df = reader.read()
+    assert seq == 2 and df is not first[2]
+    # The old version stays readable after the new file was renamed over it
+    assert first[2]['sourcedatetime'].iloc[0] == 1792108800
+    assert df['sourcedatetime'].iloc[0] == 1792108900
+
+
+@pytest.mark.skipif(shared_snapshot.fcntl is None, reason="flock is not available")
+def test_one_producer_at_a_time(path):
+    first, second = shared_snapshot.SharedSnapshot(path), shared_snapshot.SharedSnapshot(path)
+    assert first.try_acquire_producer() and first.is_producer
+    assert first.try_acquire_producer()
+    assert not second.try_acquire_producer() and not second.is_producer
+
+    first.release_producer()
+    assert not first.is_producer
+    assert second.try_acquire_producer()
+    assert not first.try_acquire_producer()
+    second.release_producer()
+
+
+def test_requests_from_workers_expire(path, monkeypatch):
+    producer = shared_snapshot.SharedSnapshot(path)
+    for pid, hours in ((101, 3), (102, 6)):
+        monkeypatch.setattr(os, 'getpid', lambda pid=pid: pid)
+        shared_snapshot.SharedSnapshot(path).request(hours)
+    assert sorted(producer.requests(60)) == [3, 6]
+
+    # A worker that stopped asking is forgotten, and its file removed
+    stale = time.time() - 120
+    os.utime(f"{path}.request.101", (stale, stale))
+    assert producer.requests(60) == [6]
+    assert not os.path.exists(f"{path}.request.101")
+
+
+def test_worker_appends_only_new_rows_of_a_snapshot_with_the_same_range(path, monkeypatch):
+    producer = shared_snapshot.SharedSnapshot(path)
+    monkeypatch.setattr(geofen, 'vessel_snapshot', shared_snapshot.SharedSnapshot(path))
+    monkeypatch.setattr(geofen, 'positions', position_store.PositionStore())
+    recorded = []
+    monkeypatch.setattr(geofen, 'record_zone_events', lambda rows: recorded.append(len(rows)))
+    monkeypatch.setattr(geofen, 'vessel_store', data_store.DataStore())
+    monkeypatch.setattr(geofen, 'vessel_data_df', pd.DataFrame())
+    monkeypatch.setattr(geofen, 'vessel_data_watermark', None)
+    monkeypatch.setattr(geofen, 'vessel_data_hours', None)
+    now = int(time.time())
+    df = window(start=now - 600, rows=50)
+
+    producer.publish(df.iloc[:40], {'hours': 1})
+    assert geofen.use_vessel_snapshot(1)
+    assert geofen.positions.memory_stats()['positions'] == 40 and recorded == [40]
+    assert not geofen.use_vessel_snapshot(2)  # Longer than the snapshot holds
+
+    # A new version of the same range: no full reload, just the rows past the watermark
+    def reload(*args):
+        raise AssertionError("full reload")
+
+    monkeypatch.setattr(geofen.positions, 'load', reload)
+    producer.publish(df, {'hours': 1})
+    assert geofen.use_vessel_snapshot(1)
+    assert geofen.positions.memory_stats()['positions'] == 50
+    assert recorded == [40, 11]  # The watermark second is handed over again; the engine skips it
+    latest = geofen.positions.latest_positions().set_index('vesselname')
+    assert latest['sourcedatetime'].max() == df['sourcedatetime'].max()
+
+
+@pytest.mark.skipif(shared_snapshot.fcntl is None, reason="flock is not available")
+def test_longer_ranges_are_asked_of_the_producer(path, monkeypatch):
+    producer = shared_snapshot.SharedSnapshot(path)
+    assert producer.try_acquire_producer()
+    monkeypatch.setattr(geofen, 'vessel_snapshot', shared_snapshot.SharedSnapshot(path))
+    monkeypatch.setattr(geofen, 'window_requests', {})
+    monkeypatch.setattr(geofen, 'snapshot_waits', {})
+    monkeypatch.setattr(geofen, 'vessel_data_df', pd.DataFrame())
+    monkeypatch.setattr(geofen, 'vessel_data_hours', None)
+    fetched = []
+    monkeypatch.setattr(geofen, 'update_vessel_data_incremental', fetched.append)
+    producer.publish(window(start=int(time.time()) - 600), {'hours': 1})
+
+    # This worker needs 3 hours: it leaves the request and waits rather than querying the database
+    assert geofen.fetch_and_store_vessel_data(0, 3, None) is geofen.dash.no_update
+    assert producer.requests(60) == [3] and fetched == []
+
+    # The producer's time range now covers it, and its ingest feed sees a pending change
+    monkeypatch.setattr(geofen, 'vessel_snapshot', producer)
+    monkeypatch.setattr(geofen, 'vessel_data_hours', 1)
+    assert geofen.current_window() == 3 and geofen.window_changed()
+
+    # A producer that doesn't publish it in time: the worker fetches the range itself
+    monkeypatch.setattr(geofen, 'vessel_snapshot', shared_snapshot.SharedSnapshot(path))
+    monkeypatch.setattr(geofen, 'SNAPSHOT_WAIT_SECONDS', 0)
+    monkeypatch.setattr(geofen, 'put_vessel_data', lambda hours: 'token')
+    time.sleep(0.01)
+    assert geofen.fetch_and_store_vessel_data(1, 3, None) == 'token'
+    assert fetched == [3]
+    producer.release_producer()
@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+import pytest
+
+import simplify
+from simplify import METERS_PER_DEGREE
+from synthetic import generate_tracks
+
+
+# Distance in meters from point p to the segment a-b, projected around a like douglas_peucker_mask
+def segment_distance(a, b, p):
+    scale = math.cos(math.radians(a[0])) * METERS_PER_DEGREE
+    ax, ay = a[1] * scale, a[0] * METERS_PER_DEGREE
+    bx, by = b[1] * scale, b[0] * METERS_PER_DEGREE
+    px, py = p[1] * scale, p[0] * METERS_PER_DEGREE
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    t = min(max(((px - ax) * dx + (py - ay) * dy) / length_sq, 0), 1) if length_sq > 0 else 0
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+# Textbook recursive Douglas-Peucker over one track of (lat, lon) points; returns kept indices
+def reference_douglas_peucker(points, tolerance_m, start=0, stop=None):
+    stop = len(points) - 1 if stop is None else stop
+    kept = {start, stop}
+    if stop - start > 1:
+        distances = [segment_distance(points[start], points[stop], points[i]) for i in range(start + 1, stop)]
+        farthest = start + 1 + int(np.argmax(distances))
+        if distances[farthest - start - 1] > tolerance_m:
+            kept |= reference_douglas_peucker(points, tolerance_m, start, farthest)
+            kept |= reference_douglas_peucker(points, tolerance_m, farthest, stop)
+    return kept
+
+
+# Synthetic tracks sorted by vessel then time, as the apps pass them in
+def sorted_tracks(vessels=20, points=150, seed=0):
+    tracks = generate_tracks(vessels, points, seed=seed).sort_values(['vesselname', 'sourcedatetime'])
+    return (tracks['vesselname'].to_numpy(), tracks['sourcedatetime'].to_numpy(),
+            tracks['latitude'].to_numpy(), tracks['longitude'].to_numpy())
+
+
+@pytest.mark.parametrize('tolerance_m', [5.0, 50.0, 500.0])
+def test_douglas_peucker_matches_recursive_reference(tolerance_m):
+    names, _, lat, lon = sorted_tracks()
+    keep = simplify.douglas_peucker_mask(names, lat, lon, tolerance_m)
+
+    expected = np.zeros(len(names), dtype=bool)
+    offsets = list(simplify.group_offsets(names)) + [len(names)]
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        points = list(zip(lat[start:end], lon[start:end]))
+        expected[[start + i for i in reference_douglas_peucker(points, tolerance_m)]] = True
+    np.testing.assert_array_equal(keep, expected)
+
+
+def test_decimation_matches_per_point_loop():
+    names, seconds, lat, lon = sorted_tracks(seed=1)
+    keep = simplify.decimate_mask(names, seconds, lat, lon, min_seconds=60, min_meters=200)
+
+    # A point is kept when it starts a vessel, or when both its time bucket and its grid
+    # cell differ from the previous point's; the last point of every vessel is always kept
+    expected = np.zeros(len(names), dtype=bool)
+    for i in range(len(names)):
+        first = i == 0 or names[i] != names[i - 1]
+        last = i == len(names) - 1 or names[i] != names[i + 1]
+        if first or last:
+            expected[i] = True
+            continue
+        new_bucket = seconds[i] // 60 != seconds[i - 1] // 60
+        cell = (math.floor(lat[i] * METERS_PER_DEGREE / 200),
+                math.floor(lon[i] * METERS_PER_DEGREE * math.cos(math.radians(lat[i])) / 200))
+        previous_cell = (math.floor(lat[i - 1] * METERS_PER_DEGREE / 200),
+                         math.floor(lon[i - 1] * METERS_PER_DEGREE * math.cos(math.radians(lat[i - 1])) / 200))
+        expected[i] = new_bucket and cell != previous_cell
+    np.testing.assert_array_equal(keep, expected)
+
+
+def test_simplify_tracks_keeps_track_ends_and_reports_stats():
+    names, seconds, lat, lon = sorted_tracks(seed=2)
+    keep, stats = simplify.simplify_tracks(names, seconds, lat, lon, zoom=11)
+    offsets = simplify.group_offsets(names)
+    ends = np.append(offsets[1:], len(names)) - 1
+    assert keep[offsets].all() and keep[ends].all()
+    assert stats['points_in'] == len(names)
+    assert stats['points_out'] == keep.sum() < len(names)
+    assert stats['reduction'] == pytest.approx(1 - keep.sum() / len(names))
+
+
+def test_disabled_config_keeps_every_point():
+    names, seconds, lat, lon = sorted_tracks(vessels=3, points=20)
+    keep, stats = simplify.simplify_tracks(names, seconds, lat, lon, zoom=11, config={'enabled': False})
+    assert keep.all() and stats['reduction'] == 0
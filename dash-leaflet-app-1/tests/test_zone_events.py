@@ -0,0 +1,91 @@
+import pandas as pd
+
+import geofence_filter
+import zone_events
+
+# Zone 1 spans longitudes 103.80-103.90, zone 2 103.85-103.95, both at latitudes 1.2-1.3
+ZONES = {
+    '1': [[1.2, 103.80], [1.2, 103.90], [1.3, 103.90], [1.3, 103.80], [1.2, 103.80]],
+    '2': [[1.2, 103.85], [1.2, 103.95], [1.3, 103.95], [1.3, 103.85], [1.2, 103.85]],
+}
+INDEX = geofence_filter.ZoneIndex(ZONES)
+
+
+# Reports along latitude 1.25 as (source, vessel, seconds, longitude)
+def rows(*reports):
+    return pd.DataFrame([(source, vessel, seconds, 1.25, lon) for source, vessel, seconds, lon in reports],
+                        columns=['source', 'vesselname', 'sourcedatetime', 'latitude', 'longitude'])
+
+
+def summary(engine):
+    return [(event['time'], event['vesselname'], event['zone_id'], event['event'])
+            for event in reversed(engine.events())]
+
+
+def test_enter_and_exit_sequence():
+    engine = zone_events.ZoneEventEngine()
+    # First position only sets the state; then east through both zones and out again
+    assert engine.process(rows(('AIS', 'A', 0, 103.70)), 1, INDEX) == 0
+    engine.process(rows(('AIS', 'A', 10, 103.82), ('AIS', 'A', 20, 103.87)), 1, INDEX)
+    engine.process(rows(('AIS', 'A', 30, 103.92), ('AIS', 'A', 40, 104.00)), 1, INDEX)
+    assert summary(engine) == [(10, 'A', '1', 'enter'), (20, 'A', '2', 'enter'), (30, 'A', '1', 'exit'),
+                               (40, 'A', '2', 'exit')]
+    assert engine.total_events == 4
+    assert engine.events(limit=1, zone_ids=['1'])[0]['time'] == 30
+
+
+def test_re_read_and_reloaded_rows_are_not_processed_twice():
+    engine = zone_events.ZoneEventEngine()
+    window = rows(('AIS', 'A', 0, 103.70), ('AIS', 'A', 10, 103.82))
+    assert engine.process(window, 1, INDEX) == 1
+    # The whole window again, as a reload or snapshot adoption hands it over, plus one new row
+    assert engine.process(pd.concat([window, rows(('AIS', 'A', 20, 103.70))]), 1, INDEX) == 1
+    assert engine.process(window, 1, INDEX) == 0
+    assert summary(engine) == [(10, 'A', '1', 'enter'), (20, 'A', '1', 'exit')]
+
+
+def test_rows_before_the_watermark_are_skipped():
+    engine = zone_events.ZoneEventEngine()
+    engine.process(rows(('AIS', 'A', 100, 103.70), ('AIS', 'B', 100, 103.70)), 1, INDEX)
+    # A late row of B older than the newest processed second is not looked at
+    assert engine.process(rows(('AIS', 'B', 50, 103.82)), 1, INDEX) == 0
+    # A new feed's report at the watermark second still is: it sets the state the exit comes from
+    assert engine.process(rows(('SAT', 'B', 100, 103.82), ('SAT', 'B', 110, 103.70)), 1, INDEX) == 1
+    assert summary(engine) == [(110, 'B', '1', 'exit')]
+
+
+def test_sources_of_one_vessel_do_not_flap_it():
+    engine = zone_events.ZoneEventEngine()
+    # Two sources report the same vessel on either side of zone 1's western edge
+    engine.process(rows(('AIS', 'A', 0, 103.801), ('RADAR', 'A', 0, 103.799)), 1, INDEX)
+    engine.process(rows(('AIS', 'A', 10, 103.801), ('RADAR', 'A', 11, 103.799),
+                        ('AIS', 'A', 20, 103.801), ('RADAR', 'A', 21, 103.799)), 1, INDEX)
+    assert engine.events() == []
+    engine.process(rows(('RADAR', 'A', 30, 103.81)), 1, INDEX)
+    assert [(event['source'], event['event']) for event in engine.events()] == [('RADAR', 'enter')]
+
+
+def test_event_log_is_bounded():
+    engine = zone_events.ZoneEventEngine(max_events=5)
+    engine.process(rows(*[('AIS', 'A', t, 103.82 if t % 2 else 103.70) for t in range(12)]), 1, INDEX)
+    assert engine.total_events == 11
+    assert [event['time'] for event in engine.events()] == [11, 10, 9, 8, 7]
+
+
+def test_state_resets_when_the_zones_change():
+    engine = zone_events.ZoneEventEngine()
+    engine.process(rows(('AIS', 'A', 0, 103.82)), 1, INDEX)
+    # New zones: the next position only sets the state against them, even though it is inside
+    moved_zones = geofence_filter.ZoneIndex({'3': ZONES['1']})
+    assert engine.process(rows(('AIS', 'A', 10, 103.83)), 2, moved_zones) == 0
+    assert engine.process(rows(('AIS', 'A', 20, 103.70)), 2, moved_zones) == 1
+    assert summary(engine) == [(20, 'A', '3', 'exit')]
+
+
+def test_forgotten_feeds_start_over():
+    engine = zone_events.ZoneEventEngine()
+    engine.process(rows(('AIS', 'A', 0, 103.82), ('AIS', 'B', 100, 103.70)), 1, INDEX)
+    engine.forget_before(50)
+    # A came back outside the zone: no exit, since its old state was forgotten
+    assert engine.process(rows(('AIS', 'A', 200, 103.70)), 1, INDEX) == 0
+    assert engine.process(rows(('AIS', 'B', 210, 103.82)), 1, INDEX) == 1
@@ -0,0 +1,115 @@
+import types
+
+import pandas as pd
+import pytest
+
+import data_store
+import geofen
+import position_store
+import zones
+from fixture_db import FixtureDB
+
+# Two boxes around Singapore Strait positions, as [[lat, lon], ...]
+ANCHORAGE = [[1.20, 103.80], [1.20, 103.90], [1.30, 103.90], [1.30, 103.80], [1.20, 103.80]]
+LANE = [[1.10, 103.60], [1.10, 103.70], [1.15, 103.70], [1.15, 103.60], [1.10, 103.60]]
+
+
+@pytest.fixture
+def fixture_db():
+    fixture = FixtureDB(pd.DataFrame(columns=['source', 'vesselname', 'sourcedatetime', 'latitude', 'longitude']))
+    fixture.install()
+    yield fixture
+    fixture.uninstall()
+
+
+# A ZoneStore on a clock the test moves forward
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(zones, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_save_replace_and_delete_zones(fixture_db, clock):
+    store = zones.ZoneStore()
+    assert store.all() == {}
+    lane_id = store.save('Western lane', 'tss', LANE)
+    anchorage_id = store.save('Eastern anchorage', 'anchorage', ANCHORAGE)
+    assert list(store.all()) == [anchorage_id, lane_id]  # Ordered by name
+    assert store.all()[lane_id] == {'name': 'Western lane', 'kind': 'tss', 'coordinates': LANE}
+
+    # Saving under an existing name replaces that zone
+    version = store.version
+    assert store.save('Western lane', 'other', ANCHORAGE) == lane_id
+    assert store.all()[lane_id]['kind'] == 'other' and store.version == version + 1
+
+    store.delete([anchorage_id])
+    assert list(store.all()) == [lane_id]
+    store.delete([])
+    assert list(store.all()) == [lane_id]
+
+
+def test_index_is_rebuilt_only_when_the_zones_change(fixture_db, clock):
+    store = zones.ZoneStore()
+    anchorage_id = store.save('Anchorage', 'anchorage', ANCHORAGE)
+    version, index = store.index()
+    assert store.index() == (version, index)
+    rows, zone_ids = index.tag([1.25, 1.12, 0.0], [103.85, 103.65, 0.0])
+    assert list(zip(rows, zone_ids)) == [(0, anchorage_id)]
+
+    lane_id = store.save('Lane', 'tss', LANE)
+    new_version, new_index = store.index()
+    assert new_version > version and new_index is not index
+    assert list(zip(*new_index.tag([1.12], [103.65]))) == [(0, lane_id)]
+
+
+def test_zones_saved_by_another_worker_show_up_after_the_ttl(fixture_db, clock):
+    store, other = zones.ZoneStore(ttl=60), zones.ZoneStore(ttl=60)
+    assert store.all() == {}
+    lane_id = other.save('Lane', 'tss', LANE)
+
+    clock[0] += 59
+    assert store.all() == {}
+    clock[0] += 2
+    assert list(store.all()) == [lane_id]
+
+    # Unchanged zones keep the version (and the index built for it)
+    version, index = store.index()
+    clock[0] += 61
+    assert store.index() == (version, index)
+
+
+def test_failed_loads_keep_the_previous_zones(fixture_db, clock, monkeypatch):
+    store = zones.ZoneStore(ttl=60)
+    lane_id = store.save('Lane', 'tss', LANE)
+
+    def unavailable(params):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setitem(fixture_db._handlers, 'zones_load', unavailable)
+    clock[0] += 61
+    assert list(store.all()) == [lane_id]
+
+
+def test_occupancy_follows_the_tokens_positions(fixture_db, clock, monkeypatch):
+    monkeypatch.setattr(geofen, 'zone_store', zones.ZoneStore())
+    monkeypatch.setattr(geofen, 'positions', position_store.PositionStore())
+    monkeypatch.setattr(geofen, 'vessel_store', data_store.DataStore())
+    monkeypatch.setattr(geofen, 'vessel_data_df', pd.DataFrame())
+    geofen.compute_zone_occupancy.cache_clear()
+    anchorage_id = geofen.zone_store.save('Anchorage', 'anchorage', ANCHORAGE)
+    lane_id = geofen.zone_store.save('Lane', 'tss', LANE)
+
+    def report(vessel, seconds, lat, lon):
+        return pd.DataFrame({'source': ['AIS'], 'vesselname': [vessel], 'sourcedatetime': [seconds],
+                             'latitude': [lat], 'longitude': [lon], 'speed': [10.0], 'course': [90.0]})
+
+    geofen.positions.append(pd.concat([report('A', 100, 1.25, 103.85), report('B', 100, 1.26, 103.86)]))
+    first = geofen.put_vessel_data(1)
+    geofen.positions.append(report('B', 200, 1.12, 103.65))
+    monkeypatch.setattr(geofen, 'vessel_data_df', pd.DataFrame())  # A new version of the data
+    second = geofen.put_vessel_data(1)
+
+    assert geofen.get_zone_occupancy(first) == {anchorage_id: 2}
+    assert geofen.get_zone_occupancy(second) == {anchorage_id: 1, lane_id: 1}
+    geofen.compute_zone_occupancy.cache_clear()
@@ -0,0 +1,112 @@
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+EVENT_LOG_SIZE = 1000  # Most recent enter/exit events kept
+
+
+# Enter/exit events of vessels against the saved zones, computed incrementally.
+# The engine remembers which zones each (source, vessel) feed was inside at its last
+# processed position and only tests positions newer than that, so the cost of process()
+# follows the number of new rows, not the window. Feeds are tracked separately so two
+# sources reporting a vessel slightly apart don't flap it in and out of a zone. A feed's
+# first position (or its first after the zones changed) only sets its state; events come
+# from the changes after it.
+class ZoneEventEngine:
+    def __init__(self, max_events=EVENT_LOG_SIZE):
+        self._inside = {}  # (source, vesselname) -> bool per zone of the current index
+        self._last_seen = {}  # (source, vesselname) -> sourcedatetime of its last processed position
+        self._watermark = None  # Newest sourcedatetime processed; older rows are not looked at
+        self._zones_version = None
+        self._events = deque(maxlen=max_events)
+        self.total_events = 0
+        self._lock = threading.Lock()
+
+    # Test rows (source, vesselname, sourcedatetime, latitude, longitude) against the zones of
+    # index (a geofence_filter.ZoneIndex) and log the transitions; returns how many were logged
+    def process(self, rows, zones_version, index):
+        if rows is None or rows.empty:
+            return 0
+
+        with self._lock:
+            if zones_version != self._zones_version:
+                # Different zones: states no longer line up with the index columns
+                self._inside = {}
+                self._zones_version = zones_version
+
+            # A reload hands over the whole window; only rows from the watermark second on can be new
+            if self._watermark is not None:
+                rows = rows[rows['sourcedatetime'].to_numpy() >= self._watermark]
+                if rows.empty:
+                    return 0
+            rows = rows.sort_values(['source', 'vesselname', 'sourcedatetime'], kind='stable')
+
+            # Skip positions at or before the last one processed for the feed (re-reads)
+            keys = list(zip(rows['source'], rows['vesselname']))
+            times = rows['sourcedatetime'].to_numpy()
+            last_seen = np.array([self._last_seen.get(key, -np.inf) for key in keys], dtype=float)
+            new = times > last_seen
+            if not new.any():
+                return 0
+            if not new.all():
+                rows, times = rows[new], times[new]
+                keys = [key for key, keep in zip(keys, new) if keep]
+            self._watermark = times.max() if self._watermark is None else max(self._watermark, times.max())
+
+            changes = np.flatnonzero([a != b for a, b in zip(keys[1:], keys[:-1])]) + 1
+            starts = np.concatenate(([0], changes)).astype(np.int64)
+            ends = np.append(starts[1:], len(rows)) - 1
+            for end in ends:
+                self._last_seen[keys[end]] = times[end]
+
+            zone_ids = index.zone_ids
+            if len(zone_ids) == 0:
+                return 0
+
+            # Inside/outside of every new position for every zone, in one bulk query
+            inside = np.zeros((len(rows), len(zone_ids)), dtype=bool)
+            tagged_rows, tagged_zones = index.tag(rows['latitude'].to_numpy(), rows['longitude'].to_numpy())
+            inside[tagged_rows, pd.Index(zone_ids).get_indexer(tagged_zones)] = True
+
+            # Each position's previous state: the row before it, or the feed's remembered state
+            previous = np.empty_like(inside)
+            previous[1:] = inside[:-1]
+            for start in starts:
+                state = self._inside.get(keys[start])
+                previous[start] = inside[start] if state is None else state
+            for end in ends:
+                self._inside[keys[end]] = inside[end]
+
+            event_rows, event_zones = np.nonzero(inside != previous)
+            order = np.argsort(times[event_rows], kind='stable')
+            event_rows, event_zones = event_rows[order], event_zones[order]
+            for row, zone in zip(event_rows, event_zones):
+                source, vesselname = keys[row]
+                self._events.append({
+                    'time': int(times[row]),
+                    'vesselname': vesselname,
+                    'source': source,
+                    'zone_id': zone_ids[zone],
+                    'event': 'enter' if inside[row, zone] else 'exit',
+                })
+            self.total_events += len(event_rows)
+            return len(event_rows)
+
+    # Forget feeds not seen since the cutoff epoch (they left the window)
+    def forget_before(self, cutoff):
+        with self._lock:
+            for key in [key for key, seen in self._last_seen.items() if seen < cutoff]:
+                del self._last_seen[key]
+                self._inside.pop(key, None)
+
+    # Logged events, newest first, optionally only for some zones
+    def events(self, limit=None, zone_ids=None):
+        with self._lock:
+            events = list(self._events)
+        if zone_ids:
+            zone_ids = set(zone_ids)
+            events = [event for event in events if event['zone_id'] in zone_ids]
+        events.reverse()
+        return events[:limit] if limit else events
@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+
+import db
+import geofence_filter
+
+ZONES_TTL = 60  # Seconds before zones saved by other workers are picked up
+ZONE_KINDS = ['anchorage', 'tss', 'port_limit', 'other']
+ZONE_COLORS = {'anchorage': '#2ecc71', 'tss': '#e67e22', 'port_limit': '#9b59b6', 'other': '#3388ff'}
+
+
+# Named geofences persisted in the geofence_zones table (see setup_db.py), with the
+# STRtree over them rebuilt only when the set of zones changes.
+class ZoneStore:
+    def __init__(self, ttl=ZONES_TTL):
+        self.ttl = ttl
+        self.version = 0  # Bumped whenever the zones change, for callers' caches
+        self._zones = {}  # zone id (str) -> {'name', 'kind', 'coordinates'}
+        self._index = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    # Zones keyed by id, ordered by name
+    def all(self):
+        self._ensure_loaded()
+        with self._lock:
+            return dict(self._zones)
+
+    # The ZoneIndex over every zone, with the version it was built for
+    def index(self):
+        self._ensure_loaded()
+        with self._lock:
+            if self._index is None:
+                self._index = geofence_filter.ZoneIndex(
+                    {zone_id: zone['coordinates'] for zone_id, zone in self._zones.items()})
+            return self.version, self._index
+
+    # Save coordinates ([[lat, lon], ...]) under a name, replacing a zone of the same name
+    def save(self, name, kind, coordinates):
+        query = """
+            INSERT INTO geofence_zones (name, kind, coordinates)
+            VALUES (%s, %s, %s::jsonb)
+            ON CONFLICT (name) DO UPDATE SET kind = EXCLUDED.kind, coordinates = EXCLUDED.coordinates
+            RETURNING zone_id
+        """
+        try:
+            row = db.fetch_one(query, (name, kind, json.dumps(coordinates)), name='zones_save')
+        except Exception as e:
+            print(f"Database error: {e}")
+            return None
+        self._load()
+        return str(row[0])
+
+    def delete(self, zone_ids):
+        if not zone_ids:
+            return
+        try:
+            db.fetch_all("DELETE FROM geofence_zones WHERE zone_id = ANY(%s) RETURNING zone_id",
+                         ([int(zone_id) for zone_id in zone_ids],), name='zones_delete')
+        except Exception as e:
+            print(f"Database error: {e}")
+            return
+        self._load()
+
+    def _ensure_loaded(self):
+        with self._lock:
+            fresh = self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+        if not fresh:
+            self._load()
+
+    def _load(self):
+        query = "SELECT zone_id, name, kind, coordinates FROM geofence_zones ORDER BY name"
+        try:
+            _, rows = db.fetch_all(query, name='zones_load')
+        except Exception as e:
+            # Keep serving the previous zones and retry after the TTL
+            print(f"Database error: {e}")
+            with self._lock:
+                self._loaded_at = time.monotonic()
+            return
+
+        zones = {str(zone_id): {'name': name, 'kind': kind, 'coordinates': coordinates}
+                 for zone_id, name, kind, coordinates in rows}
+        with self._lock:
+            if zones != self._zones:
+                self._zones = zones
+                self._index = None
+                self.version += 1
+            self._loaded_at = time.monotonic()